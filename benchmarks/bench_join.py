@@ -0,0 +1,80 @@
+# =========================================
+# bench_join.py — engines de junção EAN (esperado x contagem)
+# =========================================
+"""
+Compara as engines de `calculate_discrepancies` num catálogo sintético:
+
+  - merge: groupby("EAN") em string + pd.merge outer (engine antiga)
+  - codes: EAN fatorizado em códigos inteiros + np.bincount (padrão)
+
+Antes de medir, confere que as duas produzem exatamente o mesmo DataFrame,
+incluindo EANs só no esperado, só na contagem e EANs repetidos no esperado.
+
+Uso (a partir da raiz do repositório):
+    python benchmarks/bench_join.py [--skus 300000] [--reads 1000000] [--repeat 3]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+logging.disable(logging.WARNING)
+
+from utils.config import calculate_discrepancies  # noqa: E402
+
+def make_inputs(skus: int, reads: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    eans = (7890000000000 + rng.choice(10 * skus, size=skus, replace=False)).astype(str)
+    expected = pd.DataFrame({
+        "EAN": eans,
+        "ESTOQUE": rng.integers(0, 20, size=skus),
+        "REFERENCIA": rng.integers(0, skus // 10 + 1, size=skus).astype(str),
+        "DESCRICAO": "PRODUTO",
+    })
+    # 5% de EANs repetidos no esperado
+    expected = pd.concat([expected, expected.sample(frac=0.05, random_state=seed)], ignore_index=True)
+    # 90% das leituras em EANs do catálogo, 10% em EANs fora dele
+    known = rng.choice(eans, size=int(reads * 0.9))
+    unknown = (8000000000000 + rng.integers(0, skus, size=reads - len(known))).astype(str)
+    counted = pd.DataFrame({
+        "EAN": np.concatenate([known, unknown]),
+        "CONTAGEM": rng.integers(1, 3, size=reads),
+    })
+    return expected, counted
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--skus", type=int, default=300_000)
+    parser.add_argument("--reads", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    expected, counted = make_inputs(args.skus, args.reads)
+    ref = calculate_discrepancies(expected, counted, "bench", join_engine="merge")
+    new = calculate_discrepancies(expected, counted, "bench", join_engine="codes")
+    pd.testing.assert_frame_equal(ref, new)
+
+    print(f"esperado: {len(expected):,} linhas | contagem: {len(counted):,} leituras | saída: {len(new):,} linhas")
+    results = {}
+    for engine in ("merge", "codes"):
+        results[engine] = timed(
+            lambda: calculate_discrepancies(expected, counted, "bench", join_engine=engine), args.repeat
+        )
+        print(f"{engine:<6} {results[engine]:.3f}s")
+    print(f"speedup: {results['merge'] / results['codes']:.1f}x")
+
+if __name__ == "__main__":
+    main()
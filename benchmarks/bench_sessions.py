@@ -0,0 +1,214 @@
+# =========================================
+# bench_sessions.py — carga com várias sessões simultâneas
+# =========================================
+"""
+Teste de carga local do rfdash.py: N sessões simuladas (streamlit.testing, AppTest)
+rodando em paralelo no MESMO processo — como num servidor compartilhado, os caches
+(st.cache_data / st.cache_resource) são comuns a todas as sessões.
+
+Cada sessão faz o fluxo típico de uma loja:
+  1. upload    — estoque esperado (CSV) + contagem RFID (TXT) e primeiro render
+  2. filtro    — filtro rápido "Divergências"
+  3. pdf       — "Gerar e Baixar PDF" com as colunas padrão
+
+Relata vazão (sessões/s e reruns/s), latência por etapa (p50/p90/p99/máx) e
+memória do processo (RSS no início, no fim e pico).
+
+Por padrão cada sessão recebe arquivos próprios (lojas diferentes, sem acerto de
+cache); com --same-files todas usam os mesmos arquivos.
+
+Uso (a partir da raiz do repositório):
+    python benchmarks/bench_sessions.py [--sessions 8] [--concurrency 4] [--skus 5000] [--reads 20000]
+"""
+import argparse
+import logging
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+logging.disable(logging.WARNING)
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+# AppTest não envia arquivos: o script da sessão troca st.file_uploader por um que
+# devolve os arquivos sintéticos da sessão (as demais chamadas seguem intactas)
+SESSION_SCRIPT = '''
+import io, os
+import streamlit as st
+
+class _Upload(io.BytesIO):
+    def __init__(self, path):
+        super().__init__(open(path, "rb").read())
+        self.name = os.path.basename(path)
+        self.size = len(self.getvalue())
+        self.file_id = path
+
+_files = {{"estoque_esperado": {expected!r}, "contagem": {counted!r}}}
+_file_uploader = st.file_uploader
+
+def _fake_uploader(label, *args, key=None, **kwargs):
+    _file_uploader(label, *args, key=key, **kwargs)
+    path = _files.get(key)
+    return _Upload(path) if path else None
+
+st.file_uploader = _fake_uploader
+exec(compile(open({app!r}, encoding="utf-8").read(), "rfdash.py", "exec"))
+'''
+
+def make_files(workdir: str, name: str, skus: int, reads: int, seed: int) -> tuple[str, str]:
+    rng = np.random.default_rng(seed)
+    eans = (7890000000000 + rng.choice(10 * skus, size=skus, replace=False)).astype(str)
+    refs = rng.integers(0, max(skus // 20, 1), size=skus)
+    expected = pd.DataFrame({
+        "EAN": eans,
+        "Estoque": rng.integers(0, 10, size=skus),
+        "Referencia": [f"REF{r:05d}" for r in refs],
+        "Cor": rng.choice(["PRETO", "BRANCO", "AZUL", "VERDE"], size=skus),
+        "Tamanho": rng.choice(["PP", "P", "M", "G", "GG"], size=skus),
+        "Descricao": "PRODUTO TESTE",
+    })
+    expected_path = os.path.join(workdir, f"{name}_estoque.csv")
+    expected.to_csv(expected_path, index=False)
+
+    counted = pd.DataFrame({
+        "EAN": rng.choice(eans, size=reads),
+        "QTD": rng.integers(1, 3, size=reads),
+    })
+    counted_path = os.path.join(workdir, f"{name}_contagem.txt")
+    counted.to_csv(counted_path, sep=";", header=False, index=False)
+    return expected_path, counted_path
+
+def rss_mb() -> float:
+    """RSS atual do processo (Linux: /proc; fora dele, pico via getrusage)."""
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+class MemorySampler(threading.Thread):
+    """Amostra o RSS a cada `interval` segundos enquanto a carga roda."""
+    def __init__(self, interval: float = 0.2):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = rss_mb()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak = max(self.peak, rss_mb())
+
+    def stop(self) -> float:
+        self._stop_event.set()
+        self.join()
+        return max(self.peak, rss_mb())
+
+def run_session(script: str, timeout: float) -> dict:
+    timings = {}
+    at = AppTest.from_string(script, default_timeout=timeout)
+
+    t0 = time.perf_counter()
+    at.run()
+    timings["upload"] = time.perf_counter() - t0
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+
+    t0 = time.perf_counter()
+    at.radio(key="quick_filter_radio").set_value("Divergências").run()
+    timings["filtro"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    next(b for b in at.button if b.label == "Gerar e Baixar PDF").click().run()
+    timings["pdf"] = time.perf_counter() - t0
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    return timings
+
+def percentile(values: list[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else float("nan")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=8, help="total de sessões simuladas")
+    parser.add_argument("--concurrency", type=int, default=4, help="sessões rodando ao mesmo tempo")
+    parser.add_argument("--skus", type=int, default=5_000, help="linhas do estoque esperado")
+    parser.add_argument("--reads", type=int, default=20_000, help="leituras na contagem")
+    parser.add_argument("--same-files", action="store_true", help="todas as sessões com os mesmos arquivos")
+    parser.add_argument("--timeout", type=float, default=600, help="limite (s) de cada rerun")
+    args = parser.parse_args()
+
+    app = os.path.join(ROOT, "rfdash.py")
+    os.chdir(ROOT)
+    with tempfile.TemporaryDirectory(prefix="rfdash_bench_") as workdir:
+        scripts = []
+        for i in range(args.sessions):
+            seed = 0 if args.same_files else i
+            if i == 0 or not args.same_files:
+                expected, counted = make_files(workdir, f"loja{seed:03d}", args.skus, args.reads, seed)
+            scripts.append(SESSION_SCRIPT.format(expected=expected, counted=counted, app=app))
+
+        print(
+            f"sessões: {args.sessions} | simultâneas: {args.concurrency} | "
+            f"estoque: {args.skus:,} SKUs | contagem: {args.reads:,} leituras | "
+            f"arquivos {'iguais' if args.same_files else 'distintos'}"
+        )
+        rss_start = rss_mb()
+        sampler = MemorySampler()
+        sampler.start()
+        errors = []
+        results = []
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = [pool.submit(run_session, s, args.timeout) for s in scripts]
+            for fut in futures:
+                try:
+                    results.append(fut.result())
+                except Exception as exc:  # a carga segue; o erro entra no relatório
+                    errors.append(repr(exc))
+        wall = time.perf_counter() - t0
+        rss_peak = sampler.stop()
+        rss_end = rss_mb()
+
+    done = len(results)
+    reruns = sum(len(r) for r in results)
+    print(f"\nconcluídas: {done}/{args.sessions} em {wall:.2f}s "
+          f"→ {done / wall:.2f} sessões/s, {reruns / wall:.2f} reruns/s")
+    print(f"\n{'etapa':<10}{'p50':>9}{'p90':>9}{'p99':>9}{'máx':>9}")
+    for step in ("upload", "filtro", "pdf"):
+        values = [r[step] for r in results]
+        print(f"{step:<10}" + "".join(
+            f"{v:>8.2f}s" for v in (percentile(values, 50), percentile(values, 90),
+                                    percentile(values, 99), max(values, default=float("nan")))
+        ))
+    total = [sum(r.values()) for r in results]
+    print(f"{'sessão':<10}" + "".join(
+        f"{v:>8.2f}s" for v in (percentile(total, 50), percentile(total, 90),
+                                percentile(total, 99), max(total, default=float("nan")))
+    ))
+    print(f"\nmemória (RSS): início {rss_start:.0f} MB | fim {rss_end:.0f} MB | pico {rss_peak:.0f} MB "
+          f"(~{(rss_peak - rss_start) / max(args.concurrency, 1):.0f} MB por sessão simultânea)")
+    if errors:
+        print(f"\n{len(errors)} sessão(ões) com erro:")
+        for err in errors[:5]:
+            print("  ", err)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
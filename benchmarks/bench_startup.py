@@ -0,0 +1,71 @@
+# =========================================
+# bench_startup.py — tempo de partida do dashboard
+# =========================================
+"""
+Mede o custo de partida do app em processos Python novos (cold start):
+
+  - import:       `import utils.config`
+  - first_render: primeiro run do rfdash.py via streamlit.testing (AppTest)
+
+Cada cenário roda em dois modos:
+  - lazy:  estado atual (dependências pesadas carregadas sob demanda)
+  - eager: simula o comportamento antigo, importando reportlab, pyecharts,
+           plotly, st_aggrid, pyxlsb e unidecode antes de utils.config
+
+Uso (a partir da raiz do repositório):
+    python benchmarks/bench_startup.py [--repeat 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EAGER_IMPORTS = (
+    "import plotly.express, unidecode, pyxlsb, reportlab.platypus, "
+    "reportlab.lib.styles, st_aggrid, pyecharts.charts, pyecharts.options"
+)
+
+SCENARIOS = {
+    "import": "import utils.config",
+    "first_render": (
+        "from streamlit.testing.v1 import AppTest\n"
+        "at = AppTest.from_file('rfdash.py', default_timeout=120)\n"
+        "at.run()\n"
+        "assert not at.exception, at.exception"
+    ),
+}
+
+def _run_once(body: str, eager: bool) -> float:
+    prelude = (EAGER_IMPORTS + "\n") if eager else ""
+    code = (
+        "import time, logging\n"
+        "logging.disable(logging.WARNING)\n"
+        "t0 = time.perf_counter()\n"
+        f"{prelude}{body}\n"
+        "print(time.perf_counter() - t0)\n"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'cenário':<14}{'modo':<8}{'mediana (s)':>12}{'mín (s)':>10}")
+    for name, body in SCENARIOS.items():
+        medians = {}
+        for mode in ("eager", "lazy"):
+            times = [_run_once(body, eager=(mode == "eager")) for _ in range(args.repeat)]
+            medians[mode] = statistics.median(times)
+            print(f"{name:<14}{mode:<8}{medians[mode]:>12.3f}{min(times):>10.3f}")
+        gain = medians["eager"] - medians["lazy"]
+        print(f"{'':<14}{'ganho':<8}{gain:>12.3f}  ({gain / medians['eager'] * 100:.0f}%)")
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import pandas as pd
 from utils.config import *
 import streamlit.components.v1 as components
 import base64
+import os
 
 # Configurações padrão do Streamlit
 st.set_page_config(layout="wide", page_title="Análise de Divergência", page_icon="📊", initial_sidebar_state="collapsed",menu_items={'Report a bug': 'https://wa.me/5588993201518','About':'''
@@ -44,6 +45,9 @@ with st.sidebar:
     - Outras colunas opcionais (PRODUTO, REFERENCIA, DESCRICAO, COR, TAMANHO)
 
     O arquivo CSV da contagem com RFID é gerado pelo RFLOG e contém EAN e Quantidade dos produtos lidos.
+    Também é aceito o arquivo cru de leituras de EPC (SGTIN-96, em hexadecimal): os EPCs são convertidos para EAN e cada etiqueta é contada uma única vez.
+    Contagens por zona (salão, estoque, vitrine...) podem vir numa coluna ZONA/LOCAL/SETOR do arquivo ou em um arquivo por zona; a tabela ganha uma coluna de contagem por zona.
+    Os EANs dos dois arquivos são normalizados antes do cruzamento (zeros à esquerda perdidos no Excel, notação científica, GTIN-14, espaços) e o dígito verificador é conferido; o valor original aparece na coluna EAN ORIGINAL.
 
     Os arquivos CSV podem ter vírgula ou ponto e vírgula como separador, com ou sem aspas, e codificações variadas (UTF-8, Latin-1/CP1252 etc.). A aplicação detecta isso automaticamente.
     """)
@@ -60,30 +64,123 @@ with st.expander("Upload de Arquivos",expanded=True, icon='📂'):
     with col8:
         st.subheader("Arquivo de Estoque Esperado")
         uploaded_estoque_esperado = st.file_uploader(
-            "Upload do arquivo de estoque esperado (.csv, .xls, .xlsx). O arquivo **deve** conter cabeçalho descrevendo as colunas.",
-            type=['csv', 'xls', 'xlsx'],
+            "Upload do arquivo de estoque esperado (.csv, .xls, .xlsx; ou compactado .gz, .zip, .zst). O arquivo **deve** conter cabeçalho descrevendo as colunas.",
+            type=['csv', 'xls', 'xlsx', 'gz', 'zip', 'zst'],
             key="estoque_esperado",
             help="Arquivo `.csv`, `.txt`, `.xls` ou `xlsx` com dados de estoque (recomendado utilizar `.csv` separado por `,`)"
         )
+        estoque_sheet = pick_excel_sheet_ui(uploaded_estoque_esperado, key="estoque_sheet")
+        snap_estoque = None if uploaded_estoque_esperado else pick_snapshot_ui("estoque", key="snap_estoque")
 
     with col9:
         st.subheader("Arquivo de Contagem")
-        uploaded_contagem = st.file_uploader(
-            "Upload do arquivo de contagem (.csv ou .txt) extraído do **RFLog**.",
-            type=['csv', 'txt'],
-            key="contagem",
-            help="Arquivo `.txt` extraído do RFLog"
+        live_mode = st.toggle(
+            "Modo ao vivo (RFLog em crescimento)",
+            key="live_mode",
+            help="Acompanha a contagem em andamento: lê só as linhas novas do arquivo e atualiza as divergências dos EANs afetados.",
         )
+        live_ingestor = None
+        uploaded_contagem = None
+        zone_files = None
+        snap_contagem = None
+        if live_mode:
+            live_path = st.text_input(
+                "Arquivo RFLog na pasta de contagens do servidor",
+                key="live_path",
+                disabled=LIVE_DIR is None,
+                help=(
+                    f"Nome do arquivo (ou subpasta/arquivo) dentro de {LIVE_DIR}."
+                    if LIVE_DIR else "Desativado: defina RFDASH_LIVE_DIR no servidor para acompanhar um arquivo local."
+                ),
+            ).strip() or None
+            live_chunks = st.file_uploader(
+                "Ou envie os trechos novos do arquivo, em ordem",
+                type=['csv', 'txt'],
+                accept_multiple_files=True,
+                key="live_chunks",
+            )
+            live_ingestor = get_live_ingestor(live_path)
+        else:
+            uploaded_contagem = st.file_uploader(
+                "Upload do arquivo de contagem (.csv ou .txt; ou compactado .gz, .zip, .zst) extraído do **RFLog**.",
+                type=['csv', 'txt', 'gz', 'zip', 'zst'],
+                key="contagem",
+                help="Arquivo `.txt` extraído do RFLog. Uma coluna ZONA/LOCAL/SETOR no cabeçalho separa a contagem por zona."
+            )
+            if not uploaded_contagem:
+                zone_files = st.file_uploader(
+                    "Ou um arquivo por zona (salão, estoque, vitrine...): o nome do arquivo vira a zona",
+                    type=['csv', 'txt', 'gz', 'zip', 'zst'],
+                    accept_multiple_files=True,
+                    key="contagem_zonas",
+                )
+            snap_contagem = None if uploaded_contagem or zone_files else pick_snapshot_ui("contagem", key="snap_contagem")
     st.info("Após carregar o **estoque esperado**, selecione abaixo quais colunas correspondem a **EAN** e **ESTOQUE**. As demais colunas são opcionais e, se presentes, serão exibidas na tabela.")
-# Processar os uploads
-estoque_df, estoque_tipo = process_upload(uploaded_estoque_esperado, "estoque_esperado")
-contagem_df, contagem_tipo = process_upload(uploaded_contagem, "contagem")
+    analysis_file = st.file_uploader(
+        f"Ou reabra uma análise exportada ({ANALYSIS_BUNDLE_SUFFIX}), sem reenviar os arquivos nem refazer o mapeamento",
+        type=["zip"],
+        key="analise_compartilhada",
+    )
+# Processar os uploads (ao mesmo tempo: contagem num processo auxiliar, estoque aqui)
+# estoque esperado: cache compartilhado entre sessões (mesmo arquivo -> mesmo DataFrame, somente leitura)
+estoque_hash = file_content_hash(uploaded_estoque_esperado)
+estoque_df, estoque_tipo, contagem_df, contagem_tipo = parse_uploads_concurrently(
+    uploaded_estoque_esperado, estoque_hash, estoque_sheet, uploaded_contagem, zone_files
+)
+contagem_nome = uploaded_contagem.name if uploaded_contagem else None
+estoque_nome = uploaded_estoque_esperado.name if uploaded_estoque_esperado else None
+if zone_files:
+    contagem_nome = "Zonas: " + ", ".join(zone_name_from_file(f.name) for f in zone_files)
+
+# Snapshots salvos: reabertos já padronizados/consolidados (sem re-parse nem mapeamento)
+if snap_estoque:
+    estoque_df, estoque_meta = load_snapshot("estoque", snap_estoque, snapshot_scope())
+    mapping = estoque_meta["mapping"]
+    estoque_nome = estoque_meta["name"]
+if snap_contagem:
+    contagem_df, contagem_meta = load_snapshot("contagem", snap_contagem, snapshot_scope())
+    contagem_nome = contagem_meta["name"]
+
+# Análise reaberta: divergências já calculadas + manifesto (mapeamento, filtro, colunas do PDF)
+analysis_df = None
+if analysis_file is not None:
+    analysis_df, analysis_meta, analysis_new = open_analysis_upload(analysis_file)
+    if analysis_df is not None:
+        mapping = analysis_meta.get("mapping") or {}
+        contagem_nome = analysis_meta.get("contagem") or analysis_file.name
+        estoque_nome = analysis_meta.get("estoque")
+        if analysis_new:
+            if analysis_meta.get("quick_mode") in QUICK_MODES:
+                st.session_state.quick_filter_radio = analysis_meta["quick_mode"]
+            if analysis_meta.get("pdf_columns"):
+                st.session_state.pdf_cols_export = list(analysis_meta["pdf_columns"])
+        st.info(
+            f"Análise reaberta: contagem **{contagem_nome}** × estoque **{estoque_nome or '—'}** "
+            f"({analysis_meta.get('rows', len(analysis_df))} linhas, exportada em {analysis_meta.get('created', '—').replace('T', ' ')})."
+        )
+
+# Modo ao vivo: só os bytes novos (do arquivo ou dos trechos enviados) são lidos
+if live_ingestor is not None:
+    try:
+        if live_ingestor.path:
+            live_ingestor.poll()
+        for chunk in live_chunks or []:
+            if chunk.file_id not in live_ingestor.fed_ids:
+                live_ingestor.feed(chunk.getvalue())
+                live_ingestor.fed_ids.add(chunk.file_id)
+    except OSError as e:
+        st.error(f"Não foi possível ler o arquivo ao vivo: {e}")
+    if live_ingestor.counts:
+        contagem_nome = f"{os.path.basename(live_ingestor.path or 'trechos')} (ao vivo)"
+    if live_ingestor.path:
+        live_autorefresh(live_ingestor)
+
 # === Mapeamento de colunas do ESTOQUE ESPERADO ===
-if estoque_df is not None:
+if estoque_df is not None and not snap_estoque and analysis_df is None:
     with st.expander("Mapeamento de Colunas do Estoque Esperado", expanded=True):
         mapping = pick_expected_columns_ui(estoque_df)
         try:
-            estoque_df = standardize_expected_df(estoque_df, mapping)
+            estoque_df = standardize_expected_shared(estoque_df, mapping, estoque_hash, estoque_sheet)
             st.success("Mapeamento aplicado. Colunas padronizadas para 'EAN' e 'ESTOQUE'.")
         except Exception as e:
             st.error(f"Não foi possível aplicar o mapeamento: {e}")
@@ -96,40 +193,142 @@ if uploaded_estoque_esperado:
     else:
         st.error("Falha ao carregar/normalizar o arquivo de estoque esperado. Verifique o mapeamento de colunas.")
 
-if uploaded_contagem:
+if uploaded_contagem or zone_files:
     if contagem_df is not None:
         show_temporary_success("contagem_df","Arquivo de contagem carregado com sucesso!",duration=2)
     else:
         st.error("Falha ao carregar o arquivo de contagem.")
 
+# Quantidades vazias, decimais, inválidas ou fora do intervalo (ajustadas na leitura)
+show_quantity_report(
+    *(estoque_df.attrs.get(QUANTITY_REPORT_ATTR, []) if uploaded_estoque_esperado and estoque_df is not None else []),
+    *(contagem_df.attrs.get(QUANTITY_REPORT_ATTR, []) if (uploaded_contagem or zone_files) and contagem_df is not None else []),
+)
+# EANs sem zeros, em notação científica, GTIN-14, com espaços... (chave canônica do cruzamento)
+show_ean_report(
+    *(estoque_df.attrs.get(EAN_REPORT_ATTR, []) if uploaded_estoque_esperado and estoque_df is not None else []),
+    *(contagem_df.attrs.get(EAN_REPORT_ATTR, []) if (uploaded_contagem or zone_files) and contagem_df is not None else []),
+)
+# Leituras de EPC descartadas (formato inválido, não SGTIN-96) e repetidas
+show_epc_report(
+    *(contagem_df.attrs.get(EPC_REPORT_ATTR, []) if (uploaded_contagem or zone_files) and contagem_df is not None else []),
+    *([{**live_ingestor.epc_stats, "coluna": "ao vivo"}] if live_ingestor is not None and live_ingestor.epc_stats else []),
+)
+
+# Salvar snapshots dos arquivos enviados (para reabrir depois sem re-upload)
+if (uploaded_estoque_esperado and estoque_df is not None) or ((uploaded_contagem or zone_files) and contagem_df is not None):
+    with st.expander("Salvar snapshot", expanded=False, icon="💾"):
+        st.caption(
+            "Salva os dados já processados para reabrir em outra sessão sem reenviar o arquivo. "
+            f"Os snapshots ficam visíveis só para esta loja (escopo {snapshot_scope()}; use ?{SNAPSHOT_STORE_PARAM}=<código> na URL) "
+            f"e são mantidos os {SNAPSHOT_KEEP} mais recentes de cada tipo, por até {SNAPSHOT_MAX_DAYS:g} dias."
+        )
+        c_snap1, c_snap2 = st.columns(2)
+        with c_snap1:
+            if uploaded_estoque_esperado and estoque_df is not None and st.button("Salvar estoque esperado", key="save_snap_estoque", use_container_width=True):
+                save_snapshot(estoque_df, "estoque", uploaded_estoque_esperado.name, mapping=mapping, source_hash=estoque_hash)
+                st.success("Snapshot do estoque esperado salvo.")
+        with c_snap2:
+            if (uploaded_contagem or zone_files) and contagem_df is not None and st.button("Salvar contagem", key="save_snap_contagem", use_container_width=True):
+                save_snapshot(aggregate_counts(contagem_df, by_zone=True), "contagem", contagem_nome)
+                st.success("Snapshot da contagem salvo.")
+
 # Processar os arquivos carregados e realizar a análise de divergência
-if estoque_df is not None and contagem_df is not None:
+live_has_counts = live_ingestor is not None and bool(live_ingestor.counts)
+if analysis_df is not None or (estoque_df is not None and (contagem_df is not None or live_has_counts)):
     expected_df = estoque_df
-    counted_df = contagem_df
-    file_name = uploaded_contagem.name  # Nome do arquivo de contagem
-
-    # Converter a coluna 'CONTAGEM' para numérica (caso não esteja)
-    counted_df['CONTAGEM'] = pd.to_numeric(counted_df['CONTAGEM'], errors='coerce').fillna(0).astype(int)
+    file_name = contagem_nome  # Nome do arquivo de contagem
+
+    if analysis_df is not None:
+        # análise reaberta: nada a recalcular
+        discrepancies, live_totals = analysis_df, None
+        result_key = ("analise", st.session_state["_analysis_upload"][0])
+    elif live_ingestor is not None:
+        # ao vivo: recalcula tudo só quando o estoque muda; senão aplica os deltas
+        expected_key = (estoque_hash or snap_estoque, estoque_sheet, mapping.get("EAN"), mapping.get("ESTOQUE"))
+        discrepancies, live_totals = live_ingestor.discrepancies(expected_df, expected_key, file_name)
+        result_key = ("ao_vivo", expected_key, live_ingestor.version)
+    else:
+        def compute_discrepancies():
+            # quantidades já convertidas na leitura (parse_quantities); o cálculo não altera
+            # os DataFrames de entrada, que podem vir de um cache compartilhado
+            return calculate_discrepancies(expected_df, contagem_df, file_name)
+
+        # Recontagem: releitura só das peças divergentes, aplicada apenas nos EANs relidos
+        with st.expander("Recontagem", expanded=False, icon="🔁"):
+            st.caption("Envie o arquivo da releitura das PEÇAS A SEREM RELIDAS: só os EANs relidos são atualizados.")
+            recount_mode = st.radio(
+                "Como aplicar:", list(RECOUNT_MODES), format_func=RECOUNT_MODES.get,
+                horizontal=True, key="recount_mode",
+            )
+            recount_files = st.file_uploader(
+                "Arquivos de recontagem",
+                type=["csv", "txt", "gz", "zip", "zst"],
+                accept_multiple_files=True,
+                key=f"recount_files_{st.session_state.get('recount_version', 0)}",
+            )
 
-    discrepancies = calculate_discrepancies(expected_df, counted_df, file_name)
+        base_key = (
+            estoque_hash or snap_estoque, estoque_sheet, mapping.get("EAN"), mapping.get("ESTOQUE"),
+            file_content_hash(uploaded_contagem)
+            or (tuple(file_content_hash(f) for f in zone_files) if zone_files else None)
+            or snap_contagem,
+        )
+        reconciler = st.session_state.get("recount_reconciler")
+        if recount_files or (reconciler is not None and reconciler.base_key == base_key and reconciler.applied):
+            reconciler = get_recount_reconciler(base_key, compute_discrepancies)
+            for recount_file in recount_files or []:
+                recount_id = getattr(recount_file, "file_id", recount_file.name)
+                if recount_id in reconciler.applied_ids:
+                    continue
+                recount_df, _ = process_upload(recount_file, "contagem")
+                if recount_df is None:
+                    st.error(f"Falha ao carregar a recontagem {recount_file.name}.")
+                    continue
+                reconciler.apply(recount_df, recount_mode, recount_file.name)
+                reconciler.applied_ids.add(recount_id)
+
+            applied = "; ".join(
+                f"{r['nome']} ({RECOUNT_MODES[r['modo']].lower()}, {r['eans']} EANs)" for r in reconciler.applied
+            )
+            c_rec, c_undo = st.columns([4, 1])
+            c_rec.info(f"Recontagens aplicadas: {applied}")
+            if c_undo.button("Desfazer recontagens", key="recount_reset", use_container_width=True):
+                del st.session_state["recount_reconciler"]
+                st.session_state.recount_version = st.session_state.get("recount_version", 0) + 1
+                st.rerun()
+            discrepancies, live_totals = reconciler.disc, reconciler.totals
+            result_key = ("recontagem", base_key, len(reconciler.applied))
+        else:
+            discrepancies, live_totals = compute_discrepancies(), None
+            result_key = ("base", base_key)
     all_discrepancies[file_name] = discrepancies
-    show_summary(discrepancies)
+    show_summary(discrepancies, live_totals)
+    zone_table = zone_summary(discrepancies)
+    if not zone_table.empty:
+        with st.expander("Contagem por zona", expanded=True, icon="📍"):
+            st.dataframe(zone_table, hide_index=True, use_container_width=True)
     st.divider()
 
     # =========================
     # Filtro rápido mais estável
     # =========================
-    # Estado para resetar a grade quando modo mudar/limpar
+    # Estado para resetar a grade ao limpar os filtros (o modo não remonta a grade)
     if "grid_reset_version" not in st.session_state:
         st.session_state.grid_reset_version = 0
     if "quick_mode" not in st.session_state:
         st.session_state.quick_mode = "Tudo"
 
+    # Índice de facetas: posições de cada filtro rápido e valores de COR/TAMANHO etc.,
+    # calculado uma vez por resultado (result_key: hashes dos arquivos + mapeamento,
+    # versão do ao vivo/recontagem) e reaproveitado nos filtros da grade
+    facet_index = build_facet_index(discrepancies, result_key)
+
     # Contadores (ajuda na escolha)
-    tot_all   = len(discrepancies)
-    tot_div   = int((discrepancies["DIVERGÊNCIA"] != 0).sum())
-    tot_sobra = int((discrepancies["DIVERGÊNCIA"] > 0).sum())
-    tot_falta = int((discrepancies["DIVERGÊNCIA"] < 0).sum())
+    tot_all   = len(facet_index["modes"]["Tudo"])
+    tot_div   = len(facet_index["modes"]["Divergências"])
+    tot_sobra = len(facet_index["modes"]["Sobra"])
+    tot_falta = len(facet_index["modes"]["Falta"])
 
     labels = {
         "Tudo":         f"Tudo",
@@ -153,16 +352,39 @@ if estoque_df is not None and contagem_df is not None:
         key="quick_filter_radio",
     )
 
-    # Se mudou o modo, incrementa a versão para recriar a grade
-    if choice != st.session_state.quick_mode:
-        st.session_state.quick_mode = choice
-        st.session_state.grid_reset_version += 1
-
-    # Aplica filtro rápido ao DF base e monta a grade com key única
-    df_quick = apply_quick_filter(discrepancies, st.session_state.quick_mode)
-    grid_key = f"grid_{st.session_state.quick_mode}_{st.session_state.grid_reset_version}"
+    st.session_state.quick_mode = choice
+
+    # Filtro rápido no servidor; a grade detalhada recebe só essas linhas, com key
+    # estável e ids por EAN (trocar o modo não remonta a grade)
+    df_quick = apply_quick_filter(discrepancies, st.session_state.quick_mode, facet_index)
+    grid_key = f"grid_{st.session_state.grid_reset_version}"
+
+    # Modos de visualização: AgGrid completa, rápida (Arrow, automática acima do limite
+    # de linhas) e agrupada (totais por REFERENCIA > COR > TAMANHO calculados no servidor)
+    hierarchy = [c for c in mapping.get("HIERARQUIA", []) if c in discrepancies.columns]
+    view_options = ["Detalhada", "Rápida"] + (["Agrupada"] if hierarchy else [])
+    # a escolha vale enquanto o resultado fica do mesmo lado do limite; ao cruzá-lo, volta ao padrão
+    large = len(discrepancies) > FAST_VIEW_ROW_THRESHOLD
+    if st.session_state.get("_table_view_large") != large or st.session_state.get("table_view_mode") not in view_options:
+        st.session_state.table_view_mode = "Rápida" if large else "Detalhada"
+        st.session_state._table_view_large = large
+    view_mode = st.radio(
+        "Visualização:",
+        options=view_options,
+        horizontal=True,
+        key="table_view_mode",
+        help=(
+            f"Rápida: tabela somente leitura, recomendada acima de {FAST_VIEW_ROW_THRESHOLD:,} linhas.".replace(",", ".")
+            + (" Agrupada: a grade recebe só os totais do nível atual (" + " › ".join(hierarchy) + "); selecione uma linha para abrir os itens." if hierarchy else "")
+        ),
+    )
 
-    filtered_df = display_data_table(df_quick, key=grid_key)
+    if view_mode == "Agrupada":
+        filtered_df = adicionar_status_visual(display_rollup_table(df_quick, hierarchy, (result_key, st.session_state.quick_mode), key="rollup").copy())
+    elif view_mode == "Rápida":
+        filtered_df = display_fast_table(discrepancies, key="fast", facets=facet_index, mode=st.session_state.quick_mode)
+    else:
+        filtered_df = display_data_table(df_quick, key=grid_key, facets=facet_index)
 
     # ---- Botão ABAIXO da tabela para limpar filtros internos da AgGrid ----
     if st.button("Limpar filtros da tabela", key=f"clear_grid_filters_{st.session_state.grid_reset_version}"):
@@ -174,7 +396,7 @@ if estoque_df is not None and contagem_df is not None:
     # ----------------------------------------------------------------------
 
     # Atualize o session_state com o DataFrame filtrado (o que está visível)
-    st.session_state.filtered_df = filtered_df
+    remember("filtered_df", filtered_df)
 
     # Exibir métricas do resumo dinâmico (com base no que está na grade)
     if not filtered_df.empty:
@@ -232,23 +454,42 @@ if estoque_df is not None and contagem_df is not None:
         total_pecas_a_serem_relidas = 0
         accuracy_percentage = 0.0
 
-    # Gerar gráfico de pizza para acurácia
+    # Dashboard analítico (pyecharts): só é montado quando a seção está visível,
+    # e o HTML fica memoizado pelos totais (não refaz a cada interação na grade)
     st.divider()
-    dashboard_html = dynamic_dashboard(
-        total_estoque,
-        total_contagem,
-        total_divergencia_absoluta,
-        total_pecas_a_serem_relidas,
-        accuracy_percentage,
-        total_divergencia_positiva,
-        total_divergencia_negativa
-    )
-    
-    from utils.config import pick_pdf_columns_ui, generate_pdf_in_memory, generate_timestamp
+    if st.toggle("Mostrar dashboard analítico", value=False, key="show_dashboard"):
+        totals = dashboard_totals_key(
+            total_estoque,
+            total_contagem,
+            total_divergencia_absoluta,
+            total_pecas_a_serem_relidas,
+            accuracy_percentage,
+            total_divergencia_positiva,
+            total_divergencia_negativa
+        )
+        dashboard_html = dynamic_dashboard_cached(totals)
+        components.html(dashboard_html, height=1700, scrolling=True)
+
+        # Onde está a divergência: rankings no servidor, o gráfico recebe só os N pontos
+        breakdown_cols = tuple(hierarchy or suggest_hierarchy_columns(filtered_df))
+        if breakdown_cols and not filtered_df.empty:
+            st.subheader("Onde está a divergência")
+            top_n = st.slider("Grupos por gráfico", 5, 30, DIVERGENCE_TOP_N, key="breakdown_top_n")
+            rankings = divergence_rankings(filtered_df, breakdown_cols, top_n, rows_signature(result_key, filtered_df))
+            if any(points for _, _, points in rankings):
+                components.html(
+                    divergence_breakdown_html(rankings),
+                    height=sum(160 + 30 * len(points) for _, _, points in rankings if points),
+                    scrolling=True,
+                )
+            else:
+                st.caption("Sem divergências nos grupos filtrados.")
+
+    from utils.config import pick_pdf_columns_ui, generate_pdf_in_memory, generate_timestamp, build_pdf_preview_cached, render_pdf_preview
 
     with st.expander("Exportar PDF", expanded=False, icon="🖨️"):
         # É ESSENCIAL usar o mesmo DF que está na tabela:
-        df_export = st.session_state.get("filtered_df", filtered_df)
+        df_export = recall("filtered_df", filtered_df)
 
         # Agora o multiselect já vem com todas as colunas do df_export, na ordem certa
         cols_pdf = pick_pdf_columns_ui(df_export, key="pdf_cols_export")
@@ -256,7 +497,19 @@ if estoque_df is not None and contagem_df is not None:
         with st.form("pdf_form", clear_on_submit=False):
             font_size = st.number_input("Tamanho da fonte", 6, 12, 8, 1)
             orient = st.selectbox("Orientação", ["L", "P"], index=0,help="L = paisagem, P = retrato")
-            submit = st.form_submit_button("Gerar e Baixar PDF", use_container_width=True)
+            c_prev, c_full = st.columns(2)
+            with c_prev:
+                preview = st.form_submit_button(
+                    f"Pré-visualizar ({PDF_PREVIEW_PAGES} pág.)", use_container_width=True,
+                    help="Monta só o resumo e as primeiras páginas, com as mesmas larguras e estilo do PDF completo.",
+                )
+            with c_full:
+                submit = st.form_submit_button("Gerar e Baixar PDF", use_container_width=True)
+
+        if preview:
+            with st.spinner("Montando a pré-visualização..."):
+                preview_bytes = build_pdf_preview_cached(df_export, tuple(cols_pdf or []), font_size, orient)
+            render_pdf_preview(preview_bytes)
 
         if submit:
             with st.spinner("Gerando o PDF..."):
@@ -266,12 +519,52 @@ if estoque_df is not None and contagem_df is not None:
                     orientation=orient,
                     include_columns=cols_pdf,   # <- exatamente as colunas da tabela, mesma ordem
                 )
+            # fica na sessão até ficar ocioso/estourar o orçamento (ver enforce_session_budget)
+            remember("pdf_bytes", pdf_bytes)
 
+        pdf_bytes = st.session_state.get("pdf_bytes")  # sem renovar o acesso: expira se ocioso
+        if pdf_bytes:
             st.download_button(
-                "Baixar PDF",
+                "Baixar PDF" if submit else "Baixar último PDF gerado",
                 data=pdf_bytes,
                 file_name=f"relatorio_divergencia_{generate_timestamp()}.pdf",
                 mime="application/pdf",
                 use_container_width=True,
                 key="dl_pdf_export",
             )
+
+    with st.expander("Compartilhar análise", expanded=False, icon="📤"):
+        st.caption(
+            "Exporta o resultado (divergências, mapeamento, filtro rápido e colunas do PDF) num arquivo "
+            "compacto: quem recebe reabre a análise sem os arquivos originais."
+        )
+        prepared = st.button("Preparar arquivo da análise", key="prepare_analysis", use_container_width=True)
+        if prepared:
+            with st.spinner("Compactando a análise..."):
+                analysis_bundle = export_analysis_bundle(discrepancies, {
+                    "contagem": file_name,
+                    "estoque": estoque_nome,
+                    "mapping": mapping,
+                    "quick_mode": st.session_state.quick_mode,
+                    "pdf_columns": list(cols_pdf or []),
+                })
+            remember("analysis_bundle", analysis_bundle)
+        analysis_bundle = st.session_state.get("analysis_bundle")
+        if analysis_bundle:
+            st.download_button(
+                "Baixar análise" if prepared else "Baixar última análise preparada",
+                data=analysis_bundle,
+                file_name=f"analise_divergencia_{generate_timestamp()}{ANALYSIS_BUNDLE_SUFFIX}",
+                mime="application/zip",
+                use_container_width=True,
+                key="dl_analysis",
+            )
+
+# Orçamento de memória da sessão: DataFrames ociosos vão para o disco e PDFs antigos
+# são descartados; com RFDASH_ADMIN=1 (ou ?debug=1) a pegada aparece na sidebar
+session_uploads = {
+    f"upload: {f.name}": f.size
+    for f in (uploaded_estoque_esperado, uploaded_contagem, analysis_file) if f is not None
+}
+enforce_session_budget(session_uploads)
+show_memory_debug(session_uploads)
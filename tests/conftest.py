@@ -0,0 +1,8 @@
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# sem runtime do Streamlit os caches avisam a cada chamada
+logging.getLogger("streamlit").setLevel(logging.ERROR)
@@ -0,0 +1,27 @@
+import json
+
+import pandas as pd
+
+from utils.config import canonicalize_eans, ean_original_map
+
+
+def test_canonical_eans():
+    raw = pd.Series(["7891234567895", " 7891234567895", "7.891234567895E+12",
+                     "07891234567895", "7891234567895.0", "ABC 1", "7891234567890"])
+    out, report = canonicalize_eans(raw)
+    assert list(out) == ["7891234567895"] * 5 + ["ABC1", "7891234567890"]
+    assert report["invalidos"] == 1
+    assert report["linhas_afetadas"] == 6
+    assert set(json.loads(report["mapa"])["ORIGINAL"]) >= {"07891234567895", "7.891234567895E+12"}
+
+
+def test_canonical_eans_noop_keeps_values():
+    out, report = canonicalize_eans(pd.Series(["7891234567895", "7891234567895"]))
+    assert list(out) == ["7891234567895"] * 2
+    assert report["linhas_afetadas"] == 0 and report["mapa"] == ""
+
+
+def test_ean_original_map_joins_many_originals():
+    _, report = canonicalize_eans(pd.Series(["07891234567895", " 7891234567895"]))
+    originals = ean_original_map(report)["7891234567895"]
+    assert sorted(originals.split(" | ")) == [" 7891234567895", "07891234567895"]
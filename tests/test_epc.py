@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from utils.config import SeenTags, decode_sgtin96, epc_reads_to_counts, epc_tag_keys
+
+
+def _sgtin96(gtin14: str, serial: int, partition: int = 5) -> str:
+    """Codifica um GTIN-14 em EPC SGTIN-96 (hex), como um leitor gravaria."""
+    company_digits = {5: 7, 6: 6}[partition]
+    company_bits, item_bits = {5: (24, 20), 6: (20, 24)}[partition]
+    company = int(gtin14[1:1 + company_digits])
+    item = int(gtin14[0] + gtin14[1 + company_digits:13])
+    value = 0x30
+    value = (value << 3) | 1                  # filtro
+    value = (value << 3) | partition
+    value = (value << company_bits) | company
+    value = (value << item_bits) | item
+    value = (value << 38) | serial
+    return f"{value:024X}"
+
+
+def test_decode_sgtin96_to_ean13_and_gtin14():
+    epcs = pd.Series([_sgtin96("07891234567895", 1), _sgtin96("17891234567892", 2, partition=6), "XYZ"])
+    out = decode_sgtin96(epcs)
+    assert out["VALIDO"].tolist() == [True, True, False]
+    assert out["EAN"].iloc[0] == "7891234567895"
+    assert out["EAN"].iloc[1] == "17891234567892"
+
+
+def test_epc_reads_count_each_tag_once():
+    a1, a2 = _sgtin96("07891234567895", 1), _sgtin96("07891234567895", 2)
+    b1 = _sgtin96("07890000000017", 7)
+    reads = pd.Series([a1, a1, a2, b1, "nao-e-epc", a1.lower()])
+    counts, stats = epc_reads_to_counts(reads)
+    assert dict(zip(counts["EAN"], counts["CONTAGEM"])) == {"7891234567895": 2, "7890000000017": 1}
+    assert stats == {"leituras": 6, "invalidas": 1, "nao_sgtin": 0, "repetidas": 2, "tags": 3}
+
+
+def test_seen_tags_skip_tags_from_previous_chunks():
+    seen = SeenTags()
+    a1, a2 = _sgtin96("07891234567895", 1), _sgtin96("07891234567895", 2)
+    first, _ = epc_reads_to_counts(pd.Series([a1]), seen)
+    second, stats = epc_reads_to_counts(pd.Series([a1, a2]), seen)
+    assert first["CONTAGEM"].tolist() == [1]
+    assert second["CONTAGEM"].tolist() == [1]
+    assert stats["repetidas"] == 1
+    assert len(seen) == 2 and seen.nbytes == 32
+
+
+def test_tag_keys_sort_like_the_96_bits():
+    hi = np.array([2, 1, 1], dtype=np.uint64)
+    lo = np.array([0, 5, 3], dtype=np.uint64)
+    order = np.argsort(epc_tag_keys(hi, lo), kind="stable")
+    assert order.tolist() == [2, 1, 0]
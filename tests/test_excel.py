@@ -0,0 +1,63 @@
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+import pytest
+
+openpyxl = pytest.importorskip("openpyxl")
+
+from utils.config import _read_xlsx_streaming
+
+
+def _pandas(path):
+    return pd.read_excel(path, dtype=str, engine="openpyxl")
+
+
+def _assert_same(path):
+    ours, theirs = _read_xlsx_streaming(open(path, "rb")), _pandas(path)
+    assert list(ours.columns) == list(theirs.columns)
+    assert ours.shape == theirs.shape
+    assert (ours.fillna("<NA>").to_numpy() == theirs.fillna("<NA>").to_numpy()).all()
+
+
+def test_blank_rows_between_data_are_kept(tmp_path):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["EAN", "ESTOQUE", "COR"])
+    ws.append(["7891", 2, "AZUL"])
+    ws.append([None, None, None])                  # linha vazia no meio
+    ws.cell(row=4, column=1, value="7892")
+    ws.cell(row=4, column=2, value=1)
+    ws.cell(row=7, column=1, value="7893")         # linhas 5-6 ausentes do XML
+    ws.cell(row=7, column=3, value="VERDE")
+    ws.cell(row=9, column=2, value="")             # linha final só com texto vazio
+    path = tmp_path / "vazias.xlsx"
+    wb.save(path)
+
+    df = _read_xlsx_streaming(open(path, "rb"))
+    assert df["EAN"].fillna("").tolist() == ["7891", "", "7892", "", "", "7893"]
+    _assert_same(path)
+
+
+def test_mixed_cells_match_pandas(tmp_path):
+    rng = np.random.default_rng(7)
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["EAN", "ESTOQUE", "PRECO", "DATA", "ATIVO", "DESCRICAO"])
+    row = 2
+    for i in range(300):
+        if rng.random() < 0.1:
+            row += 1 + int(rng.integers(0, 3))     # 1 a 3 linhas vazias
+        ws.cell(row=row, column=1, value=f"{7890000000000 + i}")
+        ws.cell(row=row, column=2, value=int(rng.integers(-5, 50)))
+        if rng.random() < 0.7:
+            ws.cell(row=row, column=3, value=float(rng.integers(0, 10000)) / 100)
+        ws.cell(row=row, column=4, value=dt.datetime(2024, 1, 1) + dt.timedelta(days=int(rng.integers(0, 400))))
+        ws.cell(row=row, column=5, value=bool(rng.random() < 0.5))
+        if rng.random() < 0.8:
+            ws.cell(row=row, column=6, value=f"Item {i}")
+        row += 1
+    path = tmp_path / "mista.xlsx"
+    wb.save(path)
+
+    _assert_same(path)
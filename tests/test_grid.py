@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+import st_aggrid
+
+from utils.config import GRID_ROW_ID, build_facet_index, display_data_table
+
+
+@pytest.fixture
+def captured_grid(monkeypatch):
+    captured = {}
+
+    def fake_aggrid(data, gridOptions=None, **kwargs):
+        captured["data"], captured["options"] = data, gridOptions
+        return None
+
+    monkeypatch.setattr(st_aggrid, "AgGrid", fake_aggrid)
+    return captured
+
+
+def _discrepancies():
+    return pd.DataFrame({
+        "EAN": ["7891", "7891", "7892"],
+        "COR": ["AZUL", None, "VERDE"],
+        "ESTOQUE": [1, 1, 2],
+        "CONTAGEM": [1, 1, 0],
+        "DIVERGÊNCIA": [0, 0, -2],
+        "PEÇAS A SEREM RELIDAS": [0, 0, 2],
+    })
+
+
+def test_row_id_is_sent_but_not_a_column(captured_grid):
+    df = _discrepancies()
+    visible = display_data_table(df, key="grid", facets=build_facet_index(df, ("teste", 1)))
+
+    fields = [c.get("field") for c in captured_grid["options"]["columnDefs"]]
+    assert GRID_ROW_ID not in fields
+    assert "STATUS" in fields
+    assert captured_grid["data"][GRID_ROW_ID].tolist() == ["7891", "7891#1", "7892"]
+    assert GRID_ROW_ID not in visible.columns
+    assert len(visible) == len(df)
+
+
+def test_empty_facet_value_matches_null_cells(captured_grid):
+    df = _discrepancies()
+    display_data_table(df, key="grid", facets=build_facet_index(df, ("teste", 2)))
+
+    cor = next(c for c in captured_grid["options"]["columnDefs"] if c.get("field") == "COR")
+    assert cor["filterParams"]["values"] == [None, "AZUL", "VERDE"]
+
+
+def test_facet_index_is_keyed_by_result_not_by_frame():
+    df = _discrepancies()
+    assert build_facet_index(df, ("teste", 3))["n"] == 3
+    # mesma chave: o DF não é hasheado, o índice vem do cache
+    assert build_facet_index(df.iloc[:1], ("teste", 3))["n"] == 3
+    assert build_facet_index(df.iloc[:1], ("teste", 4))["n"] == 1
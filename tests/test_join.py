@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from utils.config import JOIN_ENGINES
+
+
+def _frames():
+    expected = pd.DataFrame({
+        "EAN": ["0000000000017", "7891000000001", "7891000000001", "7892000000002"],
+        "ESTOQUE": [1, 2, 3, 4],
+    })
+    counted = pd.DataFrame({
+        "EAN": ["7892000000002", "7891000000001", "7899999999999", "7892000000002", "0000000000017"],
+        "CONTAGEM": [1, 5, 2, 2, 0],
+    })
+    return expected, counted
+
+
+def test_codes_engine_matches_merge():
+    expected, counted = _frames()
+    ref = JOIN_ENGINES["merge"](expected, counted).sort_values("EAN", kind="stable").reset_index(drop=True)
+    out = JOIN_ENGINES["codes"](expected, counted)
+    assert list(out["EAN"]) == list(ref["EAN"])
+    assert (out["CONTAGEM"].to_numpy() == ref["CONTAGEM"].fillna(0).to_numpy()).all()
+    assert out["ESTOQUE"].fillna(-1).tolist() == ref["ESTOQUE"].fillna(-1).tolist()
+
+
+def test_codes_engine_adds_counted_only_eans():
+    expected, counted = _frames()
+    out = JOIN_ENGINES["codes"](expected, counted)
+    extra = out[out["EAN"] == "7899999999999"]
+    assert len(extra) == 1
+    assert extra["CONTAGEM"].iloc[0] == 2
+    assert np.isnan(extra["ESTOQUE"].iloc[0])
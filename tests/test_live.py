@@ -0,0 +1,53 @@
+import pandas as pd
+
+from utils.config import (
+    EAN_ORIGINAL_COLUMN, LiveCountIngestor, RecountReconciler, calculate_discrepancies,
+    summary_totals, zone_columns,
+)
+
+EXPECTED = pd.DataFrame({
+    "EAN": ["7891000000001", "7891000000002"],
+    "ESTOQUE": [2, 1],
+    "COR": ["AZUL", "VERDE"],
+})
+
+
+def test_live_delta_rows_get_the_read_code():
+    ing = LiveCountIngestor()
+    ing.feed(b"7891000000001;1\n")
+    ing.discrepancies(EXPECTED, "k", "ao vivo")
+
+    ing.feed(b"7.891000000003E+12;2\n7891000000001;1\n")
+    disc, totals = ing.discrepancies(EXPECTED, "k", "ao vivo")
+
+    new = disc[disc["EAN"] == "7891000000003"].iloc[0]
+    assert new[EAN_ORIGINAL_COLUMN] == "7.891000000003E+12"
+    assert new["CONTAGEM"] == 2 and new["ESTOQUE"] == 0
+    assert disc[EAN_ORIGINAL_COLUMN].notna().all()
+    assert totals == summary_totals(disc)
+
+
+def test_live_zone_columns_add_up_to_the_count():
+    ing = LiveCountIngestor()
+    ing.feed(b"EAN;QTD;ZONA\n7891000000001;1;SALAO\n7891000000002;2;ESTOQUE\n7891000000001;1;ESTOQUE\n")
+    ing.discrepancies(EXPECTED, "k", "ao vivo")
+    ing.feed(b"7891000000001;1;VITRINE\n7891000000009;3;SALAO\n")
+    disc, _ = ing.discrepancies(EXPECTED, "k", "ao vivo")
+
+    cols = zone_columns(disc)
+    assert "CONTAGEM VITRINE" in cols
+    assert (disc[cols].sum(axis=1) == disc["CONTAGEM"]).all()
+
+
+def test_recount_without_zones_keeps_zone_totals():
+    counted = pd.DataFrame({
+        "EAN": ["7891000000001", "7891000000001", "7891000000002"],
+        "ZONA": ["SALAO", "ESTOQUE", "SALAO"],
+        "CONTAGEM": [1, 2, 1],
+    })
+    rec = RecountReconciler("base", calculate_discrepancies(EXPECTED, counted, "contagem"))
+    rec.apply(pd.DataFrame({"EAN": ["7891000000001", "7891000000005"], "CONTAGEM": [5, 1]}), "replace")
+
+    cols = zone_columns(rec.disc)
+    assert (rec.disc[cols].sum(axis=1) == rec.disc["CONTAGEM"]).all()
+    assert rec.totals == summary_totals(rec.disc)
@@ -0,0 +1,25 @@
+import pandas as pd
+
+from utils.config import parse_quantities
+
+
+def test_quantities_br_format():
+    values, report = parse_quantities(pd.Series(["1.234", "1.234,00", "2,5", " 12 ", "+3", "abc", None]))
+    assert values.tolist() == [1234, 1234, 3, 12, 3, 0, 0]
+    assert report["formato"] == "br"
+    motivos = {v["VALOR"]: v["MOTIVO"] for v in report["valores"]}
+    assert motivos["abc"] == "inválido"
+    assert motivos["2,5"] == "decimal arredondado"
+
+
+def test_quantities_intl_format_detected_from_column():
+    values, report = parse_quantities(pd.Series(["1,234.50", "2.5", "7"]))
+    assert report["formato"] == "intl"
+    assert values.tolist() == [1235, 3, 7]
+
+
+def test_quantities_report_first_line():
+    _, report = parse_quantities(pd.Series(["1", "x", "x"]), column="QTD", first_line=2)
+    (entry,) = report["valores"]
+    assert entry["OCORRÊNCIAS"] == 2 and entry["PRIMEIRA LINHA"] == 3
+    assert report["coluna"] == "QTD" and report["linhas_afetadas"] == 2
@@ -0,0 +1,49 @@
+import io
+
+import pandas as pd
+import pytest
+import streamlit as st
+
+import utils.config as config
+from utils.config import SpilledFrame, parse_uploads_concurrently, recall, remember
+
+
+class Upload(io.BytesIO):
+    def __init__(self, data: bytes, name: str, file_id: str):
+        super().__init__(data)
+        self.name, self.file_id, self.size = name, file_id, len(data)
+
+
+@pytest.fixture(autouse=True)
+def clean_session(monkeypatch):
+    st.session_state.clear()
+    monkeypatch.setattr(config, "get_upload_pool", lambda: None)
+    yield
+    st.session_state.clear()
+
+
+def test_recall_of_lost_spill_is_a_miss(tmp_path):
+    st.session_state["frame"] = SpilledFrame(str(tmp_path / "perdido.arrow"), rows=3, nbytes=100)
+    st.session_state["_mem_access"] = {"frame": 0.0}
+
+    assert recall("frame") is None
+    assert "frame" not in st.session_state
+    assert "frame" not in st.session_state["_mem_access"]
+
+
+def test_recall_keeps_values_in_memory():
+    remember("frame", pd.DataFrame({"EAN": ["1"]}))
+    assert recall("frame")["EAN"].tolist() == ["1"]
+
+
+def test_count_upload_is_parsed_again_when_spill_is_lost(tmp_path):
+    upload = Upload(b"7891000000001;2\n7891000000002;1\n", "contagem.txt", "f1")
+    _, _, first, _ = parse_uploads_concurrently(None, None, None, upload)
+    assert first["CONTAGEM"].sum() == 3
+
+    st.session_state["_contagem_df"] = SpilledFrame(str(tmp_path / "perdido.arrow"), rows=2, nbytes=100)
+    _, _, again, tipo = parse_uploads_concurrently(None, None, None, upload)
+
+    assert again is not None and tipo is not None
+    assert again["CONTAGEM"].sum() == 3
+    assert st.session_state["_contagem_upload"][0] == "f1"
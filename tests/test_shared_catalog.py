@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from utils.config import SharedCatalogCache
+
+
+def _cache():
+    return SharedCatalogCache(max_bytes=10 * 1024 * 1024, ref_ttl=60)
+
+
+def _wait_for_loader(cache, key):
+    deadline = time.time() + 5
+    while key not in cache._loading and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_loader_exception_releases_the_key():
+    cache = _cache()
+
+    def broken():
+        raise ValueError("arquivo ruim")
+
+    with pytest.raises(ValueError):
+        cache.acquire("k", "s1", "estoque_raw", broken)
+    assert cache._loading == {}
+
+    df = pd.DataFrame({"EAN": ["1"]})
+    assert cache.acquire("k", "s1", "estoque_raw", lambda: (df, "ok"))[0] is df
+    assert cache.stats()["entries"] == 1
+
+
+def _concurrent(loader_result):
+    """s1 carrega (devagar); s2 pede a mesma chave no meio da carga."""
+    cache = _cache()
+    release = threading.Event()
+    calls, results = [], {}
+
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        if isinstance(loader_result, Exception):
+            raise loader_result
+        return loader_result
+
+    def session(session_id):
+        try:
+            results[session_id] = cache.acquire("k", session_id, "estoque_raw", loader)
+        except Exception as e:
+            results[session_id] = e
+
+    first = threading.Thread(target=session, args=("s1",))
+    first.start()
+    _wait_for_loader(cache, "k")
+    second = threading.Thread(target=session, args=("s2",))
+    second.start()
+    time.sleep(0.05)
+    release.set()
+    first.join(5)
+    second.join(5)
+    return cache, calls, results
+
+
+def test_waiting_session_gets_the_loader_error():
+    failed = (None, None, "O arquivo estoque_esperado está vazio ou inválido.")
+    cache, calls, results = _concurrent(failed)
+
+    assert len(calls) == 1
+    assert results == {"s1": failed, "s2": failed}
+    assert cache._loading == {} and cache.stats()["entries"] == 0
+
+
+def test_waiting_session_gets_the_loader_exception():
+    cache, calls, results = _concurrent(ValueError("mapeamento inválido"))
+
+    assert len(calls) == 1
+    assert all(isinstance(r, ValueError) for r in results.values()) and len(results) == 2
+    assert cache._loading == {}
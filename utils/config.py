@@ -3,7 +3,9 @@
 # =========================================
 
 # ---- Imports
+import contextlib
 import csv
+import gzip
 import io
 import os
 import re
@@ -11,25 +13,28 @@ import json
 import time
 import tempfile
 import hashlib
+import itertools
+import shutil
+import sys
+import threading
+import zipfile
+from collections import OrderedDict
 from io import BytesIO, StringIO
 from datetime import datetime
 
 import numpy as np
 import pandas as pd
-import plotly.express as px
 import streamlit as st
 import streamlit.components.v1 as components
-import unidecode
-from pyxlsb import open_workbook as open_xlsb
-from reportlab.lib import colors
-from reportlab.lib.enums import TA_CENTER
-from reportlab.lib.pagesizes import A4, landscape, portrait
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode, DataReturnMode
-from st_aggrid.shared import JsCode  # opcional (mantido)
-from pyecharts.charts import Pie, Bar, Gauge, Page
-from pyecharts import options as opts
+
+# Dependências pesadas (reportlab, pyecharts, plotly, st_aggrid, pyxlsb, unidecode)
+# são importadas sob demanda, dentro das funções que as usam: o import deste
+# módulo (e o primeiro run de cada sessão) não paga por PDF/xlsb/plotly sem uso.
+# Medição: benchmarks/bench_startup.py
+
+def _unidecode(text: str) -> str:
+    from unidecode import unidecode
+    return unidecode(text)
 
 # -----------------------------------------------------------------------------
 # Mensagens temporárias
@@ -63,7 +68,7 @@ def normalize_column_names(columns):
         if col is None:
             out.append(col)
             continue
-        c = unidecode.unidecode(str(col)).strip().upper()
+        c = _unidecode(str(col)).strip().upper()
         c = re.sub(r"[^\w]+", "_", c)
         c = re.sub(r"_+", "_", c).strip("_")
         out.append(c)
@@ -81,31 +86,298 @@ def gerar_hash(file) -> str:
 # -----------------------------------------------------------------------------
 # Leitura de Excel (xlsx/xls/xlsb)
 # -----------------------------------------------------------------------------
-def _read_xlsb_to_df(tmp_path: str) -> pd.DataFrame:
+EXCEL_PROGRESS_ROWS = 20_000  # frequência (em linhas) do aviso de progresso
+
+def _read_xlsb_to_df(tmp_path: str, sheet: str | int = 1) -> pd.DataFrame:
+    from pyxlsb import open_workbook as open_xlsb
+
     with open_xlsb(tmp_path) as wb:
-        with wb.get_sheet(1) as sheet:
+        with wb.get_sheet(sheet) as sheet:
             data = [[cell.v for cell in row] for row in sheet.rows()]
     return pd.DataFrame(data[1:], columns=data[0])
 
-def process_excel_file(file, extension: str) -> pd.DataFrame:
+def _calamine_available() -> bool:
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def list_excel_sheets(file, extension: str) -> list:
+    """
+    Nomes das abas, sem carregar as planilhas (xlsx: só o workbook.xml;
+    xls/xlsb abrem o índice do arquivo).
+    """
+    file.seek(0)
+    try:
+        if extension == "xlsx":
+            with zipfile.ZipFile(file) as z:
+                return list(_xlsx_sheet_paths(z))
+        if extension == "xls":
+            import xlrd
+
+            return xlrd.open_workbook(file_contents=file.read(), on_demand=True).sheet_names()
+        if extension == "xlsb":
+            from pyxlsb import open_workbook as open_xlsb
+
+            with open_xlsb(BytesIO(file.read())) as wb:
+                return list(wb.sheets)
+    finally:
+        file.seek(0)
+    return []
+
+def _excel_cell_str(value):
+    """Mesma conversão do pd.read_excel(dtype=str): inteiros sem '.0', vazio -> NaN."""
+    if value is None:
+        return np.nan
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime):
+        return str(pd.Timestamp(value))
+    return str(value)
+
+def _dedupe_header(header) -> list:
+    """Cabeçalho como o pandas: vazios viram 'Unnamed: i', repetidos ganham '.1', '.2'..."""
+    seen = {}
+    out = []
+    for i, name in enumerate(header):
+        name = f"Unnamed: {i}" if name is None or str(name).strip() == "" else _excel_cell_str(name)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        out.append(name)
+    return out
+
+_XLSX_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_XLSX_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+
+def _xlsx_sheet_paths(z: zipfile.ZipFile) -> dict:
+    """Aba -> caminho do XML dentro do .xlsx (na ordem do workbook)."""
+    import xml.etree.ElementTree as ET
+
+    rels = {
+        r.get("Id"): r.get("Target")
+        for r in ET.fromstring(z.read("xl/_rels/workbook.xml.rels"))
+        if r.tag.endswith("Relationship")
+    }
+    paths = {}
+    for sh in ET.fromstring(z.read("xl/workbook.xml")).iter(_XLSX_NS + "sheet"):
+        target = rels.get(sh.get(_XLSX_REL_NS + "id"), "")
+        paths[sh.get("name")] = target.lstrip("/") if target.startswith("/") else "xl/" + target
+    return paths
+
+def _xlsx_shared_strings(z: zipfile.ZipFile) -> list:
+    import xml.etree.ElementTree as ET
+
+    if "xl/sharedStrings.xml" not in z.namelist():
+        return []
+    strings = []
+    with z.open("xl/sharedStrings.xml") as f:
+        for _, el in ET.iterparse(f):
+            if el.tag == _XLSX_NS + "si":
+                # texto simples (<t>) ou rich text (<r><t>); ignora a fonética (<rPh>)
+                strings.append("".join(
+                    t.text or "" for child in el if child.tag != _XLSX_NS + "rPh"
+                    for t in ([child] if child.tag == _XLSX_NS + "t" else child.iter(_XLSX_NS + "t"))
+                ))
+                el.clear()
+    return strings
+
+def _xlsx_date_styles(z: zipfile.ZipFile) -> tuple[set, bool]:
+    """Índices de estilo (cellXfs) com formato de data e se o workbook usa a época 1904."""
+    import xml.etree.ElementTree as ET
+    from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+
+    date1904 = False
+    wb_pr = ET.fromstring(z.read("xl/workbook.xml")).find(_XLSX_NS + "workbookPr")
+    if wb_pr is not None:
+        date1904 = wb_pr.get("date1904", "false").lower() in ("1", "true")
+    if "xl/styles.xml" not in z.namelist():
+        return set(), date1904
+    styles = ET.fromstring(z.read("xl/styles.xml"))
+    formats = dict(BUILTIN_FORMATS)
+    for fmt in styles.iter(_XLSX_NS + "numFmt"):
+        formats[int(fmt.get("numFmtId"))] = fmt.get("formatCode", "")
+    cell_xfs = styles.find(_XLSX_NS + "cellXfs")
+    dates = set()
+    for i, xf in enumerate(cell_xfs if cell_xfs is not None else []):
+        code = formats.get(int(xf.get("numFmtId", 0)))
+        if code and is_date_format(code):
+            dates.add(str(i))
+    return dates, date1904
+
+def _xlsx_number_str(text: str) -> str:
+    """Número como o pd.read_excel(dtype=str): inteiros sem '.0'."""
+    if text.lstrip("-").isdigit():
+        return text
+    value = float(text)
+    return str(int(value)) if value.is_integer() else str(value)
+
+def _read_xlsx_streaming(file, sheet: str | None = None, progress=None) -> pd.DataFrame:
+    """
+    Lê .xlsx direto do XML da aba (iterparse), linha a linha, acumulando por
+    coluna — sem o modelo de células do openpyxl. Strings compartilhadas,
+    inline, booleanos, erros (-> NaN) e datas (pelo formato do estilo) saem
+    como no pd.read_excel(dtype=str). `progress(linhas_lidas, total_estimado)`
+    é chamado a cada EXCEL_PROGRESS_ROWS linhas. O cabeçalho é a primeira linha
+    com dados; linhas vazias no meio dos dados viram linhas só com NaN (como no
+    pandas, a posição/linha de origem das seguintes não muda) e as do fim saem.
+    """
+    import xml.etree.ElementTree as ET
+    from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel
+
+    with zipfile.ZipFile(file) as z:
+        paths = _xlsx_sheet_paths(z)
+        if not paths:
+            raise pd.errors.EmptyDataError("Planilha sem abas")
+        path = paths[sheet] if sheet else next(iter(paths.values()))
+        shared = _xlsx_shared_strings(z)
+        date_styles, date1904 = _xlsx_date_styles(z)
+        epoch = CALENDAR_MAC_1904 if date1904 else CALENDAR_WINDOWS_1900
+
+        tag_c, tag_v, tag_row = _XLSX_NS + "c", _XLSX_NS + "v", _XLSX_NS + "row"
+        tag_is, tag_t = _XLSX_NS + "is", _XLSX_NS + "t"
+        col_index = {}  # letras da referência -> posição da coluna
+        header, columns = None, []
+        total, n = None, 0
+        row_no = last_row = 0  # número da linha na aba (atributo r) / da última com dados
+        sheet_data = None
+
+        with z.open(path) as f:
+            for event, el in ET.iterparse(f, events=("start", "end")):
+                if event == "start":
+                    if el.tag == _XLSX_NS + "sheetData":
+                        sheet_data = el
+                    elif el.tag == _XLSX_NS + "dimension":
+                        m = re.search(r"(\d+)$", el.get("ref", ""))
+                        total = int(m.group(1)) - 1 if m else None
+                    continue
+                if el.tag != tag_row:
+                    continue
+                row_no = int(el.get("r") or row_no + 1)
+
+                values = {}
+                for pos, c in enumerate(el.iter(tag_c)):
+                    ref = c.get("r")
+                    if ref:
+                        letters = ref.rstrip("0123456789")
+                        j = col_index.get(letters)
+                        if j is None:
+                            j = 0
+                            for ch in letters:
+                                j = j * 26 + ord(ch) - 64
+                            j = col_index[letters] = j - 1
+                    else:
+                        j = pos
+                    kind = c.get("t", "n")
+                    if kind == "inlineStr":
+                        node = c.find(tag_is)
+                        text = "".join(t.text or "" for t in node.iter(tag_t)) if node is not None else ""
+                        if text:  # texto vazio é célula vazia (NaN) no pandas
+                            values[j] = text
+                        continue
+                    v = c.find(tag_v)
+                    if v is None or v.text is None:
+                        continue
+                    text = v.text
+                    if kind == "s":
+                        if shared[int(text)]:
+                            values[j] = shared[int(text)]
+                    elif kind == "n":
+                        if c.get("s") in date_styles:
+                            values[j] = _excel_cell_str(from_excel(float(text), epoch))
+                        else:
+                            values[j] = _xlsx_number_str(text)
+                    elif kind == "b":
+                        values[j] = "True" if text == "1" else "False"
+                    elif kind == "d":
+                        values[j] = str(pd.Timestamp(text))
+                    elif kind != "e":  # 'str' (fórmula); erros viram NaN
+                        values[j] = text
+                el.clear()
+                if sheet_data is not None:
+                    sheet_data.clear()
+                if not values:
+                    continue
+
+                width = max(values) + 1
+                blank, last_row = row_no - last_row - 1, row_no  # vazias (ou ausentes do XML) desde a anterior
+                if header is None:
+                    header = [values.get(j) for j in range(width)]
+                    columns = [[] for _ in range(width)]
+                    continue
+                if width > len(columns):  # linha mais larga que o cabeçalho
+                    header += [None] * (width - len(columns))
+                    columns += [[np.nan] * n for _ in range(width - len(columns))]
+                for j, col in enumerate(columns):
+                    if blank > 0:
+                        col.extend([np.nan] * blank)
+                    col.append(values.get(j, np.nan))
+                n += max(blank, 0) + 1
+                if progress is not None and n % EXCEL_PROGRESS_ROWS == 0:
+                    progress(n, total)
+
+    if header is None:
+        raise pd.errors.EmptyDataError("Planilha vazia")
+    if progress is not None:
+        progress(n, n)
+    return pd.DataFrame(dict(zip(_dedupe_header(header), columns)), dtype=object)
+
+def process_excel_file(file, extension: str, sheet: str | None = None, progress=None) -> pd.DataFrame:
     """
     Lê Excel (xlsx/xls/xlsb) preservando strings.
+    - xlsx: python-calamine quando instalado (engine nativa); senão leitura em
+      streaming do XML da aba, com `progress` opcional.
+    - `sheet`: nome da aba (padrão: a primeira).
     """
     if extension == "xlsb":
         with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsb") as tmp:
             tmp.write(file.read())
             tmp_path = tmp.name
         try:
-            df = _read_xlsb_to_df(tmp_path)
+            df = _read_xlsb_to_df(tmp_path, sheet or 1)
         finally:
             try:
                 os.remove(tmp_path)
             except Exception:
                 pass
         return df.astype(str)
-    else:
-        # pandas detecta engine automaticamente
-        return pd.read_excel(file, dtype=str)
+    if extension == "xlsx":
+        if _calamine_available():
+            return pd.read_excel(file, sheet_name=sheet or 0, dtype=str, engine="calamine")
+        return _read_xlsx_streaming(file, sheet, progress)
+    # xls: pandas detecta engine automaticamente (xlrd)
+    return pd.read_excel(file, sheet_name=sheet or 0, dtype=str)
+
+def pick_excel_sheet_ui(file, key: str) -> str | None:
+    """
+    Selectbox da aba quando o Excel enviado tem mais de uma. Retorna o nome
+    escolhido (ou None: primeira aba / arquivo não Excel). A lista de abas fica
+    memoizada na sessão pelo file_id.
+    """
+    if file is None:
+        return None
+    ext = file.name.split(".")[-1].lower()
+    compression = ext if ext in COMPRESSED_EXTENSIONS else None
+    if compression:
+        ext = _inner_extension(file, compression)
+    if ext not in ("xlsx", "xls", "xlsb"):
+        return None
+
+    memo = st.session_state.setdefault("_excel_sheets", {})
+    file_id = getattr(file, "file_id", None) or file.name
+    if file_id not in memo:
+        try:
+            memo[file_id] = list_excel_sheets(_spool_decompressed(file, compression) if compression else file, ext)
+        except Exception:
+            memo[file_id] = []
+        file.seek(0)
+    sheets = memo[file_id]
+    if len(sheets) <= 1:
+        return None
+    return st.selectbox("Aba da planilha", sheets, key=key)
 
 # -----------------------------------------------------------------------------
 # CSV/TXT: detecção de encoding e dialeto (sep/aspas)
@@ -150,97 +422,1834 @@ def detect_csv_dialect(text: str):
             "escapechar": None,
         }
 
+# -----------------------------------------------------------------------------
+# Perfil rápido de arquivos do RFLog (separador, cabeçalho, papel das colunas)
+# -----------------------------------------------------------------------------
+PROFILE_SAMPLE_BYTES = 32 * 1024
+PROFILE_SAMPLE_LINES = 1000
+_PROFILE_SEPS = [";", "\t", "|", ","]  # em empate, vírgula por último (decimal BR)
+_EAN_LIKE = r"\d{8,14}"
+_COUNT_LIKE = r"-?(?:\d{1,3}(?:[.,]\d{3})+|\d{1,9})(?:[.,]0+)?"
+_EPC_LIKE = r"[0-9A-Fa-f]{24}"
+# nomes (normalizados) aceitos para a coluna de zona/local da contagem
+ZONE_HEADER_NAMES = {"ZONA", "LOCAL", "LOCALIZACAO", "SETOR", "AREA", "DEPOSITO", "AMBIENTE", "ZONE", "LOCATION"}
+
+def profile_count_text(text: str) -> dict:
+    """
+    Perfil vetorizado de uma amostra limitada do arquivo de contagem.
+    Retorna o dialeto (mesmas chaves de `detect_csv_dialect`) e ainda:
+      - header:    se a 1ª linha é cabeçalho
+      - n_cols:    nº de colunas
+      - ean_col:   índice da coluna com valores tipo EAN (8–14 dígitos)
+      - count_col: índice da coluna de quantidades inteiras (ou None)
+      - epc_col:   índice da coluna de EPCs (96 bits em hex), se for leitura crua
+      - zone_col:  índice da coluna de zona/local (pelo nome no cabeçalho), se houver
+    """
+    sample = text[:PROFILE_SAMPLE_BYTES] if text else ""
+    if len(text or "") > PROFILE_SAMPLE_BYTES:
+        sample = sample[: sample.rfind("\n") + 1] or sample  # descarta linha cortada
+    lines = pd.Series(sample.splitlines()[:PROFILE_SAMPLE_LINES], dtype=object)
+    lines = lines[lines.str.strip() != ""]
+
+    # separador: o que aparece com a mesma contagem (>0) no maior nº de linhas
+    sep, n_cols, best = ",", 1, 0.0
+    for cand in _PROFILE_SEPS:
+        counts = lines.str.count(re.escape(cand))
+        if counts.empty or counts.max() == 0:
+            continue
+        mode = counts[counts > 0].mode().iloc[0]
+        score = float((counts == mode).mean())
+        if score > best:
+            sep, n_cols, best = cand, int(mode) + 1, score
+
+    quotechar = '"'
+    cells = lines.str.split(re.escape(sep), n=n_cols - 1, regex=True, expand=True) if n_cols > 1 else lines.to_frame()
+    cells = cells.apply(lambda c: c.str.strip().str.strip(quotechar))
+
+    profile = {
+        "sep": sep,
+        "quotechar": quotechar,
+        "doublequote": True,
+        "escapechar": None,
+        "header": False,
+        "n_cols": n_cols,
+        "ean_col": 0,
+        "count_col": 1 if n_cols >= 2 else None,
+        "epc_col": None,
+        "zone_col": None,
+    }
+    if cells.empty:
+        return profile
+
+    body = cells.iloc[1:] if len(cells) > 1 else cells
+    epc_frac = [float(body[c].str.fullmatch(_EPC_LIKE).fillna(False).mean()) for c in cells.columns]
+    epc_col = int(np.argmax(epc_frac))
+    if epc_frac[epc_col] >= 0.5:
+        # leitura crua de EPCs: cada linha é uma leitura de tag (sem coluna de quantidade)
+        profile.update(epc_col=epc_col, count_col=None)
+        profile["header"] = len(cells) > 1 and not re.fullmatch(_EPC_LIKE, str(cells.iloc[0, epc_col] or ""))
+        return profile
+
+    ean_frac = [float(body[c].str.fullmatch(_EAN_LIKE).fillna(False).mean()) for c in cells.columns]
+    cnt_frac = [float(body[c].str.fullmatch(_COUNT_LIKE).fillna(False).mean()) for c in cells.columns]
+
+    ean_col = int(np.argmax(ean_frac))
+    if ean_frac[ean_col] >= 0.5:
+        profile["ean_col"] = ean_col
+        first = cells.iloc[0]
+        profile["header"] = len(cells) > 1 and not re.fullmatch(_EAN_LIKE, str(first.iloc[ean_col] or ""))
+        # zona: só pelo nome da coluna (sem cabeçalho, colunas de texto extras são ignoradas)
+        if profile["header"]:
+            names = normalize_column_names([str(v or "") for v in first])
+            zones = [i for i, name in enumerate(names) if i != ean_col and name in ZONE_HEADER_NAMES]
+            profile["zone_col"] = zones[0] if zones else None
+        others = [
+            i for i in range(len(cnt_frac))
+            if i not in (ean_col, profile["zone_col"]) and cnt_frac[i] >= 0.5
+        ]
+        # quantidade: inteiros curtos que não parecem EAN
+        others.sort(key=lambda i: (cnt_frac[i] - ean_frac[i]), reverse=True)
+        profile["count_col"] = others[0] if others else None
+    return profile
+
+def get_upload_profile(file, text: str) -> dict:
+    """
+    `profile_count_text` memoizado na sessão por upload (file_id),
+    para não refazer a detecção a cada rerun.
+    """
+    file_id = getattr(file, "file_id", None)
+    memo = st.session_state.setdefault("_upload_profiles", {})
+    if file_id is not None and file_id in memo:
+        return memo[file_id]
+    profile = profile_count_text(text)
+    if file_id is not None:
+        memo[file_id] = profile
+    return profile
+
+# -----------------------------------------------------------------------------
+# Uploads compactados (.gz/.zip/.zst) — descompressão em streaming
+# -----------------------------------------------------------------------------
+COMPRESSED_EXTENSIONS = ("gz", "zip", "zst")
+_DATA_EXTENSIONS = ("csv", "txt", "xlsx", "xls", "xlsb")
+
+def _zip_member(zf: zipfile.ZipFile) -> zipfile.ZipInfo:
+    """
+    Escolhe o arquivo de dados dentro do .zip (o primeiro com extensão conhecida).
+    """
+    members = [
+        i for i in zf.infolist()
+        if not i.is_dir() and "__MACOSX" not in i.filename and not os.path.basename(i.filename).startswith(".")
+    ]
+    data = [i for i in members if i.filename.rsplit(".", 1)[-1].lower() in _DATA_EXTENSIONS]
+    if not (data or members):
+        raise ValueError("O arquivo .zip está vazio.")
+    return (data or members)[0]
+
+def _open_decompressed(file, compression: str):
+    """
+    Abre um stream binário descompactado sob demanda sobre o upload.
+    Retorna (stream, nome_do_arquivo_interno).
+    """
+    file.seek(0)
+    base = file.name[: -(len(compression) + 1)]
+    if compression == "gz":
+        return gzip.GzipFile(fileobj=file, mode="rb"), base
+    if compression == "zip":
+        zf = zipfile.ZipFile(file)
+        member = _zip_member(zf)
+        return zf.open(member), member.filename
+    if compression == "zst":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("Para arquivos .zst é necessário instalar o pacote 'zstandard'.")
+        return zstandard.ZstdDecompressor().stream_reader(file, closefd=False), base
+    raise ValueError(f"Compressão não suportada: {compression}")
+
+def _inner_extension(file, compression: str) -> str:
+    """
+    Extensão do arquivo compactado (ex.: contagem.txt.gz -> 'txt').
+    Sem extensão reconhecível, assume texto ('csv').
+    """
+    if compression == "zip":
+        file.seek(0)
+        name = _zip_member(zipfile.ZipFile(file)).filename
+    else:
+        name = file.name[: -(len(compression) + 1)]
+    ext = name.rsplit(".", 1)[-1].lower() if "." in name else ""
+    return ext if ext in _DATA_EXTENSIONS else "csv"
+
+def _sniff_encoding(sample: bytes) -> str:
+    for enc in COMMON_ENCODINGS:
+        try:
+            sample.decode(enc)
+            return enc
+        except Exception:
+            continue
+    return "latin1"
+
+def _open_text_source(file, compression: str | None, encoding: str | None = None):
+    """
+    Fonte de texto para o pd.read_csv + amostra (para dialeto/perfil).
+    - sem compressão: texto inteiro em memória, como antes;
+    - compactado: TextIOWrapper sobre o stream descompactado, lido em blocos pelo
+      parser (o conteúdo descompactado nunca fica inteiro em memória). O encoding
+      (se não vier em `encoding`) é detectado numa amostra do início e a
+      decodificação é estrita: byte inválido adiante levanta UnicodeDecodeError
+      (ver `read_text_upload`).
+    Retorna (fonte, encoding, amostra).
+    """
+    if compression is None:
+        text, enc_used = _read_text_with_fallback(file)
+        return StringIO(text), enc_used, text
+
+    stream, _ = _open_decompressed(file, compression)
+    head = stream.read(PROFILE_SAMPLE_BYTES)
+    stream.close()
+    cut = head.rfind(b"\n")
+    head = head[: cut + 1] if cut >= 0 else head  # não corta caractere multibyte
+    enc_used = encoding or _sniff_encoding(head)
+
+    stream, _ = _open_decompressed(file, compression)  # reabre do início
+    source = io.TextIOWrapper(stream, encoding=enc_used, errors="strict", newline="")
+    return source, f"{enc_used}; {compression}", head.decode(enc_used, errors="replace")
+
+def read_text_upload(file, compression: str | None, parse):
+    """
+    Roda `parse(fonte, amostra)` sobre o texto do upload. Compactado: se a
+    decodificação estrita falhar depois da amostra, reabre o stream e tenta o
+    próximo encoding de COMMON_ENCODINGS, como `_read_text_with_fallback`.
+    Retorna (resultado, encoding utilizado).
+    """
+    source, enc_used, sample = _open_text_source(file, compression)
+    if compression is None:
+        return parse(source, sample), enc_used
+    first = enc_used.split(";")[0]
+    fallbacks = COMMON_ENCODINGS[COMMON_ENCODINGS.index(first) + 1:] if first in COMMON_ENCODINGS else []
+    for enc in fallbacks:
+        try:
+            with source:
+                return parse(source, sample), enc_used
+        except UnicodeDecodeError:
+            source, enc_used, sample = _open_text_source(file, compression, enc)
+    with source:  # latin1 (na lista) decodifica qualquer byte
+        return parse(source, sample), enc_used
+
+def _spool_decompressed(file, compression: str):
+    """
+    Excel precisa de arquivo com seek: descompacta em streaming para um arquivo
+    temporário (em memória até 32 MB, depois em disco).
+    """
+    stream, _ = _open_decompressed(file, compression)
+    spool = tempfile.SpooledTemporaryFile(max_size=32 * 1024 * 1024)
+    with stream:
+        shutil.copyfileobj(stream, spool, 1024 * 1024)
+    spool.seek(0)
+    return spool
+
+# -----------------------------------------------------------------------------
+# EPC (SGTIN-96) -> EAN, com deduplicação de leituras repetidas
+# -----------------------------------------------------------------------------
+SGTIN96_HEADER = 0x30
+# partição -> bits/dígitos do prefixo da empresa, bits/dígitos da referência do item
+_SGTIN_PARTITIONS = np.array([
+    [40, 12, 4, 1], [37, 11, 7, 2], [34, 10, 10, 3], [30, 9, 14, 4],
+    [27, 8, 17, 5], [24, 7, 20, 6], [20, 6, 24, 7],
+], dtype=np.int64)
+_HEX_LUT = np.zeros(256, dtype=np.uint64)
+for _i, _c in enumerate(b"0123456789abcdef"):
+    _HEX_LUT[_c] = _i
+for _i, _c in enumerate(b"ABCDEF", start=10):
+    _HEX_LUT[_c] = _i
+
+def gtin_check_digit(body: np.ndarray, n_digits: int = 13) -> np.ndarray:
+    """
+    Dígito verificador GS1 (vetorizado) para corpos numéricos de `n_digits` dígitos.
+    Pesos 3,1,3,... a partir do dígito mais à direita.
+    """
+    rest = np.asarray(body, dtype=np.int64).copy()
+    total = np.zeros(len(rest), dtype=np.int64)
+    for pos in range(n_digits):
+        total += (rest % 10) * (3 if pos % 2 == 0 else 1)
+        rest //= 10
+    return (10 - total % 10) % 10
+
+def _parse_epc_hex(epcs: pd.Series):
+    """
+    EPCs em hex (24 caracteres) -> (hi: bits 95..32, lo: bits 31..0, ok) como uint64.
+    """
+    s = epcs.astype(str).str.strip()
+    ok = np.array(s.str.fullmatch(_EPC_LIKE).fillna(False), dtype=bool)
+    hi = np.zeros(len(s), dtype=np.uint64)
+    lo = np.zeros(len(s), dtype=np.uint64)
+    if ok.any():
+        raw = s[ok].to_numpy(dtype=object).astype("S24").view(np.uint8).reshape(-1, 24)
+        nib = _HEX_LUT[raw]
+        h = np.zeros(len(nib), dtype=np.uint64)
+        for i in range(16):
+            h = (h << np.uint64(4)) | nib[:, i]
+        l = np.zeros(len(nib), dtype=np.uint64)
+        for i in range(16, 24):
+            l = (l << np.uint64(4)) | nib[:, i]
+        hi[ok], lo[ok] = h, l
+    return hi, lo, ok
+
+def _sgtin96_gtin(hi: np.ndarray, ok: np.ndarray):
+    """
+    Bits altos de EPCs SGTIN-96 -> (GTIN como int64, ok atualizado).
+    GTIN-14 = indicador + prefixo da empresa + resto da referência + dígito verificador.
+    """
+    partition = ((hi >> np.uint64(50)) & np.uint64(7)).astype(np.int64)
+    ok = ok & ((hi >> np.uint64(56)) == SGTIN96_HEADER) & (partition <= 6)
+    part = _SGTIN_PARTITIONS[np.where(ok, partition, 0)]
+    ir_bits = part[:, 2].astype(np.uint64)
+    field = (hi >> np.uint64(6)) & np.uint64((1 << 44) - 1)   # empresa + item (44 bits)
+    company = (field >> ir_bits).astype(np.int64)
+    item = (field & ((np.uint64(1) << ir_bits) - np.uint64(1))).astype(np.int64)
+    ok &= (company < 10 ** part[:, 1]) & (item < 10 ** part[:, 3])
+
+    scale = 10 ** (part[:, 3] - 1)
+    indicator = item // scale
+    body = np.where(ok, indicator * 10 ** 12 + company * scale + item % scale, 0)
+    return body * 10 + gtin_check_digit(body), ok
+
+def _gtin_to_ean(gtin: np.ndarray) -> np.ndarray:
+    # indicador 0 -> EAN-13 (zeros à esquerda); senão GTIN-14
+    return pd.Series(gtin).astype(str).str.zfill(13).to_numpy()
+
+def decode_sgtin96(epcs: pd.Series) -> pd.DataFrame:
+    """
+    Decodifica EPCs SGTIN-96 (24 caracteres hex) sem laço por linha.
+    Retorna, alinhado a `epcs`: EAN (GTIN-13; GTIN-14 se o indicador ≠ 0),
+    TAG_HI/TAG_LO (os 96 bits, chave da tag) e VALIDO.
+    """
+    hi, lo, ok = _parse_epc_hex(epcs)
+    gtin, ok = _sgtin96_gtin(hi, ok)
+    return pd.DataFrame(
+        {"EAN": _gtin_to_ean(gtin), "TAG_HI": hi, "TAG_LO": lo, "VALIDO": ok},
+        index=epcs.index,
+    )
+
+EPC_REPORT_ATTR = "epc_report"      # df.attrs[...]: lista de estatísticas da leitura de EPCs (dicts simples)
+_TAG_KEY = np.dtype([("hi", ">u8"), ("lo", ">u8")])
+
+def epc_tag_keys(hi: np.ndarray, lo: np.ndarray) -> np.ndarray:
+    """
+    (hi, lo) -> uma chave de 16 bytes por tag (dtype void), ordenável e
+    comparável em bloco pelo numpy (np.unique/np.searchsorted).
+    """
+    keys = np.empty(len(hi), dtype=_TAG_KEY)
+    keys["hi"], keys["lo"] = hi, lo
+    return keys.view("V16")
+
+class SeenTags:
+    """
+    Tags EPC já contadas no modo ao vivo: array ordenado de chaves de 16 bytes
+    (`epc_tag_keys`). Cada trecho é conferido com searchsorted e as tags novas
+    são intercaladas no array, sem laço em Python. 1M de tags ocupam 16 MB.
+    """
+
+    def __init__(self):
+        self.keys = np.empty(0, dtype="V16")
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.keys.nbytes)
+
+    def add(self, keys: np.ndarray) -> np.ndarray:
+        """
+        Recebe chaves únicas e ordenadas (saída de np.unique); guarda as
+        inéditas e devolve a máscara delas.
+        """
+        pos = np.searchsorted(self.keys, keys)
+        seen = pos < len(self.keys)
+        seen[seen] = self.keys[pos[seen]] == keys[seen]
+        fresh = ~seen
+        self.keys = np.insert(self.keys, pos[fresh], keys[fresh])
+        return fresh
+
+def epc_reads_to_counts(epcs: pd.Series, seen_tags: SeenTags | None = None):
+    """
+    Leituras cruas de EPC -> EAN/CONTAGEM, contando cada tag (96 bits) uma vez.
+    A deduplicação ordena as chaves de 16 bytes das tags, e o GTIN só é
+    calculado para as tags únicas. Com `seen_tags` (modo ao vivo), tags já
+    contadas em trechos anteriores também são descartadas.
+    Retorna (contagem por EAN, estatísticas por leitura: leituras, invalidas
+    — fora do formato hex de 24 caracteres —, nao_sgtin, repetidas, tags).
+    """
+    hi, lo, ok = _parse_epc_hex(epcs)
+    keys, first, inverse = np.unique(epc_tag_keys(hi[ok], lo[ok]), return_index=True, return_inverse=True)
+    tag_hi = hi[ok][first]
+    gtin, valid = _sgtin96_gtin(tag_hi, np.ones(len(keys), dtype=bool))
+    counted = valid.copy()
+    if seen_tags is not None:
+        counted[valid] = seen_tags.add(keys[valid])
+
+    codes, per_code = np.unique(gtin[counted], return_counts=True)
+    counts = pd.DataFrame({"EAN": _gtin_to_ean(codes), "CONTAGEM": per_code.astype(np.int64)})
+    valid_reads = int(valid[inverse].sum())
+    stats = {
+        "leituras": int(len(epcs)),
+        "invalidas": int((~ok).sum()),
+        "nao_sgtin": int(ok.sum()) - valid_reads,
+        "repetidas": valid_reads - int(counted.sum()),
+        "tags": int(counted.sum()),
+    }
+    return counts, stats
+
+def show_epc_report(*reports):
+    """
+    Resumo da leitura de EPCs: quantas leituras viraram tags contadas e quantas
+    foram descartadas (formato inválido, não SGTIN-96 ou tag repetida).
+    """
+    reports = [r for r in reports if r]
+    if not reports:
+        return
+    table = pd.DataFrame([
+        {
+            "ARQUIVO": r.get("coluna", "contagem"),
+            "LEITURAS": r["leituras"],
+            "TAGS CONTADAS": r["tags"],
+            "REPETIDAS": r["repetidas"],
+            "FORMATO INVÁLIDO": r["invalidas"],
+            "NÃO SGTIN-96": r["nao_sgtin"],
+        }
+        for r in reports
+    ])
+    dropped = int(table["FORMATO INVÁLIDO"].sum() + table["NÃO SGTIN-96"].sum())
+    label = f"Leitura de EPCs ({dropped:,} leituras descartadas)".replace(",", ".")
+    with st.expander(label, expanded=False, icon="⚠️" if dropped else "🏷️"):
+        st.caption(
+            "Cada etiqueta (EPC de 96 bits) é contada uma única vez; leituras repetidas não somam. "
+            "EPCs fora do formato hexadecimal de 24 caracteres ou que não são SGTIN-96 não viram EAN e ficam fora da contagem."
+        )
+        st.dataframe(table, hide_index=True, use_container_width=True)
+
+# -----------------------------------------------------------------------------
+# EAN canônico (chave do cruzamento) + mapa original -> canônico
+# -----------------------------------------------------------------------------
+EAN_REPORT_ATTR = "ean_report"     # df.attrs[...]: lista de relatórios da normalização (dicts simples)
+EAN_REPORT_ROWS = 50               # valores distintos listados no relatório
+EAN_ORIGINAL_COLUMN = "EAN ORIGINAL"
+_EAN_SCIENTIFIC = r"\d+(?:[.,]\d+)?[eE]\+?\d{1,2}"
+
+def _clean_ean_text(raw: pd.Series, messy: pd.Series):
+    """
+    Limpa só os EANs marcados em `messy`: tira espaços/aspas, o ".0" de número
+    exportado como decimal e expande notação científica.
+    Retorna (EANs, tirou_espaços, tirou_decimal, notação_científica).
+    """
+    s = raw.copy()
+    spaces, trailing, scientific = (pd.Series(False, index=raw.index) for _ in range(3))
+    if not messy.any():
+        return s, spaces, trailing, scientific
+    m = raw[messy].str.replace("[\\s\u00a0\u202f'\"]", "", regex=True)
+    spaces[messy] = m != raw[messy]
+    is_trailing = m.str.fullmatch(r"\d+[.,]0+")
+    m = m.mask(is_trailing, m.str.replace(r"[.,]0+$", "", regex=True))
+    trailing[messy] = is_trailing
+    is_scientific = m.str.fullmatch(_EAN_SCIENTIFIC)
+    if is_scientific.any():
+        num = pd.to_numeric(m[is_scientific].str.replace(",", ".", regex=False), errors="coerce")
+        num = num[(num % 1 == 0) & (num < 10**14)]
+        is_scientific &= m.index.isin(num.index)
+        m[num.index] = num.astype(np.int64).astype(str)
+    scientific[messy] = is_scientific
+    s[messy] = m
+    return s, spaces, trailing, scientific
+
+def canonicalize_eans(values, column: str = "EAN", first_line: int = 1) -> tuple[pd.api.extensions.ExtensionArray, dict]:
+    """
+    Normaliza EANs para a chave do cruzamento, rodando só nos valores distintos:
+    - espaços, aspas e o apóstrofo de texto do Excel saem; "…0.0" perde o decimal
+    - notação científica ("7.89E+12") volta a ser inteiro
+    - GTIN numérico (8 a 14 dígitos sem os zeros à esquerda) vira EAN-13 com
+      zeros à esquerda; GTIN-14 com indicador 0 vira EAN-13 (mesmo formato de
+      `_gtin_to_ean`), indicador ≠ 0 segue com 14 dígitos
+    - o dígito verificador GS1 é conferido; inválido não é alterado, só reportado
+    Códigos internos (não numéricos ou curtos) seguem como estão, só sem espaços.
+    Retorna (EANs canônicos, relatório). O relatório é um dict simples (vai em
+    df.attrs, em pickle e na sessão): coluna, linhas_afetadas, invalidos,
+    "mapa" (todos os valores alterados, para a grade: JSON {"ORIGINAL": [...],
+    "EAN": [...]} numa string — o pandas copia attrs a cada operação e a string
+    não custa nada para copiar) e "valores" — os mais frequentes com MOTIVO,
+    VALOR, OCORRÊNCIAS, PRIMEIRA LINHA e EAN USADO.
+    """
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+    raw = pd.Series(uniques).astype(str)
+    digits = raw.str.isdigit() & raw.str.isascii()
+    # o caso comum (só dígitos) não passa pelas expressões regulares
+    s, spaces, trailing, scientific = _clean_ean_text(raw, ~digits)
+    if not digits.all():
+        digits = s.str.isdigit() & s.str.isascii()
+
+    stripped = s.str.lstrip("0")
+    gtin = digits & stripped.str.len().between(8, 14)
+    canonical = s.mask(gtin, stripped.str.pad(13, fillchar="0"))
+    valid = np.ones(len(s), dtype=bool)
+    if gtin.any():
+        n = stripped[gtin].astype(np.int64).to_numpy()
+        valid[gtin.to_numpy()] = n % 10 == gtin_check_digit(n // 10)
+
+    # nulos (código -1) vão para uma posição extra, como no astype(str) anterior
+    lut = pd.concat([canonical, pd.Series(["nan"], dtype=canonical.dtype)], ignore_index=True)
+    slot = np.where(codes < 0, len(uniques), codes)
+    changed = (canonical != raw).to_numpy()
+    invalid = gtin.to_numpy() & ~valid
+    if changed.any() or (codes < 0).any():
+        result = lut.array.take(slot)
+    else:  # já canônicos (o caso comum): nada a espalhar pelas linhas
+        result = pd.Series(values).astype(str).array
+
+    report = {"coluna": column, "linhas_afetadas": 0, "invalidos": 0,
+              "mapa": "", "valores": []}
+    flagged = np.flatnonzero(changed | invalid)
+    if flagged.size:
+        occurrences = np.bincount(slot, minlength=len(lut))
+        first = np.full(len(lut), -1, dtype=np.int64)
+        first[slot[::-1]] = np.arange(len(slot) - 1, -1, -1)
+        top = flagged[np.argsort(-occurrences[flagged], kind="stable")][:EAN_REPORT_ROWS]
+        moved = np.flatnonzero(changed)
+        s_len, c_len = s.str.len().to_numpy()[top], canonical.str.len().to_numpy()[top]
+        is_gtin = gtin.to_numpy()[top]
+        labels = (
+            (spaces.to_numpy()[top], "espaços/aspas"),
+            (trailing.to_numpy()[top], "decimal .0"),
+            (scientific.to_numpy()[top], "notação científica"),
+            (is_gtin & (s_len == 14) & (c_len == 13), "GTIN-14 → EAN-13"),
+            (is_gtin & (s_len != 14) & (s_len != c_len), "zeros à esquerda"),
+            (invalid[top], "dígito verificador inválido"),
+        )
+        report["linhas_afetadas"] = int(occurrences[flagged].sum())
+        report["invalidos"] = int(occurrences[np.flatnonzero(invalid)].sum())
+        report["mapa"] = json.dumps({"ORIGINAL": raw.iloc[moved].tolist(), "EAN": canonical.iloc[moved].tolist()})
+        report["valores"] = [
+            {
+                "MOTIVO": "; ".join(text for mask, text in labels if mask[k]),
+                "VALOR": str(raw.iloc[i]),
+                "OCORRÊNCIAS": int(occurrences[i]),
+                "PRIMEIRA LINHA": int(first[i] + first_line),
+                "EAN USADO": str(lut.iloc[i]),
+            }
+            for k, i in enumerate(top)
+        ]
+    return result, report
+
+def set_canonical_eans(df: pd.DataFrame, column: str = "EAN", first_line: int = 1) -> pd.DataFrame:
+    """
+    Troca df['EAN'] pela chave canônica (no próprio df) e guarda o relatório em
+    df.attrs — a marca de que a normalização já rodou para este DataFrame.
+    """
+    canonical, report = canonicalize_eans(df["EAN"], column=column, first_line=first_line)
+    df["EAN"] = pd.Series(canonical, index=df.index)
+    df.attrs[EAN_REPORT_ATTR] = [report]
+    return df
+
+def ean_original_map(*reports) -> pd.Series:
+    """
+    EAN canônico -> valores originais que viraram ele ("a | b" se mais de um),
+    a partir dos mapas dos relatórios de `canonicalize_eans`.
+    """
+    maps = [json.loads(r["mapa"]) for r in reports if r and r.get("mapa")]
+    pairs = pd.DataFrame({
+        "EAN": [e for m in maps for e in m["EAN"]],
+        "ORIGINAL": [o for m in maps for o in m["ORIGINAL"]],
+    }, dtype=str).drop_duplicates()
+    return pairs.groupby("EAN", sort=False)["ORIGINAL"].agg(" | ".join)
+
+def show_ean_report(*reports):
+    """
+    Relatório compacto dos EANs normalizados ou com dígito verificador inválido
+    (um expander; nada aparece se todos os EANs já estavam no formato canônico).
+    """
+    reports = [r for r in reports if r and r.get("valores")]
+    if not reports:
+        return
+    affected = sum(r["linhas_afetadas"] for r in reports)
+    invalid = sum(r["invalidos"] for r in reports)
+    table = pd.DataFrame([{"COLUNA": r["coluna"], **v} for r in reports for v in r["valores"]])
+    label = f"EANs normalizados na leitura ({affected:,} linhas)".replace(",", ".")
+    with st.expander(label, expanded=False, icon="🏷️"):
+        st.caption(
+            f"Até {EAN_REPORT_ROWS} valores distintos por arquivo, os mais frequentes. "
+            "O cruzamento usa o EAN USADO (EAN-13 com zeros à esquerda); o valor original "
+            f"aparece na coluna {EAN_ORIGINAL_COLUMN} da tabela. "
+            + (f"{invalid:,} linhas com dígito verificador inválido.".replace(",", ".") if invalid else "")
+        )
+        st.dataframe(table, hide_index=True, use_container_width=True)
+
+# -----------------------------------------------------------------------------
+# Quantidades (números no formato BR ou internacional) + relatório de correções
+# -----------------------------------------------------------------------------
+QUANTITY_MAX = int(os.environ.get("RFDASH_QUANTITY_MAX", str(10**9)))  # acima disso: rejeitado
+QUANTITY_REPORT_ATTR = "quantity_report"  # df.attrs[...]: lista de relatórios do parse (dicts simples)
+QUANTITY_REPORT_ROWS = 50                 # valores distintos listados no relatório
+_QTY_THOUSANDS_DOT = r"-?\d{1,3}(?:\.\d{3})+"
+_QTY_THOUSANDS_COMMA = r"-?\d{1,3}(?:,\d{3})+"
+
+def _quantity_locale(s: pd.Series, has_c: pd.Series, has_d: pd.Series, last_c, last_d) -> str:
+    """
+    Formato da coluna ("br" | "intl") pelos valores sem ambiguidade:
+    "1.234,5"/"2,5" contam para BR; "1,234.5"/"2.5" para internacional.
+    Empate (ex.: só inteiros, ou só "1.234") fica no padrão BR.
+    """
+    both = has_c & has_d
+    only_c = has_c & ~has_d
+    only_d = has_d & ~has_c
+    br = (both & (last_c > last_d)) | (only_c & ~s.str.fullmatch(_QTY_THOUSANDS_COMMA))
+    intl = (both & (last_d > last_c)) | (only_d & ~s.str.fullmatch(_QTY_THOUSANDS_DOT))
+    return "intl" if int(intl.sum()) > int(br.sum()) else "br"
+
+def parse_quantities(
+    values,
+    default: int = 0,
+    empty: int | None = None,
+    column: str = "",
+    first_line: int = 1,
+    locale: str | None = None,
+) -> tuple[np.ndarray, pd.DataFrame]:
+    """
+    Converte quantidades em inteiros (int64) aceitando "1.234", "1.234,00",
+    "1,234.00", "2,0", " 12 ", "+3", "1e3" etc. O formato (BR ou internacional)
+    é decidido pela coluna toda (`locale` força); o parse roda só nos valores
+    distintos e é espalhado pelas linhas.
+    - inválido ou fora de ±QUANTITY_MAX -> `default`; vazio -> `empty` (padrão: `default`)
+    - decimal -> arredondado (meio para longe do zero)
+    Retorna (valores, relatório). O relatório é um dict simples (vai em
+    df.attrs, em pickle e na sessão): coluna, formato, linhas_afetadas e
+    "valores" — um registro por valor corrigido/rejeitado com MOTIVO, VALOR,
+    OCORRÊNCIAS, PRIMEIRA LINHA (`first_line` = linha da 1ª linha de dados no
+    arquivo) e VALOR USADO.
+    """
+    empty = default if empty is None else empty
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+    raw = pd.Series(uniques, dtype=object)
+    if pd.api.types.is_numeric_dtype(pd.Series(values).dtype):
+        num = pd.to_numeric(raw, errors="coerce").astype(np.float64)
+        is_empty = num.isna()
+        detected = None
+    else:
+        s = raw.astype(str).str.replace("[\\s\u00a0\u202f']", "", regex=True).str.lstrip("+")
+        is_empty = s == ""
+        has_c = s.str.contains(",", regex=False)
+        has_d = s.str.contains(".", regex=False)
+        last_c, last_d = s.str.rfind(","), s.str.rfind(".")
+        detected = locale or _quantity_locale(s, has_c, has_d, last_c, last_d)
+        # separador decimal de cada valor; o outro é de milhar e sai
+        many_c = s.str.count(",") > 1
+        many_d = s.str.count(r"\.") > 1
+        only_c = has_c & ~has_d
+        only_d = has_d & ~has_c
+        comma_thousands = s.str.fullmatch(_QTY_THOUSANDS_COMMA)
+        dot_thousands = s.str.fullmatch(_QTY_THOUSANDS_DOT)
+        if detected == "br":
+            dec_comma = (has_c & has_d & (last_c > last_d)) | (only_c & ~many_c)
+            dec_dot = (has_c & has_d & (last_d > last_c)) | (only_d & ~many_d & ~dot_thousands)
+        else:
+            dec_comma = (has_c & has_d & (last_c > last_d)) | (only_c & ~many_c & ~comma_thousands)
+            dec_dot = (has_c & has_d & (last_d > last_c)) | (only_d & ~many_d)
+        norm = s.str.replace(r"[.,]", "", regex=True)
+        norm = norm.mask(dec_comma, s.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+        norm = norm.mask(dec_dot, s.str.replace(",", "", regex=False))
+        num = pd.to_numeric(norm, errors="coerce").astype(np.float64)
+
+    num_arr = num.to_numpy()
+    is_empty = is_empty.to_numpy() | raw.isna().to_numpy()
+    invalid = ~is_empty & np.isnan(num_arr)
+    out_of_range = ~is_empty & ~invalid & ~(np.abs(num_arr) <= QUANTITY_MAX)
+    ok = ~is_empty & ~invalid & ~out_of_range
+    num_arr = np.where(ok, num_arr, 0)
+    whole = np.trunc(num_arr + np.copysign(0.5, num_arr))  # meio para longe do zero: 2,5 -> 3
+    rounded = ok & (num_arr != whole)
+    parsed = np.where(ok, whole, default).astype(np.int64)
+    parsed[is_empty] = empty
+
+    # nulos (código -1) vão para uma posição extra, tratada como vazia
+    lut = np.append(parsed, empty)
+    result = lut[codes]
+
+    reasons = np.select(
+        [is_empty, invalid, out_of_range, rounded],
+        ["vazio", "inválido", "fora do intervalo", "decimal arredondado"],
+        default="",
+    )
+    flagged = np.flatnonzero(reasons != "")
+    if codes.size and (codes < 0).any():
+        flagged = np.append(flagged, len(uniques))
+        reasons = np.append(reasons, "vazio")
+        raw = pd.concat([raw, pd.Series([""], dtype=object)], ignore_index=True)
+    report = {"coluna": column, "formato": detected, "linhas_afetadas": 0, "valores": []}
+    if flagged.size:
+        slot = np.where(codes < 0, len(uniques), codes)
+        occurrences = np.bincount(slot, minlength=len(lut))
+        first = np.full(len(lut), -1, dtype=np.int64)
+        first[slot[::-1]] = np.arange(len(slot) - 1, -1, -1)
+        top = flagged[np.argsort(-occurrences[flagged], kind="stable")][:QUANTITY_REPORT_ROWS]
+        report["linhas_afetadas"] = int(occurrences[flagged].sum())
+        report["valores"] = [
+            {
+                "MOTIVO": str(reasons[i]),
+                "VALOR": str(raw.iloc[i]),
+                "OCORRÊNCIAS": int(occurrences[i]),
+                "PRIMEIRA LINHA": int(first[i] + first_line),
+                "VALOR USADO": int(lut[i]),
+            }
+            for i in top
+        ]
+    return result, report
+
+def ensure_quantities(values: pd.Series, column: str = "") -> np.ndarray:
+    """
+    Quantidades já inteiras passam direto (o parse ocorreu na leitura);
+    qualquer outra coisa (texto, float, nulos) passa por `parse_quantities`.
+    """
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return values.to_numpy(dtype=np.int64)
+    return parse_quantities(values, column=column)[0]
+
+def show_quantity_report(*reports):
+    """
+    Relatório compacto das quantidades corrigidas ou rejeitadas na leitura
+    (um expander; nada aparece se todos os valores estavam bons).
+    """
+    reports = [r for r in reports if r and r.get("valores")]
+    if not reports:
+        return
+    affected = sum(r["linhas_afetadas"] for r in reports)
+    table = pd.DataFrame([{"COLUNA": r["coluna"], **v} for r in reports for v in r["valores"]])
+    label = f"Quantidades corrigidas ou rejeitadas na leitura ({affected:,} linhas)".replace(",", ".")
+    with st.expander(label, expanded=False, icon="⚠️"):
+        formats = {r["coluna"]: r["formato"] for r in reports if r.get("formato")}
+        st.caption(
+            f"Até {QUANTITY_REPORT_ROWS} valores distintos por coluna, os mais frequentes. "
+            "Vazios e decimais são ajustados; inválidos e fora do intervalo entram com o VALOR USADO. "
+            + " ".join(f"{c}: formato {'BR (1.234,5)' if f == 'br' else 'internacional (1,234.5)'}." for c, f in formats.items())
+        )
+        st.dataframe(table, hide_index=True, use_container_width=True)
+
 # -----------------------------------------------------------------------------
 # Upload de arquivos
 # -----------------------------------------------------------------------------
-def process_upload(file, expected_type):
+def _count_frame_from_raw(df: pd.DataFrame, dial: dict, seen_tags: SeenTags | None = None) -> pd.DataFrame | None:
+    """
+    Converte as colunas cruas da contagem (lidas como str) em EAN/CONTAGEM
+    (+ ZONA, se o perfil achou a coluna), usando as colunas detectadas pelo
+    perfil. None se não houver colunas.
+    Leitura de EPCs: decodifica SGTIN-96 e conta cada tag uma única vez
+    (estatísticas em df.attrs[EPC_REPORT_ATTR]).
+    """
+    if df.shape[1] == 0:
+        return None
+
+    if dial.get("epc_col") is not None and dial["epc_col"] < df.shape[1]:
+        counts, stats = epc_reads_to_counts(df.iloc[:, dial["epc_col"]], seen_tags)
+        counts.attrs[EPC_REPORT_ATTR] = [stats]
+        return counts
+
+    raw_columns = [df.iloc[:, i] for i in range(df.shape[1])]
+    ean = raw_columns[min(dial["ean_col"], df.shape[1] - 1)]
+    report = None
+    if dial["count_col"] is None or dial["count_col"] >= df.shape[1]:
+        # Só EAN → CONTAGEM=1
+        df = pd.DataFrame({"EAN": ean, "CONTAGEM": 1})
+    else:
+        # EAN, CONTAGEM (quantidade vazia = 1 leitura; inválida = 0, no relatório)
+        qty, report = parse_quantities(
+            raw_columns[dial["count_col"]], default=0, empty=1,
+            column="CONTAGEM", first_line=2 if dial.get("header") else 1,
+        )
+        df = pd.DataFrame({"EAN": ean, "CONTAGEM": qty})
+
+    set_canonical_eans(df, "EAN (contagem)", first_line=2 if dial.get("header") else 1)
+    zone_col = dial.get("zone_col")
+    if zone_col is not None and zone_col < len(raw_columns):
+        df[ZONE_COLUMN] = normalize_zone_names(raw_columns[zone_col].to_numpy())
+    if report is not None:
+        df.attrs[QUANTITY_REPORT_ATTR] = [report]
+    return df
+
+def _parse_count_upload(file, ext: str, compression: str | None, profile_fn=None):
+    """
+    Leitura da contagem sem chamadas ao Streamlit (roda também no processo
+    auxiliar de `parse_uploads_concurrently`). `profile_fn(file, amostra)`
+    permite memoizar o perfil na sessão; padrão: `profile_count_text`.
+    Retorna (df, tipo_detectado, erro).
     """
-    Lê e processa arquivos enviados pelo usuário.
+    if ext not in ["txt", "csv"]:
+        return None, None, "Formato de arquivo não suportado para contagem. Envie .txt ou .csv (ou compactado: .gz, .zip, .zst)."
+
+    def _parse(source, sample):
+        dial = profile_fn(file, sample) if profile_fn else profile_count_text(sample)
+        return pd.read_csv(
+            source,
+            sep=dial["sep"],
+            header=0 if dial["header"] else None,  # RFLog normalmente sem cabeçalho
+            dtype=str,
+            quotechar=dial["quotechar"],
+            doublequote=dial["doublequote"],
+            escapechar=dial["escapechar"],
+        ), dial
+
+    (df, dial), enc_used = read_text_upload(file, compression, _parse)
+
+    df = _count_frame_from_raw(df, dial)
+    if df is None:
+        return None, None, "O arquivo de contagem deve conter uma ou duas colunas."
+
+    header_info = "; cabeçalho" if dial["header"] else ""
+    epc_info = "; EPC SGTIN-96" if dial.get("epc_col") is not None else ""
+    zone_info = ""
+    if ZONE_COLUMN in df.columns:
+        # já consolidado por (EAN, ZONA): o cálculo monta a matriz sem reler as leituras
+        attrs = dict(df.attrs)
+        df = aggregate_zone_counts(df)
+        df.attrs = attrs
+        zone_info = f"; zonas={df[ZONE_COLUMN].nunique()}"
+    return df, f"contagem[{enc_used}; sep={dial['sep']}{header_info}{epc_info}{zone_info}]", None
+
+def read_upload(file, expected_type, sheet: str | None = None):
+    """
+    Lê e processa arquivos enviados pelo usuário, devolvendo o erro em vez de
+    mostrá-lo (o loader do cache compartilhado roda numa sessão só; cada sessão
+    que recebe o resultado mostra a mensagem). A barra de progresso do Excel
+    aparece na sessão que faz a leitura.
     expected_type: 'contagem' | 'estoque_esperado'
-    Retorna (dataframe, tipo_detectado) onde tipo_detectado descreve a origem.
+    sheet: aba do Excel do estoque esperado (padrão: a primeira)
+    Retorna (dataframe, tipo_detectado, erro) onde tipo_detectado descreve a origem.
     """
     if file is None:
-        return None, None
+        return None, None, None
 
     ext = file.name.split(".")[-1].lower()
+    compression = ext if ext in COMPRESSED_EXTENSIONS else None
 
     try:
+        if compression:
+            ext = _inner_extension(file, compression)
+
         # --------- CONTAGEM: .txt/.csv sem cabeçalho; 1 ou 2 colunas ----------
         if expected_type == "contagem":
-            if ext in ["txt", "csv"]:
-                text, enc_used = _read_text_with_fallback(file)
-                dial = detect_csv_dialect(text)
-                df = pd.read_csv(
-                    StringIO(text),
-                    sep=dial["sep"],
-                    header=None,        # contagem não tem cabeçalho
-                    dtype=str,
-                    quotechar=dial["quotechar"],
-                    doublequote=dial["doublequote"],
-                    escapechar=dial["escapechar"],
-                    engine="python",
-                )
-
-                if df.shape[1] == 1:
-                    # Só EAN → CONTAGEM=1
-                    df.columns = ["EAN"]
-                    df["CONTAGEM"] = 1
-                elif df.shape[1] >= 2:
-                    # EAN, CONTAGEM
-                    df = df.iloc[:, :2]
-                    df.columns = ["EAN", "CONTAGEM"]
-                    df["CONTAGEM"] = (
-                        pd.to_numeric(df["CONTAGEM"].str.replace(",", "."), errors="coerce")
-                        .fillna(1)
-                        .astype(int)
-                    )
-                else:
-                    st.error("O arquivo de contagem deve conter uma ou duas colunas.")
-                    return None, None
-
-                df["EAN"] = df["EAN"].astype(str).str.strip()
-                return df, f"contagem[{enc_used}; sep={dial['sep']}]"
-
-            st.error("Formato de arquivo não suportado para contagem. Envie .txt ou .csv.")
-            return None, None
+            return _parse_count_upload(file, ext, compression, get_upload_profile)
 
         # --------- ESTOQUE ESPERADO: CSV (com cabeçalho) ou Excel ----------
         elif expected_type == "estoque_esperado":
             if ext == "csv":
-                text, enc_used = _read_text_with_fallback(file)
-                dial = detect_csv_dialect(text)
-                df = pd.read_csv(
-                    StringIO(text),
-                    sep=dial["sep"],
-                    dtype=str,
-                    header=0,  # tem cabeçalho
-                    quotechar=dial["quotechar"],
-                    doublequote=dial["doublequote"],
-                    escapechar=dial["escapechar"],
-                    engine="python",
-                )
+                def _parse(source, sample):
+                    dial = detect_csv_dialect(sample)
+                    return pd.read_csv(
+                        source,
+                        sep=dial["sep"],
+                        dtype=str,
+                        header=0,  # tem cabeçalho
+                        quotechar=dial["quotechar"],
+                        doublequote=dial["doublequote"],
+                        escapechar=dial["escapechar"],
+                        engine="python",
+                    ), dial
+
+                (df, dial), enc_used = read_text_upload(file, compression, _parse)
                 source_info = f"{enc_used}; sep={dial['sep']}"
             elif ext in ["xlsx", "xls", "xlsb"]:
-                df = process_excel_file(file, ext)
-                source_info = "excel"
+                bar = st.progress(0.0, text=f"Lendo a planilha {file.name}...")
+
+                def _progress(done, total):
+                    if total:
+                        bar.progress(min(done / total, 1.0), text=f"Lendo a planilha {file.name}: {done:,} de ~{total:,} linhas".replace(",", "."))
+                    else:
+                        bar.progress(0.0, text=f"Lendo a planilha {file.name}: {done:,} linhas".replace(",", "."))
+
+                try:
+                    df = process_excel_file(
+                        _spool_decompressed(file, compression) if compression else file, ext,
+                        sheet=sheet, progress=_progress,
+                    )
+                finally:
+                    bar.empty()
+                source_info = "; ".join(
+                    p for p in ("excel", f"aba={sheet}" if sheet else None, compression) if p
+                )
             else:
-                st.error("Formato de arquivo não suportado para estoque esperado.")
-                return None, None
+                return None, None, "Formato de arquivo não suportado para estoque esperado."
 
             # Importante: NÃO obrigamos 'EAN'/'ESTOQUE' aqui;
             # o mapeamento/renomeação acontece na UI do rfdash.py
-            return df, f"estoque_esperado[{source_info}]"
+            return df, f"estoque_esperado[{source_info}]", None
 
-        st.error("Tipo esperado desconhecido.")
-        return None, None
+        return None, None, "Tipo esperado desconhecido."
 
     except pd.errors.EmptyDataError:
-        st.error(f"O arquivo {expected_type} está vazio ou inválido.")
-        return None, None
+        return None, None, f"O arquivo {expected_type} está vazio ou inválido."
     except Exception as e:
-        st.error(f"Falha ao processar o arquivo {expected_type}: {e}")
+        return None, None, f"Falha ao processar o arquivo {expected_type}: {e}"
+
+def process_upload(file, expected_type, sheet: str | None = None):
+    """
+    `read_upload` mostrando o erro, se houver.
+    Retorna (dataframe, tipo_detectado).
+    """
+    df, tipo, erro = read_upload(file, expected_type, sheet=sheet)
+    if erro:
+        st.error(erro)
+    return df, tipo
+
+# -----------------------------------------------------------------------------
+# Leitura simultânea dos dois uploads (processo auxiliar para a contagem)
+# -----------------------------------------------------------------------------
+# padrão: até 2 workers, deixando um núcleo para o servidor (1 núcleo -> leitura sequencial)
+UPLOAD_WORKERS = int(os.environ.get("RFDASH_UPLOAD_WORKERS", str(min(2, (os.cpu_count() or 1) - 1))))
+
+class _BytesUpload(io.BytesIO):
+    """Bytes de um upload com o `name` que `process_upload` usa (lado do worker)."""
+
+    def __init__(self, data: bytes, name: str):
+        super().__init__(data)
+        self.name = name
+
+def _parse_count_in_worker(data: bytes, name: str):
+    file = _BytesUpload(data, name)
+    ext = name.split(".")[-1].lower()
+    compression = ext if ext in COMPRESSED_EXTENSIONS else None
+    try:
+        if compression:
+            ext = _inner_extension(file, compression)
+        return _parse_count_upload(file, ext, compression)
+    except pd.errors.EmptyDataError:
+        return None, None, "O arquivo contagem está vazio ou inválido."
+    except Exception as e:
+        return None, None, f"Falha ao processar o arquivo contagem: {e}"
+
+# o __main__ é do processo todo: esconder/restaurar o script do app é serializado
+_UPLOAD_POOL_LOCK = threading.Lock()
+
+@contextlib.contextmanager
+def _app_main_hidden():
+    """
+    Esconde o script do app durante a criação de workers: o Streamlit executa o
+    rfdash.py como __main__ e o 'spawn' o reexecutaria em cada worker novo.
+    Segura `_UPLOAD_POOL_LOCK` do esconder ao restaurar — sessões simultâneas
+    não intercalam e o __main__ volta sempre ao estado original.
+    """
+    with _UPLOAD_POOL_LOCK:
+        main = sys.modules.get("__main__")
+        saved = {a: main.__dict__[a] for a in ("__file__", "__spec__") if main is not None and a in main.__dict__}
+        try:
+            if main is not None:
+                main.__dict__.pop("__file__", None)
+                main.__spec__ = None
+            yield
+        finally:
+            if main is not None:
+                main.__dict__.update(saved)
+                if "__spec__" not in saved:
+                    main.__dict__.pop("__spec__", None)
+
+@st.cache_resource(show_spinner=False)
+def get_upload_pool():
+    """
+    Pool de processos do servidor para parse de uploads (RFDASH_UPLOAD_WORKERS;
+    0 desliga). 'spawn' evita fork de um servidor com várias threads. Todos os
+    workers sobem aqui, de uma vez (uma tarefa de espera por worker, ninguém fica
+    ocioso antes do último subir): os submits seguintes nunca criam processos.
+    """
+    if UPLOAD_WORKERS <= 0:
+        return None
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    with _app_main_hidden():
+        pool = ProcessPoolExecutor(max_workers=UPLOAD_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        for _ in range(UPLOAD_WORKERS):
+            pool.submit(time.sleep, 0.5)
+    return pool
+
+def _submit_upload_task(pool, fn, *args):
+    """
+    `pool.submit` com o script do app escondido: os workers já subiram em
+    `get_upload_pool`, mas se o executor ainda criar um processo, ele não
+    reexecuta o app.
+    """
+    with _app_main_hidden():
+        return pool.submit(fn, *args)
+
+def parse_uploads_concurrently(
+    estoque_file, estoque_hash: str | None, estoque_sheet: str | None, contagem_file, zone_files=None,
+):
+    """
+    Lê estoque esperado e contagem ao mesmo tempo: a contagem (detecção de
+    encoding/dialeto + parse) vai para o pool de processos — o parser do pandas
+    segura o GIL, então threads não paralelizam — enquanto o estoque é lido aqui,
+    pelo cache compartilhado e com barra de progresso. O tempo até o resumo passa
+    a ser o do maior dos dois. A contagem lida fica na sessão por file_id (com
+    `remember`, entra no orçamento de memória) e não é relida a cada rerun.
+    Com `zone_files` (um arquivo por zona) cada zona vai para um worker.
+    Retorna (estoque_df, estoque_tipo, contagem_df, contagem_tipo).
+    """
+    future = None
+    contagem_df = contagem_tipo = None
+    if contagem_file is not None:
+        file_id = getattr(contagem_file, "file_id", None) or contagem_file.name
+        memo = st.session_state.get("_contagem_upload")
+        if memo is not None and memo[0] == file_id:
+            contagem_df = recall("_contagem_df")
+        if contagem_df is not None:
+            contagem_tipo = memo[1]
+            contagem_df.attrs.update(memo[2])  # o spill em disco não guarda attrs
+        else:
+            st.session_state.pop("_contagem_upload", None)  # sem memo ou spill perdido: relê
+            pool = get_upload_pool()
+            if pool is not None:
+                future = _submit_upload_task(pool, _parse_count_in_worker, contagem_file.getvalue(), contagem_file.name)
+    elif zone_files:
+        zone_futures = submit_zone_uploads(zone_files)
+
+    estoque_df, estoque_tipo = process_expected_upload_shared(estoque_file, estoque_hash, estoque_sheet)
+    if contagem_file is None and zone_files:
+        contagem_df, contagem_tipo = collect_zone_uploads(zone_files, zone_futures)
+
+    if contagem_file is not None and contagem_df is None:
+        erro = None
+        if future is not None:
+            from concurrent.futures.process import BrokenProcessPool
+
+            try:
+                contagem_df, contagem_tipo, erro = future.result()
+            except BrokenProcessPool:
+                get_upload_pool.clear()  # recria o pool no próximo uso
+                future = None
+        if future is None:  # sem pool (ou pool quebrado): lê aqui mesmo
+            contagem_df, contagem_tipo = process_upload(contagem_file, "contagem")
+        elif erro:
+            st.error(erro)
+        if contagem_df is not None:
+            remember("_contagem_df", contagem_df)
+            st.session_state["_contagem_upload"] = (file_id, contagem_tipo, dict(contagem_df.attrs))
+    return estoque_df, estoque_tipo, contagem_df, contagem_tipo
+
+# -----------------------------------------------------------------------------
+# Contagem por zona (salão, estoque, vitrine...)
+# -----------------------------------------------------------------------------
+ZONE_COLUMN = "ZONA"
+ZONE_COUNT_PREFIX = "CONTAGEM "  # colunas por zona no DF de divergências: "CONTAGEM SALAO" etc.
+ZONE_EMPTY_LABEL = "SEM ZONA"
+
+def normalize_zone_names(values) -> np.ndarray:
+    """
+    Nomes de zona padronizados (trim + maiúsculas; vazio -> SEM ZONA).
+    Normaliza só os valores distintos e espalha pelos códigos.
+    """
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    names = [str(u).strip().upper() or ZONE_EMPTY_LABEL for u in uniques] + [ZONE_EMPTY_LABEL]
+    return np.asarray(names, dtype=object)[codes]  # código -1 (nulo) -> último
+
+def zone_name_from_file(name: str) -> str:
+    """Zona de um arquivo 'um por zona': o nome sem extensões (ex.: salao.txt.gz -> SALAO)."""
+    return normalize_zone_names([os.path.basename(name).split(".")[0]])[0]
+
+def aggregate_zone_counts(counted: pd.DataFrame) -> pd.DataFrame:
+    """
+    Consolida a contagem por (EAN, ZONA): uma linha por par, CONTAGEM somada.
+    Chave combinada dos códigos fatorizados + np.bincount (sem groupby de strings).
+    """
+    ean_codes, eans = pd.factorize(counted["EAN"].astype(str))
+    zone_codes, zones = pd.factorize(counted[ZONE_COLUMN])
+    qty = pd.to_numeric(counted["CONTAGEM"], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+    n_zones = max(len(zones), 1)
+    pairs, inverse = np.unique(ean_codes.astype(np.int64) * n_zones + zone_codes, return_inverse=True)
+    totals = np.rint(np.bincount(inverse, weights=qty)).astype(np.int64)
+    return pd.DataFrame({
+        "EAN": pd.Series(np.asarray(eans, dtype=object)[pairs // n_zones], dtype=counted["EAN"].dtype),
+        ZONE_COLUMN: np.asarray(zones, dtype=object)[pairs % n_zones],
+        "CONTAGEM": totals,
+    })
+
+def zone_count_matrix(counted: pd.DataFrame) -> pd.DataFrame:
+    """
+    Matriz EAN x zona (índice EAN, uma coluna por zona em ordem alfabética)
+    a partir da contagem com coluna ZONA, já consolidada ou não.
+    """
+    ean_codes, eans = pd.factorize(counted["EAN"].astype(str))
+    zone_codes, zones = pd.factorize(counted[ZONE_COLUMN], sort=True)
+    qty = pd.to_numeric(counted["CONTAGEM"], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+    cells = np.bincount(
+        ean_codes.astype(np.int64) * len(zones) + zone_codes,
+        weights=qty, minlength=len(eans) * len(zones),
+    )
+    matrix = np.rint(cells).astype(np.int64).reshape(len(eans), len(zones))
+    return pd.DataFrame(matrix, index=pd.Index(eans, name="EAN"), columns=list(zones))
+
+def zone_columns(df: pd.DataFrame) -> list:
+    """Colunas de contagem por zona de um DF de divergências."""
+    return [c for c in df.columns if isinstance(c, str) and c.startswith(ZONE_COUNT_PREFIX)]
+
+def zone_summary(discrepancies: pd.DataFrame) -> pd.DataFrame:
+    """
+    Resumo por zona: peças e EANs lidos, participação na contagem e quanto da
+    leitura da zona caiu em EANs com divergência (total) ou só lidos ali.
+    Vazio se a contagem não tem zonas.
+    """
+    cols = zone_columns(discrepancies)
+    if not cols:
+        return pd.DataFrame()
+    counts = discrepancies[cols].to_numpy(dtype=np.int64)
+    divergent = discrepancies["DIVERGÊNCIA"].to_numpy() != 0
+    seen = counts > 0
+    only_here = seen & (seen.sum(axis=1) == 1)[:, None]
+    pieces = counts.sum(axis=0)
+    return pd.DataFrame({
+        "ZONA": [c[len(ZONE_COUNT_PREFIX):] for c in cols],
+        "PEÇAS LIDAS": pieces,
+        "EANs LIDOS": seen.sum(axis=0),
+        "% DA CONTAGEM": np.round(100 * pieces / max(int(pieces.sum()), 1), 1),
+        "PEÇAS EM EANs DIVERGENTES": counts[divergent].sum(axis=0),
+        "EANs SÓ NESTA ZONA": only_here.sum(axis=0),
+    })
+
+def _zone_shard(df: pd.DataFrame, zone: str) -> pd.DataFrame:
+    """Contagem de um arquivo da zona `zone` consolidada por (EAN, ZONA); uma coluna ZONA do arquivo prevalece."""
+    if ZONE_COLUMN in df.columns:
+        return df
+    shard = aggregate_zone_counts(df.assign(**{ZONE_COLUMN: zone}))
+    shard.attrs = dict(df.attrs)
+    return shard
+
+def _parse_zone_in_worker(data: bytes, name: str):
+    df, tipo, erro = _parse_count_in_worker(data, name)
+    return (_zone_shard(df, zone_name_from_file(name)) if df is not None else None), tipo, erro
+
+def submit_zone_uploads(files) -> list:
+    """
+    Envia cada arquivo de zona ao pool de processos (parse + consolidação
+    da zona no worker, em paralelo). Lista vazia = sem pool ou já lidos na sessão.
+    """
+    memo = st.session_state.get("_zone_upload")
+    if not files or (memo is not None and memo[0] == _zone_upload_ids(files)):
+        return []
+    pool = get_upload_pool()
+    if pool is None:
+        return []
+    return [_submit_upload_task(pool, _parse_zone_in_worker, f.getvalue(), f.name) for f in files]
+
+def _zone_upload_ids(files) -> tuple:
+    return tuple(getattr(f, "file_id", None) or f.name for f in files)
+
+def collect_zone_uploads(files, futures: list):
+    """
+    Junta as zonas (de `submit_zone_uploads`; sem pool, lê aqui mesmo) numa
+    contagem consolidada por (EAN, ZONA), memorizada na sessão como a contagem
+    de arquivo único. Retorna (contagem_df, tipo_detectado).
+    """
+    ids = _zone_upload_ids(files)
+    memo = st.session_state.get("_zone_upload")
+    counted = recall("_zone_df") if memo is not None and memo[0] == ids else None
+    if counted is not None:
+        counted.attrs.update(memo[2])
+        return counted, memo[1]
+    st.session_state.pop("_zone_upload", None)
+
+    from concurrent.futures.process import BrokenProcessPool
+
+    shards, reports, ean_reports, epc_reports = [], [], [], []
+    for i, file in enumerate(files):
+        df = erro = None
+        if i < len(futures):
+            try:
+                df, _, erro = futures[i].result()
+            except BrokenProcessPool:
+                get_upload_pool.clear()
+                futures = []
+        if i >= len(futures):
+            df, _ = process_upload(file, "contagem")
+            df = _zone_shard(df, zone_name_from_file(file.name)) if df is not None else None
+        if erro:
+            st.error(f"{file.name}: {erro}")
+        if df is not None:
+            reports += [{**r, "coluna": f"CONTAGEM ({file.name})"} for r in df.attrs.get(QUANTITY_REPORT_ATTR, [])]
+            ean_reports += [{**r, "coluna": f"EAN ({file.name})"} for r in df.attrs.get(EAN_REPORT_ATTR, [])]
+            epc_reports += [{**r, "coluna": file.name} for r in df.attrs.get(EPC_REPORT_ATTR, [])]
+            shards.append(df)
+    if not shards:
         return None, None
 
+    counted = aggregate_zone_counts(pd.concat(shards, ignore_index=True))
+    counted.attrs = {QUANTITY_REPORT_ATTR: reports, EAN_REPORT_ATTR: ean_reports, EPC_REPORT_ATTR: epc_reports}
+    zones = sorted(counted[ZONE_COLUMN].unique())
+    tipo = f"contagem por zona[{len(shards)} arquivo(s); zonas={', '.join(zones)}]"
+    remember("_zone_df", counted)
+    st.session_state["_zone_upload"] = (ids, tipo, dict(counted.attrs))
+    return counted, tipo
+
+# -----------------------------------------------------------------------------
+# Cache compartilhado entre sessões (estoque esperado)
+# -----------------------------------------------------------------------------
+SHARED_CATALOG_MAX_MB = int(os.environ.get("RFDASH_SHARED_CATALOG_MB", "1024"))
+SHARED_CATALOG_REF_TTL = int(os.environ.get("RFDASH_SHARED_CATALOG_REF_TTL", "3600"))
+
+class SharedCatalogCache:
+    """
+    Cache do processo (compartilhado por todas as sessões) para os DataFrames do
+    estoque esperado, chaveado por hash do arquivo + mapeamento de colunas.
+    - Os DataFrames são SOMENTE LEITURA: quem precisar alterar deve copiar.
+    - Contagem de referências por sessão/slot: cada sessão segura no máximo uma
+      entrada por slot; trocar de arquivo libera a anterior. Referências não
+      renovadas em `ref_ttl` segundos (sessão fechada) deixam de contar.
+    - Acima de `max_bytes`, remove as entradas sem referência, da menos usada
+      para a mais usada (LRU).
+    """
+
+    def __init__(self, max_bytes: int, ref_ttl: float):
+        self.max_bytes = max_bytes
+        self.ref_ttl = ref_ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> {"value", "nbytes"}
+        self._refs = {}                 # (session_id, slot) -> (key, last_seen)
+        self._loading = {}              # key -> {"lock", "failed"} (evita parse duplicado simultâneo)
+        self.hits = 0
+        self.misses = 0
+
+    def acquire(self, key, session_id: str, slot: str, loader):
+        """
+        Devolve o valor de `key`, carregando com `loader()` na primeira vez.
+        `loader` retorna (df, info, ...); resultados com df None (erro de leitura,
+        que o loader devolve no próprio valor) não são guardados, mas chegam
+        também às sessões que esperavam a mesma carga — assim como uma exceção
+        do loader, relançada em cada uma. A próxima chamada tenta de novo.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                self._refs[(session_id, slot)] = (key, time.time())
+                return entry["value"]
+            loading = self._loading.setdefault(key, {"lock": threading.Lock(), "failed": None})
+
+        with loading["lock"]:
+            if loading["failed"] is not None:
+                kind, result = loading["failed"]
+                if kind == "error":
+                    raise result
+                return result
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is None:
+                try:
+                    value = loader()
+                    if value is not None and value[0] is not None:
+                        entry = {"value": value, "nbytes": int(value[0].memory_usage(deep=True).sum())}
+                except Exception as e:
+                    loading["failed"] = ("error", e)
+                    raise
+                finally:
+                    # sempre sai de _loading (também em exceção ou rerun no meio da carga)
+                    with self._lock:
+                        if entry is not None:
+                            self.misses += 1
+                            self._entries[key] = entry
+                            self._refs[(session_id, slot)] = (key, time.time())
+                            self._evict_locked()
+                        self._loading.pop(key, None)
+                if entry is None:
+                    loading["failed"] = ("value", value)
+                    return value
+                return entry["value"]
+
+        with self._lock:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            self._refs[(session_id, slot)] = (key, time.time())
+        return entry["value"]
+
+    def release(self, session_id: str, slot: str | None = None):
+        """
+        Libera a referência de um slot da sessão (ou de todos, com slot=None).
+        """
+        with self._lock:
+            for ref in [r for r in self._refs if r[0] == session_id and (slot is None or r[1] == slot)]:
+                del self._refs[ref]
+            self._evict_locked()
+
+    def _live_keys_locked(self) -> dict:
+        now = time.time()
+        live = {}
+        for ref, (key, seen) in list(self._refs.items()):
+            if now - seen > self.ref_ttl:
+                del self._refs[ref]
+            else:
+                live[key] = live.get(key, 0) + 1
+        return live
+
+    def _evict_locked(self):
+        total = sum(e["nbytes"] for e in self._entries.values())
+        if total <= self.max_bytes:
+            return
+        live = self._live_keys_locked()
+        for key in list(self._entries):  # do menos para o mais recente
+            if total <= self.max_bytes:
+                break
+            if key not in live:
+                total -= self._entries.pop(key)["nbytes"]
+
+    def stats(self) -> dict:
+        with self._lock:
+            live = self._live_keys_locked()
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(e["nbytes"] for e in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "refs": sum(live.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+@st.cache_resource(show_spinner=False)
+def get_shared_catalog_cache() -> SharedCatalogCache:
+    return SharedCatalogCache(SHARED_CATALOG_MAX_MB * 1024 * 1024, SHARED_CATALOG_REF_TTL)
+
+def _current_session_id() -> str:
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "bare"
+
+def file_content_hash(file) -> str | None:
+    """
+    Hash do conteúdo do upload, memoizado na sessão pelo file_id do Streamlit
+    (evita reler/re-hashear o arquivo inteiro a cada rerun).
+    """
+    if file is None:
+        return None
+    file_id = getattr(file, "file_id", None)
+    memo = st.session_state.setdefault("_upload_hashes", {})
+    if file_id is not None and file_id in memo:
+        return memo[file_id]
+    digest = gerar_hash(file)
+    if file_id is not None:
+        memo[file_id] = digest
+    return digest
+
+def process_expected_upload_shared(file, file_hash: str | None, sheet: str | None = None):
+    """
+    `process_upload` do estoque esperado via cache compartilhado: sessões que
+    enviam o mesmo arquivo (e aba) reaproveitam o mesmo DataFrame (somente leitura).
+    """
+    cache = get_shared_catalog_cache()
+    session_id = _current_session_id()
+    if file is None:
+        cache.release(session_id)
+        return None, None
+    df, tipo, erro = cache.acquire(
+        ("raw", file_hash, sheet), session_id, "estoque_raw",
+        lambda: read_upload(file, "estoque_esperado", sheet=sheet),
+    )
+    if erro:
+        st.error(erro)
+    return df, tipo
+
+def standardize_expected_shared(
+    df: pd.DataFrame, mapping: dict, file_hash: str | None, sheet: str | None = None
+) -> pd.DataFrame:
+    """
+    `standardize_expected_df` via cache compartilhado (chave: hash + aba + mapeamento).
+    Erros de mapeamento continuam sendo levantados como ValueError.
+    """
+    key = ("std", file_hash, sheet, mapping.get("EAN"), mapping.get("ESTOQUE"))
+    value = get_shared_catalog_cache().acquire(
+        key, _current_session_id(), "estoque_std",
+        lambda: (standardize_expected_df(df, mapping), None),
+    )
+    return value[0]
+
+# -----------------------------------------------------------------------------
+# Snapshots locais (Arrow IPC, leitura via memory-map)
+# -----------------------------------------------------------------------------
+SNAPSHOT_DIR = os.environ.get("RFDASH_SNAPSHOT_DIR", "snapshots")
+SNAPSHOT_KINDS = ("estoque", "contagem")
+# escopo: namespace da instalação + loja da URL (?loja=...); cada escopo só vê os próprios snapshots
+SNAPSHOT_NAMESPACE = os.environ.get("RFDASH_SNAPSHOT_NAMESPACE", "")
+SNAPSHOT_STORE_PARAM = "loja"
+# retenção por escopo e tipo: os mais recentes até SNAPSHOT_KEEP, nenhum mais velho que SNAPSHOT_MAX_DAYS
+SNAPSHOT_KEEP = int(os.environ.get("RFDASH_SNAPSHOT_KEEP", "20"))
+SNAPSHOT_MAX_DAYS = float(os.environ.get("RFDASH_SNAPSHOT_MAX_DAYS", "30"))
+
+def aggregate_counts(counted: pd.DataFrame, by_zone: bool = False) -> pd.DataFrame:
+    """
+    Consolida a contagem por EAN (uma linha por EAN, CONTAGEM somada).
+    by_zone=True mantém a quebra por (EAN, ZONA) quando a contagem tem zonas.
+    """
+    if by_zone and ZONE_COLUMN in counted.columns:
+        return aggregate_zone_counts(counted)
+    out = counted[["EAN", "CONTAGEM"]].copy()
+    out["EAN"] = out["EAN"].astype(str)
+    out["CONTAGEM"] = pd.to_numeric(out["CONTAGEM"], errors="coerce").fillna(0).astype(int)
+    return out.groupby("EAN", as_index=False, sort=False)["CONTAGEM"].sum()
+
+def _scope_slug(text: str) -> str:
+    return re.sub(r"[^\w-]+", "_", _unidecode(str(text or "")).strip()).strip("_")
+
+def snapshot_scope() -> str:
+    """
+    Escopo dos snapshots desta sessão: "<namespace>/<loja>" (RFDASH_SNAPSHOT_NAMESPACE
+    e ?loja= na URL; sem eles, "geral"). Cada escopo tem sua própria pasta.
+    """
+    namespace = _scope_slug(SNAPSHOT_NAMESPACE) or "geral"
+    store = _scope_slug(st.query_params.get(SNAPSHOT_STORE_PARAM, "")) or "geral"
+    return f"{namespace}/{store}"
+
+def _snapshot_base(kind: str, scope: str) -> str:
+    if kind not in SNAPSHOT_KINDS:
+        raise ValueError(f"Snapshot inválido: {kind}")
+    return os.path.join(SNAPSHOT_DIR, *(_scope_slug(p) or "geral" for p in scope.split("/")), kind)
+
+def _snapshot_path(kind: str, snap_id: str, scope: str) -> str:
+    if os.sep in snap_id or "/" in snap_id or snap_id.startswith("."):
+        raise ValueError(f"Snapshot inválido: {kind}/{snap_id}")
+    return os.path.join(_snapshot_base(kind, scope), snap_id)
+
+def _snapshot_expired(meta: dict, now: datetime) -> bool:
+    try:
+        created = datetime.fromisoformat(meta.get("created", ""))
+    except ValueError:
+        return True
+    return (now - created).total_seconds() > SNAPSHOT_MAX_DAYS * 86400
+
+def prune_snapshots(kind: str, scope: str) -> int:
+    """
+    Retenção do escopo: apaga os snapshots vencidos (SNAPSHOT_MAX_DAYS) e os
+    que passam de SNAPSHOT_KEEP (os mais antigos). Retorna quantos apagou.
+    """
+    now = datetime.now()
+    base = _snapshot_base(kind, scope)
+    metas = _read_snapshot_metas(base)
+    keep = {m["id"] for m in metas[:SNAPSHOT_KEEP] if not _snapshot_expired(m, now)}
+    removed = 0
+    for snap_id in os.listdir(base) if os.path.isdir(base) else []:
+        if snap_id not in keep:
+            shutil.rmtree(os.path.join(base, snap_id), ignore_errors=True)
+            removed += 1
+    return removed
+
+def save_snapshot(
+    df: pd.DataFrame,
+    kind: str,
+    name: str,
+    mapping: dict | None = None,
+    source_hash: str | None = None,
+    scope: str | None = None,
+) -> str:
+    """
+    Salva o DataFrame (já padronizado/consolidado) como Arrow IPC sem compressão
+    (permite memory-map na leitura) + meta.json com nome, mapeamento e origem,
+    no escopo `scope` (padrão: `snapshot_scope()`), e aplica a retenção.
+    Retorna o id do snapshot.
+    """
+    scope = scope or snapshot_scope()
+    import pyarrow as pa
+
+    slug = re.sub(r"[^\w.-]+", "_", _unidecode(os.path.splitext(name)[0])).strip("_") or kind
+    snap_id = f"{datetime.now():%Y%m%d_%H%M%S}_{slug}_{(source_hash or '')[:8]}".rstrip("_")
+    path = _snapshot_path(kind, snap_id, scope)
+    os.makedirs(path, exist_ok=True)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(os.path.join(path, "data.arrow"), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    meta = {
+        "id": snap_id,
+        "kind": kind,
+        "name": name,
+        "mapping": mapping or {},
+        "source_hash": source_hash,
+        "rows": int(len(df)),
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    prune_snapshots(kind, scope)
+    return snap_id
+
+def _read_snapshot_metas(base: str) -> list:
+    if not os.path.isdir(base):
+        return []
+    metas = []
+    for snap_id in os.listdir(base):
+        try:
+            with open(os.path.join(base, snap_id, "meta.json"), encoding="utf-8") as f:
+                metas.append(json.load(f))
+        except (OSError, json.JSONDecodeError):
+            continue
+    return sorted(metas, key=lambda m: m.get("created", ""), reverse=True)
+
+def list_snapshots(kind: str, scope: str | None = None) -> list:
+    """
+    Metadados dos snapshots de um tipo no escopo (padrão: `snapshot_scope()`),
+    do mais recente para o mais antigo; vencidos não aparecem.
+    """
+    now = datetime.now()
+    metas = _read_snapshot_metas(_snapshot_base(kind, scope or snapshot_scope()))
+    return [m for m in metas[:SNAPSHOT_KEEP] if not _snapshot_expired(m, now)]
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def load_snapshot(kind: str, snap_id: str, scope: str):
+    """
+    Reabre um snapshot do escopo via memory-map (sem re-parse). Retorna (df, meta).
+    O DataFrame é compartilhado entre sessões: trate como somente leitura.
+    """
+    import pyarrow as pa
+
+    path = _snapshot_path(kind, snap_id, scope)
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    with pa.memory_map(os.path.join(path, "data.arrow"), "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas(), meta
+
+def pick_snapshot_ui(kind: str, key: str) -> str | None:
+    """
+    Selectbox para reabrir um snapshot salvo. Retorna o id escolhido (ou None).
+    """
+    metas = list_snapshots(kind)
+    if not metas:
+        return None
+    options = [None] + [m["id"] for m in metas]
+    labels = {m["id"]: f"{m['name']} — {m['created'].replace('T', ' ')} ({m['rows']} linhas)" for m in metas}
+    return st.selectbox(
+        "Ou reabra um snapshot salvo:",
+        options,
+        format_func=lambda i: "—" if i is None else labels[i],
+        key=key,
+    )
+
+# -----------------------------------------------------------------------------
+# Análise compartilhável (divergências + manifesto num único arquivo)
+# -----------------------------------------------------------------------------
+ANALYSIS_BUNDLE_VERSION = 1
+ANALYSIS_BUNDLE_SUFFIX = ".rfdash.zip"
+ANALYSIS_COMPRESSION = os.environ.get("RFDASH_ANALYSIS_COMPRESSION", "zstd")  # "zstd" | "lz4"
+
+def export_analysis_bundle(discrepancies: pd.DataFrame, manifest: dict) -> bytes:
+    """
+    Empacota uma análise pronta para reabrir em outra sessão: o DF de divergências
+    em Arrow IPC com compressão por coluna (zstd) + manifest.json (nomes dos
+    arquivos, mapeamento, filtro rápido, colunas do PDF...). O zip só armazena:
+    as colunas já vão comprimidas.
+    """
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(discrepancies, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    options = pa.ipc.IpcWriteOptions(compression=ANALYSIS_COMPRESSION)
+    with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+
+    manifest = {
+        **manifest,
+        "version": ANALYSIS_BUNDLE_VERSION,
+        "rows": int(len(discrepancies)),
+        "columns": [str(c) for c in discrepancies.columns],
+        "created": datetime.now().isoformat(timespec="seconds"),
+    }
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as zf:
+        zf.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+        zf.writestr("discrepancies.arrow", sink.getvalue().to_pybytes())
+    return buf.getvalue()
+
+def load_analysis_bundle(file) -> tuple[pd.DataFrame, dict]:
+    """
+    Reabre um pacote de `export_analysis_bundle` (bytes ou arquivo enviado).
+    Retorna (discrepancies, manifest); ValueError se o arquivo não for um pacote válido.
+    """
+    import pyarrow as pa
+
+    try:
+        with zipfile.ZipFile(BytesIO(file) if isinstance(file, bytes) else file) as zf:
+            manifest = json.loads(zf.read("manifest.json"))
+            data = zf.read("discrepancies.arrow")
+    except (zipfile.BadZipFile, KeyError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError("O arquivo não é uma análise exportada pelo rfdash.") from e
+    if manifest.get("version", 0) > ANALYSIS_BUNDLE_VERSION:
+        raise ValueError("Análise exportada por uma versão mais nova do rfdash.")
+    table = pa.ipc.open_file(pa.py_buffer(data)).read_all()
+    return table.to_pandas(), manifest
+
+def open_analysis_upload(file):
+    """
+    `load_analysis_bundle` memoizado na sessão por upload (file_id).
+    Retorna (discrepancies, manifest, nova) — `nova` é True só na primeira
+    abertura do arquivo, para restaurar filtro rápido e colunas do PDF uma vez.
+    Em erro, mostra a mensagem e retorna (None, None, False).
+    """
+    file_id = getattr(file, "file_id", None) or file.name
+    memo = st.session_state.get("_analysis_upload")
+    known = memo is not None and memo[0] == file_id
+    df = recall("_analysis_df") if known else None
+    if df is not None:
+        return df, memo[1], False
+    try:
+        df, manifest = load_analysis_bundle(file)
+    except ValueError as e:
+        st.error(str(e))
+        return None, None, False
+    remember("_analysis_df", df)
+    st.session_state["_analysis_upload"] = (file_id, manifest)
+    return df, manifest, not known  # spill perdido: relido, sem restaurar filtros de novo
+
+# -----------------------------------------------------------------------------
+# Memória por sessão (contabilidade, orçamento e spill para disco)
+# -----------------------------------------------------------------------------
+SESSION_MEMORY_MB = float(os.environ.get("RFDASH_SESSION_MEMORY_MB", "256"))
+SESSION_STALE_SECONDS = float(os.environ.get("RFDASH_SESSION_STALE_SECONDS", "300"))
+SESSION_SPILL_DIR = os.environ.get("RFDASH_SPILL_DIR", os.path.join(tempfile.gettempdir(), "rfdash_spill"))
+# sessão sem rerun há mais que isso sai do registro; spills sem uso há mais que isso são apagados
+SESSION_REGISTRY_TTL = int(os.environ.get("RFDASH_SESSION_REGISTRY_TTL", "3600"))
+PDF_CACHE_ENTRIES = int(os.environ.get("RFDASH_PDF_CACHE_ENTRIES", "4"))
+PDF_CACHE_TTL = int(os.environ.get("RFDASH_PDF_CACHE_TTL", "600"))
+
+class SpilledFrame:
+    """
+    Marcador guardado no session_state no lugar de um DataFrame enviado para o
+    disco (Arrow IPC). `load()` reabre via memory-map.
+    """
+
+    def __init__(self, path: str, rows: int, nbytes: int):
+        self.path = path
+        self.rows = rows
+        self.nbytes = nbytes
+
+    def load(self) -> pd.DataFrame:
+        import pyarrow as pa
+
+        with pa.memory_map(self.path, "r") as source:
+            return pa.ipc.open_file(source).read_all().to_pandas()
+
+def _object_nbytes(value) -> int:
+    """Tamanho aproximado em memória dos objetos que as sessões costumam guardar."""
+    if isinstance(value, SpilledFrame):
+        return 0
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, LiveCountIngestor):
+        return _object_nbytes(value.counts) + _object_nbytes(value.zone_counts) + value.seen_tags.nbytes
+    if isinstance(value, RecountReconciler):
+        return _object_nbytes(value.disc)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(sys.getsizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+def remember(name: str, value):
+    """Guarda `value` no session_state registrando o último acesso (para o LRU)."""
+    st.session_state[name] = value
+    st.session_state.setdefault("_mem_access", {})[name] = time.time()
+
+def recall(name: str, default=None):
+    """
+    Lê do session_state; se o objeto foi enviado para o disco, recarrega
+    (e volta a contá-lo na memória da sessão). Arquivo do spill perdido (limpeza
+    da pasta temporária, poda) conta como ausência: a chave sai da sessão e
+    volta `default` — quem chamou relê a origem.
+    """
+    value = st.session_state.get(name, default)
+    if isinstance(value, SpilledFrame):
+        try:
+            value = value.load()
+        except OSError:
+            st.session_state.pop(name, None)
+            st.session_state.get("_mem_access", {}).pop(name, None)
+            return default
+        remember(name, value)
+    elif name in st.session_state:
+        st.session_state.setdefault("_mem_access", {})[name] = time.time()
+    return value
+
+def _spill_folder(session_id: str) -> str:
+    return os.path.join(SESSION_SPILL_DIR, re.sub(r"[^\w-]+", "_", session_id))
+
+def _spill_frame(session_id: str, name: str, df: pd.DataFrame) -> SpilledFrame | None:
+    import pyarrow as pa
+
+    folder = _spill_folder(session_id)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, re.sub(r"[^\w-]+", "_", name) + ".arrow")
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return None  # colunas com tipos mistos: fica na memória
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return SpilledFrame(path, len(df), _object_nbytes(df))
+
+@st.cache_resource(show_spinner=False)
+def get_session_memory_registry() -> dict:
+    """
+    Pegada de memória de cada sessão ativa do processo (para a visão de admin):
+    só números (bytes, spilled, seen) — nenhuma referência ao estado das sessões.
+    """
+    return {"lock": threading.Lock(), "sessions": {}, "pruned": 0.0}
+
+def session_memory_report(extra: dict | None = None) -> list:
+    """
+    Objetos da sessão atual com tamanho, estado (memória/disco) e tempo ocioso.
+    `extra` soma itens que a sessão segura fora do session_state (ex.: uploads),
+    apenas contabilizados, nunca despejados.
+    """
+    now = time.time()
+    access = st.session_state.get("_mem_access", {})
+    rows = []
+    for name, value in st.session_state.items():
+        if str(name).startswith("_mem_"):
+            continue
+        spilled = isinstance(value, SpilledFrame)
+        rows.append({
+            "objeto": str(name),
+            "tipo": type(value).__name__,
+            "bytes": value.nbytes if spilled else _object_nbytes(value),
+            "local": "disco" if spilled else "memória",
+            "ocioso_s": round(now - access[name], 1) if name in access else None,
+        })
+    for name, nbytes in (extra or {}).items():
+        rows.append({"objeto": name, "tipo": "upload", "bytes": int(nbytes or 0), "local": "memória", "ocioso_s": None})
+    return sorted(rows, key=lambda r: r["bytes"], reverse=True)
+
+def _evict_session_values(state, session_id: str, now: float, budget: float | None, extra_bytes: int = 0) -> tuple:
+    """
+    Despeja objetos do session_state da sessão atual. Ociosos há mais de
+    SESSION_STALE_SECONDS saem sempre; com `budget`, os demais saem do menos
+    para o mais recente até caber.
+    DataFrames vão para o disco (SpilledFrame); bytes (PDFs) são descartados.
+    Retorna (bytes em memória, bytes em disco).
+    """
+    access = state["_mem_access"] if "_mem_access" in state else {}
+    candidates = sorted(
+        (n for n in list(access) if n in state and isinstance(state[n], (pd.DataFrame, bytes, bytearray))),
+        key=lambda n: access[n],
+    )
+
+    def _evict(name):
+        value = state[name]
+        if isinstance(value, pd.DataFrame):
+            spilled = _spill_frame(session_id, name, value)
+            if spilled is not None:
+                state[name] = spilled
+        else:
+            del state[name]
+            access.pop(name, None)
+
+    for name in candidates:
+        if now - access[name] > SESSION_STALE_SECONDS:
+            _evict(name)
+
+    values = dict(state)
+    total = extra_bytes + sum(_object_nbytes(v) for k, v in values.items() if not str(k).startswith("_mem_"))
+    for name in candidates:
+        if budget is None or total <= budget:
+            break
+        value = state[name] if name in state else None
+        if isinstance(value, (pd.DataFrame, bytes, bytearray)):
+            total -= _object_nbytes(value)
+            _evict(name)
+    values = dict(state)
+    spilled = sum(v.nbytes for v in values.values() if isinstance(v, SpilledFrame))
+    return total, spilled
+
+def _prune_spill_folders(now: float, active: set):
+    """
+    Apaga pastas de spill órfãs: de sessões fora do registro (encerradas ou
+    ociosas há mais de SESSION_REGISTRY_TTL) e sem escrita há mais que isso.
+    """
+    try:
+        entries = list(os.scandir(SESSION_SPILL_DIR))
+    except OSError:
+        return
+    keep = {os.path.basename(_spill_folder(sid)) for sid in active}
+    for entry in entries:
+        try:
+            if entry.is_dir() and entry.name not in keep and now - entry.stat().st_mtime > SESSION_REGISTRY_TTL:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except OSError:
+            continue
+
+def enforce_session_budget(extra: dict | None = None) -> dict:
+    """
+    Aplica o orçamento de memória (SESSION_MEMORY_MB) à sessão atual — cada
+    sessão só mexe no próprio estado, a cada rerun — e registra a pegada dela
+    para a visão de admin. Sessões sem rerun há mais de SESSION_REGISTRY_TTL
+    saem do registro; pastas de spill órfãs são apagadas por idade (no máximo
+    uma varredura por minuto no processo).
+    """
+    session_id = _current_session_id()
+    st.session_state.setdefault("_mem_access", {})
+    now = time.time()
+    budget = SESSION_MEMORY_MB * 1024 * 1024
+    total, spilled = _evict_session_values(
+        st.session_state, session_id, now, budget, sum(int(v or 0) for v in (extra or {}).values()),
+    )
+
+    registry = get_session_memory_registry()
+    with registry["lock"]:
+        sessions = registry["sessions"]
+        sessions[session_id] = {"bytes": total, "spilled": spilled, "seen": now}
+        for sid in [sid for sid, info in sessions.items() if now - info["seen"] > SESSION_REGISTRY_TTL]:
+            del sessions[sid]
+        prune = now - registry["pruned"] > 60
+        if prune:
+            registry["pruned"] = now
+            active = set(sessions)
+    if prune:
+        _prune_spill_folders(now, active)
+    return {"bytes": total, "spilled": spilled, "budget": budget}
+
+def _process_rss_bytes() -> int | None:
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+def show_memory_debug(extra: dict | None = None):
+    """
+    Visão de admin/debug (sidebar): pegada da sessão atual, orçamento, sessões
+    ativas do processo e cache compartilhado do estoque. Aparece com
+    RFDASH_ADMIN=1 ou com ?debug=1 na URL.
+    """
+    if os.environ.get("RFDASH_ADMIN") != "1" and st.query_params.get("debug") != "1":
+        return
+    def mb(n):
+        return f"{(n or 0) / 1024 / 1024:,.1f} MB".replace(",", "X").replace(".", ",").replace("X", ".")
+
+    with st.sidebar.expander("Memória (admin)", expanded=False, icon="🧮"):
+        report = session_memory_report(extra)
+        in_memory = sum(r["bytes"] for r in report if r["local"] == "memória")
+        st.caption(f"Sessão atual: {mb(in_memory)} de {mb(SESSION_MEMORY_MB * 1024 * 1024)}")
+        st.dataframe(pd.DataFrame(report), hide_index=True, use_container_width=True)
+
+        registry = get_session_memory_registry()
+        with registry["lock"]:
+            sessions = dict(registry["sessions"])
+        catalog = get_shared_catalog_cache().stats()
+        st.caption(
+            f"Processo: RSS {mb(_process_rss_bytes())} | {len(sessions)} sessão(ões) ativas, "
+            f"{mb(sum(s['bytes'] for s in sessions.values()))} em memória e "
+            f"{mb(sum(s['spilled'] for s in sessions.values()))} em disco"
+        )
+        st.caption(
+            f"Estoque compartilhado: {catalog['entries']} entrada(s), {mb(catalog['bytes'])} "
+            f"de {mb(catalog['max_bytes'])} | {catalog['refs']} referência(s) | "
+            f"acertos {catalog['hits']} / cargas {catalog['misses']}"
+        )
+
 # -----------------------------------------------------------------------------
 # AgGrid / Tabela
 # -----------------------------------------------------------------------------
@@ -249,7 +2258,7 @@ def configurar_colunas_com_filtros_dinamicos(gb, df):
     numero_keywords = ["ESTOQUE", "CONTAGEM", "DIVERGÊNCIA", "DIVERGENCIA", "RELIDAS", "QUANTIDADE"]
 
     for col in df.columns:
-        col_norm = unidecode.unidecode(col).upper()
+        col_norm = _unidecode(col).upper()
         if any(k in col_norm for k in texto_keywords):
             gb.configure_column(col, filter="agTextColumnFilter")
         elif any(k in col_norm for k in numero_keywords):
@@ -257,22 +2266,100 @@ def configurar_colunas_com_filtros_dinamicos(gb, df):
         else:
             gb.configure_column(col, filter="agTextColumnFilter")
 
+def _status_labels(div: np.ndarray) -> np.ndarray:
+    return np.select([div > 0, div < 0], ["➕ SOBRA", "➖ FALTA"], default="✅ OK")
+
 def adicionar_status_visual(df: pd.DataFrame) -> pd.DataFrame:
-    if "DIVERGÊNCIA" in df.columns:
-        df["STATUS"] = df["DIVERGÊNCIA"].apply(lambda x: "➕ SOBRA" if x > 0 else ("➖ FALTA" if x < 0 else "✅ OK"))
-    elif "DIVERGENCIA" in df.columns:
-        df["STATUS"] = df["DIVERGENCIA"].apply(lambda x: "➕ SOBRA" if x > 0 else ("➖ FALTA" if x < 0 else "✅ OK"))
+    div_col = "DIVERGÊNCIA" if "DIVERGÊNCIA" in df.columns else ("DIVERGENCIA" if "DIVERGENCIA" in df.columns else None)
+    if div_col is not None:
+        div = pd.to_numeric(df[div_col], errors="coerce").to_numpy()
+        df["STATUS"] = _status_labels(div)
     else:
         df["STATUS"] = "N/A"
     return df
 
-def apply_quick_filter(df: pd.DataFrame, mode: str) -> pd.DataFrame:
+# -----------------------------------------------------------------------------
+# Índice de facetas (filtro rápido + opções dos filtros de conjunto)
+# -----------------------------------------------------------------------------
+def rows_signature(result_key, df: pd.DataFrame) -> tuple:
+    """
+    Chave de cache de um recorte do DF de divergências `result_key` (hash dos
+    arquivos + mapeamento, versão do ao vivo/recontagem — montada no rfdash.py):
+    o resultado mais as posições das linhas do recorte. Hasheia só o índice,
+    não o conteúdo — os caches abaixo não pagam o hash do DF inteiro a cada rerun.
+    """
+    index = df.index
+    if pd.api.types.is_integer_dtype(index.dtype):
+        rows = np.ascontiguousarray(index.to_numpy(dtype=np.int64))
+    else:
+        rows = pd.util.hash_pandas_object(index, index=False).to_numpy()
+    return (result_key, len(df), hashlib.md5(rows.tobytes()).hexdigest())
+
+QUICK_MODES = ["Tudo", "Divergências", "Sobra", "Falta"]
+FACET_MAX_CARDINALITY = int(os.environ.get("RFDASH_FACET_MAX_VALUES", "200"))
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def build_facet_index(_df: pd.DataFrame, result_key) -> dict:
+    """
+    Índice montado uma vez por DF de divergências (`result_key`, ver
+    `rows_signature`; o DF em si não é hasheado a cada rerun):
+      - modes:  posições das linhas de cada filtro rápido (Tudo/Divergências/Sobra/Falta)
+      - facets: para colunas de baixa cardinalidade (ex.: COR, TAMANHO), os valores,
+                a contagem de linhas de cada um e um bitmap (bits empacotados) valor -> linhas
+    Colunas numéricas e de alta cardinalidade (EAN, DESCRICAO...) ficam de fora.
+    """
+    df = _df
+    n = len(df)
+    div = pd.to_numeric(df["DIVERGÊNCIA"], errors="coerce").fillna(0).to_numpy()
+    modes = {
+        "Tudo": np.arange(n),
+        "Divergências": np.flatnonzero(div != 0),
+        "Sobra": np.flatnonzero(div > 0),
+        "Falta": np.flatnonzero(div < 0),
+    }
+    facets = {}
+    for col in df.columns:
+        if col == "EAN" or pd.api.types.is_numeric_dtype(df[col]):
+            continue
+        codes, uniques = pd.factorize(df[col].fillna(ROLLUP_EMPTY_LABEL).astype(str), sort=True)
+        if not 0 < len(uniques) <= FACET_MAX_CARDINALITY:
+            continue
+        facets[col] = {
+            "values": [str(v) for v in uniques],
+            "counts": np.bincount(codes, minlength=len(uniques)),
+            "bitmaps": np.stack([np.packbits(codes == i) for i in range(len(uniques))]),
+        }
+    return {"n": n, "modes": modes, "facets": facets}
+
+def facet_rows(index: dict, mode: str = "Tudo", selections: dict | None = None) -> np.ndarray:
+    """
+    Posições das linhas do filtro rápido `mode` que atendem às seleções
+    {coluna: [valores]} (OU dentro da coluna, E entre colunas), via bitmaps.
+    """
+    rows = index["modes"].get(mode, index["modes"]["Tudo"])
+    selections = {c: v for c, v in (selections or {}).items() if v and c in index["facets"]}
+    if not selections:
+        return rows
+    n = index["n"]
+    mask = np.zeros(n, dtype=bool)
+    mask[rows] = True
+    packed = np.packbits(mask)
+    for col, values in selections.items():
+        facet = index["facets"][col]
+        pos = [facet["values"].index(v) for v in values if v in facet["values"]]
+        packed &= np.bitwise_or.reduce(facet["bitmaps"][pos], axis=0) if pos else 0
+    return np.flatnonzero(np.unpackbits(packed, count=n))
+
+def apply_quick_filter(df: pd.DataFrame, mode: str, facets: dict | None = None) -> pd.DataFrame:
     """
     Aplica o filtro rápido sobre o DF de divergências.
     Opções: 'Tudo' | 'Divergências' | 'Sobra' | 'Falta'
+    Com `facets` (de `build_facet_index`) usa as posições pré-calculadas.
     """
     if df is None or df.empty or "DIVERGÊNCIA" not in df.columns:
         return df
+    if facets is not None:
+        return df if mode not in QUICK_MODES[1:] else df.iloc[facets["modes"][mode]]
     if mode == "Divergências":
         return df[df["DIVERGÊNCIA"] != 0]
     if mode == "Sobra":
@@ -282,11 +2369,53 @@ def apply_quick_filter(df: pd.DataFrame, mode: str) -> pd.DataFrame:
     return df  # Tudo
 
 
-def display_data_table(df: pd.DataFrame, key: str | None = None) -> pd.DataFrame:
+GRID_ROW_ID = "__rf_row_id__"   # coluna só do rowData (getRowId), sem columnDef
+
+def grid_row_ids(df: pd.DataFrame) -> pd.Series:
+    """
+    Id estável de cada linha para a grade: o EAN (com sufixo #n nas repetições).
+    Com ids estáveis, a AG Grid compara o rowData novo com o atual por id e só
+    inclui/remove/atualiza as linhas que mudaram — filtros, ordenação, seleção e
+    rolagem ficam. (O st_aggrid não tem transações: o rowData inteiro ainda vai
+    para o navegador; a diferença é aplicada lá.)
+    """
+    if "EAN" not in df.columns:
+        return pd.Series(np.arange(len(df)).astype(str), index=df.index)
+    ean = df["EAN"].astype(str)
+    dup = ean.groupby(ean, sort=False).cumcount()
+    return ean.where(dup == 0, ean + "#" + dup.astype(str))
+
+def _grid_visible_rows(df: pd.DataFrame, grid_response) -> pd.DataFrame:
+    """
+    Linhas visíveis na grade, com os valores atuais do servidor: a grade só
+    informa ordem e filtros de coluna (ids das linhas). Sem filtro de coluna
+    ativo valem todas as linhas de `df` — a grade pode ainda não ter recebido
+    os dados deste rerun (troca de filtro rápido, recontagem).
+    """
+    response = getattr(grid_response, "grid_response", None)
+    ids = response.get("rowIdsAfterSortAndFilter") if isinstance(response, dict) else None
+    if ids is None:
+        return df
+    state = response.get("gridState") or {}
+    column_filtered = bool((state.get("filter") or {}).get("filterModel"))
+    order = pd.Index(df[GRID_ROW_ID]).get_indexer(pd.Index(ids, dtype=object))
+    visible = df.iloc[order[order >= 0]]
+    if not column_filtered:
+        rest = df[~df[GRID_ROW_ID].isin(pd.Index(visible[GRID_ROW_ID]))]
+        visible = pd.concat([visible, rest])
+    return visible
+
+def display_data_table(df: pd.DataFrame, key: str | None = None, facets: dict | None = None) -> pd.DataFrame:
     """
     Mostra a tabela com AgGrid e retorna o DataFrame filtrado/ordenado pelo usuário.
     Aceita 'key' para forçar remontagem da grade (reset de filtros/sort internos).
+    Com `facets`, as colunas de baixa cardinalidade usam filtro de conjunto com a
+    lista de valores já pronta (o navegador não precisa varrer a coluna).
+    `df` já vem com o filtro rápido aplicado; as linhas têm id estável, então
+    troca de modo ou recontagem não remontam a grade nem perdem filtros e rolagem.
     """
+    from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode, DataReturnMode, JsCode
+
     df = adicionar_status_visual(df.copy())
     gb = GridOptionsBuilder.from_dataframe(df)
 
@@ -304,6 +2433,15 @@ def display_data_table(df: pd.DataFrame, key: str | None = None) -> pd.DataFrame
         groupable=True, filter=True, sortable=True
     )
     configurar_colunas_com_filtros_dinamicos(gb, df)
+    # o índice rotula vazios como "(vazio)"; na grade a célula é null -> o valor do filtro também
+    empty_label = JsCode(f"function(params) {{ return params.value == null ? '{ROLLUP_EMPTY_LABEL}' : params.value; }}")
+    for col, facet in (facets or {}).get("facets", {}).items():
+        if col in df.columns:
+            values = [None if v == ROLLUP_EMPTY_LABEL else v for v in facet["values"]]
+            gb.configure_column(
+                col, filter="agSetColumnFilter",
+                filterParams={"values": values, "excelMode": "windows", "valueFormatter": empty_label},
+            )
     gb.configure_grid_options(
         domLayout="normal", rowHeight=30, headerHeight=42,
         enableEnterpriseModules=True, enableRangeSelection=True,
@@ -328,6 +2466,9 @@ def display_data_table(df: pd.DataFrame, key: str | None = None) -> pd.DataFrame
         "minWidth": 300,
         "cellRendererParams": {"suppressCount": False, "checkbox": True},
     }
+    grid_options["getRowId"] = JsCode(f"function(params) {{ return params.data['{GRID_ROW_ID}']; }}")
+    # id entra depois das colunas configuradas: vai no rowData, mas não vira coluna da grade
+    df[GRID_ROW_ID] = grid_row_ids(df).to_numpy()
 
     grid_response = AgGrid(
         df,
@@ -339,22 +2480,225 @@ def display_data_table(df: pd.DataFrame, key: str | None = None) -> pd.DataFrame
         enable_enterprise_modules=True,
         height=750,
         width="100%",
-        reload_data=True,
         allow_unsafe_jscode=True,
-        key=key,  # <-- importante para “resetar” a grade quando o filtro rápido mudar
+        key=key,  # <-- estável: só muda para “resetar” a grade (Limpar filtros)
+    )
+
+    return _grid_visible_rows(df, grid_response).drop(columns=GRID_ROW_ID)
+
+# -----------------------------------------------------------------------------
+# Visualização rápida (Arrow) para tabelas grandes
+# -----------------------------------------------------------------------------
+FAST_VIEW_ROW_THRESHOLD = int(os.environ.get("RFDASH_FAST_VIEW_ROWS", "50000"))
+
+def search_rows(df: pd.DataFrame, term: str, columns: list | None = None) -> pd.DataFrame:
+    """
+    Busca rápida no servidor: mantém as linhas em que alguma coluna de texto
+    contém `term` (sem diferenciar maiúsculas). Vazio = sem filtro.
+    """
+    term = (term or "").strip()
+    if not term or df.empty:
+        return df
+    cols = [c for c in (columns or df.columns) if not pd.api.types.is_numeric_dtype(df[c])]
+    mask = np.zeros(len(df), dtype=bool)
+    for c in cols:
+        mask |= df[c].astype(str).str.contains(term, case=False, regex=False, na=False).to_numpy()
+    return df[mask]
+
+def display_fast_table(
+    df: pd.DataFrame,
+    key: str = "fast",
+    facets: dict | None = None,
+    mode: str = "Tudo",
+) -> pd.DataFrame:
+    """
+    Tabela somente leitura enviada ao navegador em Arrow (st.dataframe), sem
+    AgGrid: busca e seleção de colunas são feitas no servidor.
+    Com `facets` (índice do DF completo `df`), o filtro rápido `mode` e os filtros
+    por valor (COR, TAMANHO...) saem direto do índice.
+    Retorna as linhas exibidas (mesmo contrato de `display_data_table`).
+    """
+    selections = {}
+    if facets is not None and facets["facets"]:
+        facet_cols = list(facets["facets"])
+        for col, box in zip(facet_cols, st.columns(len(facet_cols))):
+            facet = facets["facets"][col]
+            labels = dict(zip(facet["values"], facet["counts"]))
+            with box:
+                selections[col] = st.multiselect(
+                    col, facet["values"], format_func=lambda v, labels=labels: f"{v} ({labels[v]})",
+                    key=f"{key}_facet_{col}",
+                )
+        df = df.iloc[facet_rows(facets, mode, selections)]
+    elif facets is not None:
+        df = df.iloc[facets["modes"][mode]]
+
+    df = adicionar_status_visual(df.copy())
+    c1, c2 = st.columns([2, 3])
+    with c1:
+        term = st.text_input("Buscar (EAN, descrição, referência...)", key=f"{key}_search")
+    with c2:
+        cols = st.multiselect("Colunas", list(df.columns), default=list(df.columns), key=f"{key}_cols")
+
+    rows = search_rows(df, term)
+    st.caption(f"{len(rows):,} de {len(df):,} linhas".replace(",", "."))
+    st.dataframe(rows[cols or list(rows.columns)], hide_index=True, use_container_width=True, height=750)
+    # como na AgGrid, colunas ocultas continuam no DataFrame devolvido
+    return rows
+
+# -----------------------------------------------------------------------------
+# Rollups no servidor (REFERENCIA > COR > TAMANHO)
+# -----------------------------------------------------------------------------
+ROLLUP_VALUE_COLUMNS = ["ESTOQUE", "CONTAGEM", "DIVERGÊNCIA", "PEÇAS A SEREM RELIDAS"]
+ROLLUP_EMPTY_LABEL = "(vazio)"
+
+def _rollup_key(path: tuple):
+    # chaves de groupby().indices: escalar para 1 coluna, tupla para várias
+    return path[0] if len(path) == 1 else tuple(path)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def compute_rollups(_df: pd.DataFrame, levels: tuple, data_key) -> dict:
+    """
+    Pré-calcula os totais agrupados por cada prefixo da hierarquia, uma vez por
+    `data_key` (assinatura do recorte de `_df`, que não é hasheado).
+    Retorna:
+      - frames[i]:    totais por levels[:i+1] (+ coluna 'ITENS' = nº de linhas)
+      - row_index[i]: {chave de levels[:i+1] -> posições das linhas em df}
+    """
+    df, levels = _df, list(levels)
+    work = df[levels].fillna(ROLLUP_EMPTY_LABEL).astype(str)
+    values = [c for c in ROLLUP_VALUE_COLUMNS if c in df.columns]
+    for c in values:
+        work[c] = df[c].to_numpy()
+
+    frames, row_index = [], []
+    for depth in range(1, len(levels) + 1):
+        grouped = work.groupby(levels[:depth], sort=True)
+        agg = grouped[values].sum()
+        agg.insert(0, "ITENS", grouped.size())
+        frames.append(agg.reset_index())
+        row_index.append(grouped.indices)
+    return {"levels": levels, "frames": frames, "row_index": row_index}
+
+def rollup_children(rollups: dict, df: pd.DataFrame, path: tuple) -> pd.DataFrame:
+    """
+    Filhos de um nó da hierarquia: com `path` de tamanho d, devolve os totais do
+    nível d+1 sob esse prefixo; no último nível, as linhas (EAN) de `df`.
+    """
+    levels = rollups["levels"]
+    depth = len(path)
+    if depth == 0:
+        return rollups["frames"][0]
+    if depth < len(levels):
+        children = rollups["frames"][depth]
+        mask = np.ones(len(children), dtype=bool)
+        for col, value in zip(levels[:depth], path):
+            mask &= children[col].to_numpy() == value
+        return children[mask].reset_index(drop=True)
+    return df.iloc[rollup_rows(rollups, path)]
+
+def rollup_rows(rollups: dict, path: tuple) -> np.ndarray:
+    """
+    Posições (em df) de todas as linhas sob o prefixo `path`.
+    """
+    if not path:
+        return None
+    return rollups["row_index"][len(path) - 1].get(_rollup_key(path), np.array([], dtype=np.intp))
+
+def _selected_rows_records(grid_response) -> list:
+    # st_aggrid antigo devolve lista de dicts; o novo, DataFrame (ou None)
+    selected = grid_response["selected_rows"]
+    if selected is None:
+        return []
+    if isinstance(selected, pd.DataFrame):
+        return selected.to_dict("records")
+    return list(selected)
+
+def display_rollup_table(df: pd.DataFrame, levels: list, data_key, key: str = "rollup") -> pd.DataFrame:
+    """
+    Tabela agrupada com totais calculados no servidor: a grade recebe só o nível
+    atual da hierarquia; selecionar uma linha expande seus filhos (drill-down).
+    `data_key` identifica `df` para o cache dos totais (ver `rows_signature`).
+    Retorna as linhas de `df` sob o nó atual (para o resumo dinâmico e o PDF).
+    """
+    from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode, DataReturnMode
+
+    rollups = compute_rollups(df, tuple(levels), data_key)
+    path_key = f"{key}_path"
+    path = tuple(st.session_state.get(path_key, ()))
+    if path and len(rollup_rows(rollups, path)) == 0:
+        path = ()  # nó sumiu (ex.: filtro rápido mudou)
+    st.session_state[path_key] = path
+
+    c1, c2 = st.columns([1, 5])
+    with c1:
+        if st.button("⬆ Voltar", key=f"{key}_up", disabled=not path, use_container_width=True):
+            st.session_state[path_key] = path[:-1]
+            st.rerun()
+    with c2:
+        crumbs = ["Todos"] + [f"{lvl}: {val}" for lvl, val in zip(levels, path)]
+        st.caption(" › ".join(crumbs))
+
+    children = rollup_children(rollups, df, path)
+    view = adicionar_status_visual(children.copy())
+    gb = GridOptionsBuilder.from_dataframe(view)
+    gb.configure_pagination(enabled=False)
+    gb.configure_selection("single")
+    gb.configure_default_column(editable=False, filter=True, sortable=True, floatingFilter=True)
+    for col in view.columns:
+        gb.configure_column(col, cellStyle={"borderRight": "1px solid #4e4e4e", "padding": "6px"})
+    gb.configure_column("STATUS", header_name="STATUS", cellStyle={"fontWeight": "bold", "textAlign": "center"})
+    configurar_colunas_com_filtros_dinamicos(gb, view)
+    gb.configure_grid_options(domLayout="normal", rowHeight=30, headerHeight=42)
+
+    grid_response = AgGrid(
+        view,
+        gridOptions=gb.build(),
+        data_return_mode=DataReturnMode.AS_INPUT,
+        update_mode=GridUpdateMode.SELECTION_CHANGED,
+        fit_columns_on_grid_load=True,
+        theme="material",
+        height=750,
+        width="100%",
+        key=f"{key}_grid_{len(path)}_{hashlib.md5(repr(path).encode()).hexdigest()[:8]}",
     )
 
-    return pd.DataFrame(grid_response["data"])
+    depth = len(path)
+    selected = _selected_rows_records(grid_response)
+    if selected and depth < len(levels):
+        st.session_state[path_key] = path + (str(selected[0][levels[depth]]),)
+        st.rerun()
+
+    rows = rollup_rows(rollups, path)
+    return df if rows is None else df.iloc[rows]
 
 # -----------------------------------------------------------------------------
 # Resumo (cards Streamlit)
 # -----------------------------------------------------------------------------
-def show_summary(discrepancies: pd.DataFrame):
-    total_estoque = int(discrepancies["ESTOQUE"].sum())
-    total_contagem_rfid = int(discrepancies["CONTAGEM"].sum())
-    total_div_pos = int(discrepancies[discrepancies["DIVERGÊNCIA"] > 0]["DIVERGÊNCIA"].sum())
-    total_div_neg = int(discrepancies[discrepancies["DIVERGÊNCIA"] < 0]["DIVERGÊNCIA"].sum())
-    total_div_abs = int(discrepancies["DIVERGÊNCIA"].abs().sum())
+def summary_totals(discrepancies: pd.DataFrame) -> dict:
+    """
+    Totais do resumo (estoque, contagem, sobra, falta, divergência absoluta).
+    """
+    div = discrepancies["DIVERGÊNCIA"]
+    return {
+        "total_estoque": int(discrepancies["ESTOQUE"].sum()),
+        "total_contagem": int(discrepancies["CONTAGEM"].sum()),
+        "total_div_pos": int(div[div > 0].sum()),
+        "total_div_neg": int(div[div < 0].sum()),
+        "total_div_abs": int(div.abs().sum()),
+    }
+
+def show_summary(discrepancies: pd.DataFrame, totals: dict | None = None):
+    """
+    Cards do resumo total. `totals` (de `summary_totals`) evita recalcular,
+    ex.: no modo ao vivo, onde os totais são mantidos incrementalmente.
+    """
+    totals = totals or summary_totals(discrepancies)
+    total_estoque = totals["total_estoque"]
+    total_contagem_rfid = totals["total_contagem"]
+    total_div_pos = totals["total_div_pos"]
+    total_div_neg = totals["total_div_neg"]
+    total_div_abs = totals["total_div_abs"]
 
     st.subheader("Resumo Total")
     c1, c2, c3, c4, c5 = st.columns([2, 2, 1, 1, 1])
@@ -372,13 +2716,71 @@ def show_summary(discrepancies: pd.DataFrame):
 # -----------------------------------------------------------------------------
 # Cálculo de discrepâncias (mantém nomes e lógica originais do seu app)
 # -----------------------------------------------------------------------------
-def calculate_discrepancies(expected: pd.DataFrame, counted: pd.DataFrame, file_name: str) -> pd.DataFrame:
+def _join_counts_merge(expected: pd.DataFrame, counted: pd.DataFrame) -> pd.DataFrame:
+    """
+    Engine de referência: groupby por EAN (string) + pd.merge outer.
+    """
+    counted_agg = counted.groupby("EAN", as_index=False).agg({"CONTAGEM": "sum"})
+    return pd.merge(expected, counted_agg, on="EAN", how="outer")
+
+def _join_counts_codes(expected: pd.DataFrame, counted: pd.DataFrame) -> pd.DataFrame:
+    """
+    Engine por códigos inteiros: fatoriza os EANs dos dois lados num espaço de
+    códigos único (ordenado), soma a contagem com np.bincount e alinha por código.
+    Mesma semântica do merge outer: linhas do esperado (inclusive EAN repetido),
+    EANs só na contagem entram como linhas novas, saída ordenada pelo EAN.
+    """
+    n_exp = len(expected)
+    codes, uniques = pd.factorize(pd.concat([expected["EAN"], counted["EAN"]], ignore_index=True))
+    # ordena só os EANs únicos e renumera os códigos (mais barato que sort=True)
+    order_uniques = uniques.argsort()
+    n = len(uniques)
+    rank = np.empty(n, dtype=np.intp)
+    rank[order_uniques] = np.arange(n)
+    codes = rank[codes]
+    uniques = np.asarray(uniques.take(order_uniques), dtype=object)
+    exp_codes = codes[:n_exp]
+    cnt_codes = codes[n_exp:]
+
+    qty = pd.to_numeric(counted["CONTAGEM"], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+    totals = np.rint(np.bincount(cnt_codes, weights=qty, minlength=n)).astype(np.int64)
+    in_counted = np.bincount(cnt_codes, minlength=n) > 0
+    in_expected = np.zeros(n, dtype=bool)
+    in_expected[exp_codes] = True
+    only_counted = np.flatnonzero(in_counted & ~in_expected)
+
+    combined = expected.reset_index(drop=True)
+    if only_counted.size:
+        extra = pd.DataFrame({"EAN": pd.Series(uniques[only_counted], dtype=expected["EAN"].dtype)})
+        combined = pd.concat([combined, extra], ignore_index=True)
+    row_codes = np.concatenate([exp_codes, only_counted])
+    order = np.argsort(row_codes, kind="stable")
+    out = combined.take(order).reset_index(drop=True)
+    out["CONTAGEM"] = totals[row_codes[order]]
+    return out
+
+JOIN_ENGINES = {
+    "codes": _join_counts_codes,
+    "merge": _join_counts_merge,
+}
+
+def calculate_discrepancies(
+    expected: pd.DataFrame,
+    counted: pd.DataFrame,
+    file_name: str,
+    join_engine: str = "codes",
+) -> pd.DataFrame:
     """
     Calcula discrepâncias entre estoque esperado e contagem.
     Espera colunas:
       - expected: 'EAN', 'ESTOQUE' (+ opcionais)
       - counted:  'EAN', 'CONTAGEM'
     Sai com: 'DIVERGÊNCIA' e 'PEÇAS A SEREM RELIDAS'
+    Se a contagem tem 'ZONA', sai também uma coluna 'CONTAGEM <zona>' por zona
+    (matriz EAN x zona; a divergência segue sobre o total).
+    O cruzamento é pelo EAN canônico (normalizado na leitura; entradas cruas são
+    normalizadas aqui); se algum EAN mudou, sai a coluna 'EAN ORIGINAL' ao lado do EAN.
+    join_engine: 'codes' (padrão, EAN fatorizado em inteiros) | 'merge' (groupby + pd.merge)
     """
     if "EAN" not in expected.columns or "EAN" not in counted.columns:
         st.error("A coluna 'EAN' não foi encontrada em um dos arquivos.")
@@ -386,24 +2788,392 @@ def calculate_discrepancies(expected: pd.DataFrame, counted: pd.DataFrame, file_
 
     expected = expected.copy()
     counted = counted.copy()
-    expected["EAN"] = expected["EAN"].astype(str)
-    counted["EAN"] = counted["EAN"].astype(str)
-
-    counted_agg = counted.groupby("EAN", as_index=False).agg({"CONTAGEM": "sum"})
+    # a leitura já deixa o EAN canônico (relatório em attrs); aqui só o que chegou cru
+    for frame, label in ((expected, "EAN (estoque)"), (counted, "EAN (contagem)")):
+        if EAN_REPORT_ATTR not in frame.attrs:
+            set_canonical_eans(frame, label)
 
     if "ESTOQUE" not in expected.columns:
         expected["ESTOQUE"] = 0
 
-    discrepancies = pd.merge(expected, counted_agg, on="EAN", how="outer")
-    discrepancies["ESTOQUE"] = pd.to_numeric(discrepancies["ESTOQUE"], errors="coerce").fillna(0).astype(int)
-    discrepancies["CONTAGEM"] = pd.to_numeric(discrepancies["CONTAGEM"], errors="coerce").fillna(0).astype(int)
+    # quantidades já vêm inteiras da leitura; o parse só roda em entradas cruas
+    expected["ESTOQUE"] = ensure_quantities(expected["ESTOQUE"], "ESTOQUE")
+    counted["CONTAGEM"] = ensure_quantities(counted["CONTAGEM"], "CONTAGEM")
+    discrepancies = JOIN_ENGINES[join_engine](expected, counted)
+    # EANs só de um dos lados ficam sem ESTOQUE/CONTAGEM no join -> 0
+    discrepancies["ESTOQUE"] = discrepancies["ESTOQUE"].fillna(0).astype(np.int64)
+    discrepancies["CONTAGEM"] = discrepancies["CONTAGEM"].fillna(0).astype(np.int64)
 
     discrepancies["DIVERGÊNCIA"] = discrepancies["CONTAGEM"] - discrepancies["ESTOQUE"]
-    discrepancies["PEÇAS A SEREM RELIDAS"] = discrepancies.apply(
-        lambda r: max(r["ESTOQUE"], r["CONTAGEM"]) if r["DIVERGÊNCIA"] != 0 else 0, axis=1
+    discrepancies["PEÇAS A SEREM RELIDAS"] = np.where(
+        discrepancies["DIVERGÊNCIA"] != 0,
+        np.maximum(discrepancies["ESTOQUE"], discrepancies["CONTAGEM"]),
+        0,
     )
+    if ZONE_COLUMN in counted.columns:
+        matrix = zone_count_matrix(counted)
+        rows = matrix.index.get_indexer(discrepancies["EAN"].astype(str))
+        cells = np.where((rows >= 0)[:, None], matrix.to_numpy()[rows], 0)
+        for i, zone in enumerate(matrix.columns):
+            discrepancies[ZONE_COUNT_PREFIX + zone] = cells[:, i]
+
+    originals = ean_original_map(*expected.attrs[EAN_REPORT_ATTR], *counted.attrs[EAN_REPORT_ATTR])
+    if len(originals):
+        discrepancies.insert(
+            discrepancies.columns.get_loc("EAN") + 1, EAN_ORIGINAL_COLUMN,
+            discrepancies["EAN"].map(originals).fillna("").astype(str),
+        )
+    # o mapa completo já está na coluna; não segue em attrs (sessão, análise exportada)
+    discrepancies.attrs.pop(EAN_REPORT_ATTR, None)
     return discrepancies
 
+# -----------------------------------------------------------------------------
+# Contagem ao vivo (arquivo RFLog crescendo durante o inventário)
+# -----------------------------------------------------------------------------
+LIVE_POLL_SECONDS = int(os.environ.get("RFDASH_LIVE_POLL_SECONDS", "10"))
+# pasta do servidor onde ficam os RFLogs em andamento; sem ela, o modo ao vivo só aceita trechos enviados
+LIVE_DIR = os.environ.get("RFDASH_LIVE_DIR", "").strip() or None
+
+_LIVE_VERSIONS = itertools.count(1)  # versões do ao vivo, únicas no processo (também após reinício do arquivo)
+
+class LiveCountIngestor:
+    """
+    Ingestão incremental da contagem: lê só os bytes novos desde o último offset
+    (arquivo local em crescimento) ou trechos anexados (`feed`), soma nas
+    contagens por EAN e atualiza as divergências/totais apenas dos EANs afetados.
+    Linhas incompletas no fim do trecho ficam guardadas até chegar o "\n".
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = path
+        self.offset = 0
+        self.lines = 0
+        self.counts = {}            # EAN -> CONTAGEM acumulada
+        self.zone_counts = {}       # (EAN, ZONA) -> CONTAGEM, se o arquivo tem coluna de zona
+        self.ean_reports = []       # mapas EAN lido -> canônico dos trechos (para o EAN ORIGINAL)
+        self.fed_ids = set()        # ids dos trechos enviados já processados
+        self.seen_tags = SeenTags() # tags EPC já contadas (leitura crua de EPCs)
+        self.epc_stats = None       # estatísticas acumuladas da leitura de EPCs
+        self._tail = b""
+        self._profile = None
+        self._encoding = None
+        self._pending = []          # trechos contados (EAN, CONTAGEM[, ZONA]) ainda não aplicados
+        self._disc = None
+        self._disc_key = None
+        self.version = 0            # muda a cada atualização de _disc (entra na chave dos caches da tela)
+        self._positions = None      # EAN -> posições das linhas em _disc
+        self.totals = None
+
+    # ---- leitura
+    def has_new_bytes(self) -> bool:
+        try:
+            return self.path is not None and os.path.getsize(self.path) != self.offset
+        except OSError:
+            return False
+
+    def poll(self) -> pd.Series:
+        """
+        Lê o que foi acrescentado ao arquivo desde a última leitura.
+        Arquivo menor que o offset (truncado/substituído) reinicia a contagem.
+        """
+        size = os.path.getsize(self.path)
+        if size < self.offset:
+            self.__init__(self.path)
+        if size == self.offset:
+            return pd.Series(dtype="int64")
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        self.offset += len(data)
+        return self.feed(data)
+
+    def feed(self, data: bytes) -> pd.Series:
+        """
+        Processa um trecho de bytes e devolve o delta de CONTAGEM por EAN.
+        """
+        data = self._tail + data
+        cut = data.rfind(b"\n")
+        if cut < 0:
+            self._tail = data
+            return pd.Series(dtype="int64")
+        complete, self._tail = data[: cut + 1], data[cut + 1:]
+
+        skip_header = False
+        if self._profile is None:
+            head = complete[:PROFILE_SAMPLE_BYTES]
+            head = head[: head.rfind(b"\n") + 1] or head
+            self._encoding = _sniff_encoding(head)
+            self._profile = profile_count_text(head.decode(self._encoding, errors="replace"))
+            skip_header = self._profile["header"]
+
+        dial = self._profile
+        raw = pd.read_csv(
+            StringIO(complete.decode(self._encoding, errors="replace")),
+            sep=dial["sep"],
+            header=0 if skip_header else None,
+            dtype=str,
+            quotechar=dial["quotechar"],
+            doublequote=dial["doublequote"],
+            escapechar=dial["escapechar"],
+        )
+        counted = _count_frame_from_raw(raw, dial, self.seen_tags)
+        if counted is not None:
+            for stats in counted.attrs.get(EPC_REPORT_ATTR, []):
+                self.epc_stats = {k: (self.epc_stats or {}).get(k, 0) + v for k, v in stats.items()}
+            self.ean_reports += [{"mapa": r["mapa"]} for r in counted.attrs.get(EAN_REPORT_ATTR, []) if r.get("linhas_afetadas")]
+        if counted is None or counted.empty:
+            return pd.Series(dtype="int64")
+
+        self.lines += len(counted)
+        delta = counted.groupby("EAN", sort=False)["CONTAGEM"].sum()
+        for ean, qty in delta.items():
+            self.counts[ean] = self.counts.get(ean, 0) + int(qty)
+        if ZONE_COLUMN in counted.columns:
+            counted = aggregate_zone_counts(counted)
+            for ean, zone, qty in counted[["EAN", ZONE_COLUMN, "CONTAGEM"]].itertuples(index=False):
+                self.zone_counts[ean, zone] = self.zone_counts.get((ean, zone), 0) + int(qty)
+        self._pending.append(counted)
+        return delta
+
+    def counts_frame(self) -> pd.DataFrame:
+        """Contagem acumulada (EANs já canônicos; os mapas dos trechos vão em attrs)."""
+        if self.zone_counts:
+            df = pd.DataFrame(
+                [(ean, zone, qty) for (ean, zone), qty in self.zone_counts.items()],
+                columns=["EAN", ZONE_COLUMN, "CONTAGEM"],
+            ).astype({"EAN": str, "CONTAGEM": "int64"})
+        else:
+            df = pd.DataFrame(
+                {"EAN": list(self.counts.keys()), "CONTAGEM": list(self.counts.values())}
+            ).astype({"EAN": str, "CONTAGEM": "int64"})
+        df.attrs[EAN_REPORT_ATTR] = list(self.ean_reports)
+        return df
+
+    # ---- divergências
+    def discrepancies(self, expected: pd.DataFrame, expected_key, file_name: str):
+        """
+        Divergências da contagem acumulada contra `expected`. Recalcula tudo só na
+        primeira vez ou quando o estoque esperado muda (`expected_key`); depois,
+        aplica apenas os deltas pendentes. Retorna (discrepancies, totais).
+        """
+        if self._disc is None or expected_key != self._disc_key:
+            self._disc = calculate_discrepancies(expected, self.counts_frame(), file_name)
+            self._positions = self._disc.groupby("EAN", sort=False).indices
+            self.totals = summary_totals(self._disc)
+            self._disc_key = expected_key
+            self._pending.clear()
+            self.version = next(_LIVE_VERSIONS)
+        elif self._pending:
+            pending = pd.concat(self._pending, ignore_index=True)
+            self._pending.clear()
+            self._apply_delta(pending)
+            self.version = next(_LIVE_VERSIONS)
+        return self._disc, self.totals
+
+    def _apply_delta(self, pending: pd.DataFrame):
+        delta = pending.groupby("EAN", sort=False)["CONTAGEM"].sum()
+        zones = zone_count_matrix(pending) if ZONE_COLUMN in pending.columns else None
+        originals = ean_original_map(*self.ean_reports)
+        self._disc = apply_count_updates(self._disc, self._positions, delta, "add", self.totals, zones, originals)
+
+def apply_count_updates(
+    disc: pd.DataFrame,
+    positions: dict,
+    updates: pd.Series,
+    mode: str = "add",
+    totals: dict | None = None,
+    zones: pd.DataFrame | None = None,
+    originals: pd.Series | None = None,
+) -> pd.DataFrame:
+    """
+    Atualiza CONTAGEM, DIVERGÊNCIA, PEÇAS A SEREM RELIDAS (e STATUS, se existir)
+    apenas nas linhas dos EANs de `updates` (EAN -> quantidade), localizadas por
+    `positions` (EAN -> posições em `disc`, de groupby("EAN").indices).
+    - mode="add": soma a quantidade à contagem atual; "replace": substitui.
+    - EANs fora do DF entram como linhas novas (ESTOQUE 0) e vão para `positions`.
+    - `totals` (de `summary_totals`) é ajustado no lugar.
+    - `zones` (matriz EAN x zona de `zone_count_matrix`) reparte a atualização
+      nas colunas CONTAGEM <zona>; sem ela, o que entra sem zona vai para
+      CONTAGEM SEM ZONA, e as zonas continuam somando a CONTAGEM.
+    - `originals` (de `ean_original_map`) preenche o EAN ORIGINAL das linhas
+      novas. Elas não estão no estoque esperado: como no cálculo completo, as
+      colunas descritivas (REFERENCIA, COR...) ficam vazias.
+    Custo proporcional ao tamanho de `updates`, não do catálogo.
+    """
+    if zones is not None and not zone_columns(disc):
+        # contagem sem zona até aqui: entra como SEM ZONA para as zonas somarem a CONTAGEM
+        disc[ZONE_COUNT_PREFIX + ZONE_EMPTY_LABEL] = disc["CONTAGEM"].to_numpy(dtype=np.int64)
+    known = [(positions[e], int(q)) for e, q in updates.items() if e in positions]
+    new = {e: int(q) for e, q in updates.items() if e not in positions}
+
+    if known:
+        rows = np.concatenate([p for p, _ in known])
+        qty = np.concatenate([np.full(len(p), q, dtype=np.int64) for p, q in known])
+        cols = [disc.columns.get_loc(c) for c in ("CONTAGEM", "DIVERGÊNCIA", "PEÇAS A SEREM RELIDAS")]
+        est = disc["ESTOQUE"].to_numpy()[rows]
+        old_cnt = disc["CONTAGEM"].to_numpy()[rows]
+        old_div = disc["DIVERGÊNCIA"].to_numpy()[rows]
+        new_cnt = old_cnt + qty if mode == "add" else qty
+        new_div = new_cnt - est
+        relidas = np.where(new_div != 0, np.maximum(est, new_cnt), 0)
+        disc.iloc[rows, cols[0]] = new_cnt
+        disc.iloc[rows, cols[1]] = new_div
+        disc.iloc[rows, cols[2]] = relidas
+        if "STATUS" in disc.columns:
+            disc.iloc[rows, disc.columns.get_loc("STATUS")] = _status_labels(new_div)
+        if totals is not None:
+            _update_totals(totals, old_div, new_div, int((new_cnt - old_cnt).sum()))
+
+    if new:
+        extra = pd.DataFrame({"EAN": list(new.keys()), "ESTOQUE": 0, "CONTAGEM": list(new.values())})
+        extra = extra.astype({"EAN": disc["EAN"].dtype})
+        extra["DIVERGÊNCIA"] = extra["CONTAGEM"]
+        extra["PEÇAS A SEREM RELIDAS"] = np.where(extra["CONTAGEM"] != 0, extra["CONTAGEM"], 0)
+        for col in zone_columns(disc):
+            extra[col] = 0
+        read_codes = extra["EAN"].map(originals) if originals is not None else pd.Series(np.nan, index=extra.index)
+        if read_codes.notna().any() and EAN_ORIGINAL_COLUMN not in disc.columns:
+            disc.insert(disc.columns.get_loc("EAN") + 1, EAN_ORIGINAL_COLUMN, "")
+        if EAN_ORIGINAL_COLUMN in disc.columns:
+            extra[EAN_ORIGINAL_COLUMN] = read_codes.fillna("").astype(str).to_numpy()
+        if "STATUS" in disc.columns:
+            extra["STATUS"] = _status_labels(extra["DIVERGÊNCIA"].to_numpy())
+        start = len(disc)
+        disc = pd.concat([disc, extra], ignore_index=True)
+        for i, ean in enumerate(extra["EAN"]):
+            positions[ean] = np.array([start + i])
+        if totals is not None:
+            div = extra["DIVERGÊNCIA"].to_numpy()
+            _update_totals(totals, np.zeros_like(div), div, int(div.sum()))
+
+    if len(updates) and (zones is not None or zone_columns(disc)):
+        disc = _apply_zone_updates(disc, positions, updates, zones, mode)
+    return disc
+
+def _apply_zone_updates(
+    disc: pd.DataFrame, positions: dict, updates: pd.Series, zones: pd.DataFrame | None, mode: str,
+) -> pd.DataFrame:
+    """
+    Colunas CONTAGEM <zona> das linhas de `updates` (ver `apply_count_updates`).
+    Zona nova vira coluna nova (0 nas outras linhas), ao lado das existentes.
+    """
+    if zones is None:
+        zones = pd.DataFrame({ZONE_EMPTY_LABEL: updates.to_numpy(dtype=np.int64)}, index=updates.index.astype(str))
+    for zone in sorted(zones.columns):
+        col = ZONE_COUNT_PREFIX + zone
+        if col not in disc.columns:
+            existing = zone_columns(disc)
+            loc = disc.columns.get_loc(existing[-1]) + 1 if existing else len(disc.columns)
+            disc.insert(loc, col, np.zeros(len(disc), dtype=np.int64))
+
+    eans = list(updates.index)
+    rows = np.concatenate([positions[e] for e in eans])
+    reps = [len(positions[e]) for e in eans]
+    cells = np.repeat(zones.reindex(pd.Index(eans).astype(str), fill_value=0).to_numpy(dtype=np.int64), reps, axis=0)
+    if mode != "add":
+        for col in zone_columns(disc):
+            disc.iloc[rows, disc.columns.get_loc(col)] = 0
+    for i, zone in enumerate(zones.columns):
+        j = disc.columns.get_loc(ZONE_COUNT_PREFIX + zone)
+        disc.iloc[rows, j] = disc.iloc[rows, j].to_numpy() + cells[:, i]
+    return disc
+
+def _update_totals(t: dict, old_div: np.ndarray, new_div: np.ndarray, added: int):
+    t["total_contagem"] += added
+    t["total_div_pos"] += int(new_div[new_div > 0].sum() - old_div[old_div > 0].sum())
+    t["total_div_neg"] += int(new_div[new_div < 0].sum() - old_div[old_div < 0].sum())
+    t["total_div_abs"] += int(np.abs(new_div).sum() - np.abs(old_div).sum())
+
+def resolve_live_path(name: str | None) -> str | None:
+    """
+    Caminho real de `name` dentro de LIVE_DIR (relativo à pasta). None sem pasta
+    configurada ou sem nome; ValueError se o caminho (links resolvidos) sair da pasta.
+    """
+    if not LIVE_DIR or not name:
+        return None
+    root = os.path.realpath(LIVE_DIR)
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.commonpath([root, path]) != root or path == root:
+        raise ValueError(f"O arquivo precisa estar na pasta de contagens ao vivo ({LIVE_DIR}).")
+    return path
+
+def get_live_ingestor(name: str | None) -> LiveCountIngestor:
+    """
+    Ingestor ao vivo da sessão para o arquivo `name` de LIVE_DIR (ver
+    `resolve_live_path`; fora da pasta, só trechos enviados); trocar o
+    arquivo recomeça do zero.
+    """
+    try:
+        path = resolve_live_path(name)
+    except ValueError as e:
+        st.error(str(e))
+        path = None
+    ing = st.session_state.get("live_ingestor")
+    if ing is None or ing.path != path:
+        ing = LiveCountIngestor(path)
+        st.session_state.live_ingestor = ing
+    return ing
+
+def live_autorefresh(ingestor: LiveCountIngestor, interval: int = LIVE_POLL_SECONDS):
+    """
+    Verifica o tamanho do arquivo a cada `interval` segundos (fragmento leve) e
+    só dispara o rerun do app quando há bytes novos.
+    """
+    @st.fragment(run_every=interval)
+    def _watch():
+        if ingestor.has_new_bytes():
+            st.rerun()
+        lines, eans = (f"{n:,}".replace(",", ".") for n in (ingestor.lines, len(ingestor.counts)))
+        st.caption(f"Ao vivo: {lines} linhas lidas, {eans} EANs. Verificando a cada {interval}s.")
+
+    _watch()
+
+# -----------------------------------------------------------------------------
+# Recontagem (releitura das PEÇAS A SEREM RELIDAS)
+# -----------------------------------------------------------------------------
+RECOUNT_MODES = {"replace": "Substituir a contagem", "add": "Somar à contagem"}
+
+class RecountReconciler:
+    """
+    Aplica arquivos de recontagem sobre um DF de divergências já calculado,
+    atualizando só as linhas dos EANs relidos (ver `apply_count_updates`).
+    O índice EAN -> linhas é montado uma vez por resultado base.
+    """
+
+    def __init__(self, base_key, discrepancies: pd.DataFrame):
+        self.base_key = base_key
+        self.disc = discrepancies.copy()
+        self.positions = self.disc.groupby("EAN", sort=False).indices
+        self.totals = summary_totals(self.disc)
+        self.applied = []           # [{"nome", "modo", "eans"}] na ordem aplicada
+        self.applied_ids = set()    # file_id dos uploads já aplicados
+
+    def apply(self, counted: pd.DataFrame, mode: str = "replace", name: str | None = None) -> int:
+        """
+        Consolida a recontagem por EAN e aplica com `mode` ('replace' | 'add').
+        Retorna o número de EANs afetados.
+        """
+        if mode not in RECOUNT_MODES:
+            raise ValueError(f"Modo de recontagem inválido: {mode}")
+        updates = aggregate_counts(counted).set_index("EAN")["CONTAGEM"]
+        zones = zone_count_matrix(counted) if ZONE_COLUMN in counted.columns else None
+        originals = ean_original_map(*counted.attrs.get(EAN_REPORT_ATTR, []))
+        self.disc = apply_count_updates(self.disc, self.positions, updates, mode, self.totals, zones, originals)
+        self.applied.append({"nome": name, "modo": mode, "eans": len(updates)})
+        return len(updates)
+
+def get_recount_reconciler(base_key, compute_base) -> RecountReconciler | None:
+    """
+    Reconciliador da sessão para o resultado `base_key`. Enquanto houver
+    recontagens aplicadas sobre a mesma base, o DF base não é recalculado;
+    `compute_base()` só roda quando a base muda (ou na primeira vez).
+    """
+    rec = st.session_state.get("recount_reconciler")
+    if rec is None or rec.base_key != base_key:
+        rec = RecountReconciler(base_key, compute_base())
+        st.session_state.recount_reconciler = rec
+    return rec
+
 # -----------------------------------------------------------------------------
 # PDF em memória — AGORA COM SELEÇÃO DE COLUNAS
 # -----------------------------------------------------------------------------
@@ -433,10 +3203,14 @@ def pick_pdf_columns_ui(
     cols = list(df.columns)
 
     if not include_status:
-        cols = [c for c in cols if unidecode.unidecode(c).upper() != "STATUS"]
+        cols = [c for c in cols if _unidecode(c).upper() != "STATUS"]
 
-    # default = todas as colunas visíveis (na mesma ordem)
+    # default = todas as colunas visíveis (na mesma ordem); se a seleção veio
+    # da sessão (ex.: análise reaberta), vale ela, só com as colunas existentes
     default = cols.copy()
+    if key in st.session_state:
+        st.session_state[key] = [c for c in st.session_state[key] if c in cols]
+        default = None
 
     selected = st.multiselect(
         label,
@@ -458,6 +3232,8 @@ def _compute_col_widths(columns: list) -> list:
     return [w / s for w in widths]
 
 def add_page_number(canvas, doc, orientation):
+    from reportlab.lib.pagesizes import A4
+
     canvas.saveState()
     if orientation.upper().startswith("P"):
         canvas.setFont("Helvetica", 8)
@@ -488,7 +3264,7 @@ def _auto_col_widths(df: pd.DataFrame, cols: list[str], page_width: float) -> li
         # peso pelo maior comprimento (título também conta)
         max_len = max(sample[c].map(len).max(), len(str(c)))
         # bônus para campos “textuais”
-        cname = unidecode.unidecode(c).upper()
+        cname = _unidecode(c).upper()
         if any(tok in cname for tok in ["DESC", "PRODUTO", "NOME"]):
             max_len *= 1.3
         # penaliza campos tipicamente numéricos
@@ -538,18 +3314,37 @@ def _clean_status_for_pdf(text: str) -> str:
     return s
 
 
+PDF_PREVIEW_PAGES = int(os.environ.get("RFDASH_PDF_PREVIEW_PAGES", "2"))
+
 def generate_pdf_in_memory(
     filtered_df: pd.DataFrame,
     font_size: int,
     orientation: str,
-    include_columns: list | None = None
+    include_columns: list | None = None,
+    max_pages: int | None = None,
 ) -> bytes:
     """
     Gera PDF (bytes) com a tabela de divergências.
     - `include_columns`: colunas (e ordem) escolhidas pelo usuário.
     - larguras de coluna calculadas automaticamente conforme o conteúdo.
+    - `max_pages`: pré-visualização; o resumo continua sendo do DF inteiro, mas só
+      as linhas que cabem nas primeiras páginas são montadas e o PDF para ali.
     """
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER
     from reportlab.lib.pagesizes import A4, landscape, portrait
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+    class _PreviewFull(Exception):
+        pass
+
+    class _PreviewDocTemplate(SimpleDocTemplate):
+        """Interrompe a montagem antes de abrir a página `max_pages + 1`."""
+        def handle_pageBegin(self):
+            if self.page >= max_pages:
+                raise _PreviewFull
+            super().handle_pageBegin()
 
     # checagens mínimas
     required = ["EAN", "ESTOQUE", "CONTAGEM", "DIVERGÊNCIA"]
@@ -575,7 +3370,7 @@ def generate_pdf_in_memory(
     # página
     pagesize = portrait(A4) if orientation.upper().startswith("P") else landscape(A4)
     buffer = BytesIO()
-    pdf = SimpleDocTemplate(
+    pdf = (_PreviewDocTemplate if max_pages else SimpleDocTemplate)(
         buffer, pagesize=pagesize,
         rightMargin=20, leftMargin=20, topMargin=50, bottomMargin=50
     )
@@ -610,21 +3405,27 @@ def generate_pdf_in_memory(
         elements.append(Spacer(1, 6))
     elements.append(Spacer(1, 12))
 
+    # larguras (AUTO) — sempre pelo DF inteiro, para a prévia sair igual ao PDF final
+    col_width_values = _auto_col_widths(df, cols, pdf.width)
+
+    rows_df = df
+    if max_pages:
+        # cota superior de linhas: cada linha ocupa ao menos uma linha de texto + padding
+        rows_per_page = int(pdf.height // (font_size + 2 + 6)) + 1
+        rows_df = df.head(rows_per_page * max_pages)
+
     # dados da tabela
     data = [cols]
-    for _, row in df.iterrows():
+    for _, row in rows_df.iterrows():
         row_data = []
         for c in cols:
             value = str(row.get(c, "-"))
-            if unidecode.unidecode(c).upper() == "STATUS":
+            if _unidecode(c).upper() == "STATUS":
                 value = _clean_status_for_pdf(value)
             para = Paragraph(value, cell_style)
             row_data.append(para)
         data.append(row_data)
 
-    # larguras (AUTO)
-    col_width_values = _auto_col_widths(df, cols, pdf.width)
-
     table = Table(data, colWidths=col_width_values, repeatRows=1)
     style = TableStyle([
         ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
@@ -645,11 +3446,14 @@ def generate_pdf_in_memory(
     elements.append(table)
 
     # numeração de página
-    pdf.build(
-        elements,
-        onFirstPage=lambda canv, doc: add_page_number(canv, doc, orientation),
-        onLaterPages=lambda canv, doc: add_page_number(canv, doc, orientation),
-    )
+    try:
+        pdf.build(
+            elements,
+            onFirstPage=lambda canv, doc: add_page_number(canv, doc, orientation),
+            onLaterPages=lambda canv, doc: add_page_number(canv, doc, orientation),
+        )
+    except _PreviewFull:
+        pdf.canv.save()  # grava as páginas já fechadas
     buffer.seek(0)
     return buffer.getvalue()
 
@@ -666,6 +3470,9 @@ def dynamic_dashboard(
     total_divergencia_positiva: int,
     total_divergencia_negativa: int,
 ) -> str:
+    from pyecharts.charts import Pie, Bar, Gauge, Page
+    from pyecharts import options as opts
+
     accuracy_percentage = round(float(accuracy_percentage), 2)
 
     gauge = (
@@ -740,6 +3547,111 @@ def dynamic_dashboard(
     page.add(nested_pie)
     return page.render_embed()
 
+def dashboard_totals_key(
+    total_estoque,
+    total_contagem,
+    total_divergencia_absoluta,
+    total_pecas_a_serem_relidas,
+    accuracy_percentage,
+    total_divergencia_positiva,
+    total_divergencia_negativa,
+) -> tuple:
+    """
+    Monta a tupla de totais (tipos nativos) usada como chave do cache do dashboard.
+    A acurácia é arredondada como no gráfico, evitando recomputar por ruído de float.
+    """
+    return (
+        int(total_estoque),
+        int(total_contagem),
+        int(total_divergencia_absoluta),
+        int(total_pecas_a_serem_relidas),
+        round(float(accuracy_percentage), 2),
+        int(total_divergencia_positiva),
+        int(total_divergencia_negativa),
+    )
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def dynamic_dashboard_cached(totals: tuple) -> str:
+    """
+    HTML do dashboard memoizado pela tupla de totais (ver `dashboard_totals_key`).
+    Só é chamado quando a seção do dashboard está visível.
+    """
+    return dynamic_dashboard(*totals)
+
+# -----------------------------------------------------------------------------
+# Onde está a divergência: top-N por REFERENCIA / COR / TAMANHO
+# -----------------------------------------------------------------------------
+DIVERGENCE_TOP_N = int(os.environ.get("RFDASH_TOP_N", "10"))
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def divergence_rankings(_df: pd.DataFrame, columns: tuple, top_n: int, data_key) -> tuple:
+    """
+    Top-N dos grupos de cada coluna (ex.: REFERENCIA, COR, TAMANHO) por divergência
+    absoluta e por peças a serem relidas: um groupby por coluna + nlargest,
+    memoizado por `data_key` (`rows_signature` das linhas de `_df`). Só os N
+    pontos de cada ranking saem daqui, em tuplas (servem de chave do cache do gráfico):
+      ((coluna, "abs" | "relidas", ((grupo, sobra, falta, valor), ...)), ...)
+    """
+    df = _df
+    div = df["DIVERGÊNCIA"].to_numpy()
+    work = pd.DataFrame({
+        "SOBRA": np.where(div > 0, div, 0),
+        "FALTA": np.where(div < 0, -div, 0),
+        "ABS": np.abs(div),
+        "RELIDAS": df["PEÇAS A SEREM RELIDAS"].to_numpy(),
+    })
+    out = []
+    for col in columns:
+        if col not in df.columns:
+            continue
+        keys = df[col].fillna(ROLLUP_EMPTY_LABEL).astype(str).to_numpy()
+        grouped = work.groupby(keys, sort=False).sum()
+        for metric, by in (("abs", "ABS"), ("relidas", "RELIDAS")):
+            top = grouped.nlargest(top_n, by)
+            top = top[top[by] > 0]
+            out.append((col, metric, tuple(zip(
+                top.index.astype(str),
+                top["SOBRA"].astype(int).tolist(),
+                top["FALTA"].astype(int).tolist(),
+                top[by].astype(int).tolist(),
+            ))))
+    return tuple(out)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def divergence_breakdown_html(rankings: tuple) -> str:
+    """
+    Barras horizontais (pyecharts) dos rankings de `divergence_rankings`:
+    divergência absoluta empilhada em sobra/falta e peças a serem relidas.
+    """
+    from pyecharts.charts import Bar, Page
+    from pyecharts import options as opts
+
+    page = Page(layout=Page.SimplePageLayout)
+    for col, metric, points in rankings:
+        if not points:
+            continue
+        points = points[::-1]  # eixo invertido: o maior fica no topo
+        bar = Bar(init_opts=opts.InitOpts(width="900px", height=f"{120 + 30 * len(points)}px"))
+        bar.add_xaxis([p[0] for p in points])
+        if metric == "abs":
+            title = f"Top {len(points)} {col} por divergência absoluta"
+            bar.add_yaxis("Sobra", [p[1] for p in points], stack="div", color="#f2b134")
+            bar.add_yaxis("Falta", [p[2] for p in points], stack="div", color="#d1495b")
+        else:
+            title = f"Top {len(points)} {col} por peças a serem relidas"
+            bar.add_yaxis("Peças a serem relidas", [p[3] for p in points], color="#4f9dde")
+        bar.reversal_axis()
+        bar.set_series_opts(label_opts=opts.LabelOpts(is_show=False))
+        bar.set_global_opts(
+            title_opts=opts.TitleOpts(title=title, pos_left="center", title_textstyle_opts=opts.TextStyleOpts(color="#fff")),
+            tooltip_opts=opts.TooltipOpts(trigger="axis", axis_pointer_type="shadow"),
+            legend_opts=opts.LegendOpts(pos_top="8%", textstyle_opts=opts.TextStyleOpts(color="#fff")),
+            xaxis_opts=opts.AxisOpts(axislabel_opts=opts.LabelOpts(color="#fff")),
+            yaxis_opts=opts.AxisOpts(axislabel_opts=opts.LabelOpts(color="#fff")),
+        )
+        page.add(bar)
+    return page.render_embed()
+
 # -----------------------------------------------------------------------------
 # Utilidades diversas
 # -----------------------------------------------------------------------------
@@ -747,6 +3659,8 @@ def generate_timestamp() -> str:
     return datetime.now().strftime("%Y%m%d_%H%M")
 
 def generate_pie_chart(accuracy_percentage: float):
+    import plotly.express as px
+
     labels = ["Acurácia", "Inacurácia"]
     values = [accuracy_percentage, 100 - accuracy_percentage]
     return px.pie(values=values, names=labels, title="Acurácia do Inventário")
@@ -785,6 +3699,12 @@ ESTOQUE_CANDIDATES = {
     "ESTOQUE", "QTD", "QTDE", "QUANTIDADE", "QTD_ESTOQUE", "QTD_ATUAL",
     "SALDO", "DISPONIVEL", "DISPONÍVEL", "QTY", "ON_HAND",
 }
+# hierarquia de produto (rollups): REFERENCIA > COR > TAMANHO
+HIERARCHY_CANDIDATES = [
+    ("REFERENCIA", {"REFERENCIA", "REF", "COD_REFERENCIA", "REFERENCIA_PRODUTO", "MODELO"}),
+    ("COR", {"COR", "COD_COR", "DESC_COR", "DESCRICAO_COR", "COLOR"}),
+    ("TAMANHO", {"TAMANHO", "TAM", "GRADE", "SIZE"}),
+]
 
 def suggest_expected_mapping(df: pd.DataFrame):
     """
@@ -799,6 +3719,20 @@ def suggest_expected_mapping(df: pd.DataFrame):
             est = to_orig[c_norm]
     return ean, est
 
+def suggest_hierarchy_columns(df: pd.DataFrame) -> list:
+    """
+    Sugere as colunas da hierarquia de produto (REFERENCIA > COR > TAMANHO),
+    na ordem da hierarquia, a partir de sinônimos. Níveis ausentes são omitidos.
+    """
+    to_norm, to_orig = _original_to_normalized_map(df.columns)
+    out = []
+    for _, candidates in HIERARCHY_CANDIDATES:
+        for c_norm in to_norm.values():
+            if c_norm in candidates:
+                out.append(to_orig[c_norm])
+                break
+    return out
+
 def pick_expected_columns_ui(df: pd.DataFrame):
     """
     UI (Streamlit) para o usuário escolher quais colunas são EAN e ESTOQUE.
@@ -820,11 +3754,20 @@ def pick_expected_columns_ui(df: pd.DataFrame):
             index=(list(df.columns).index(sug_est) if sug_est in df.columns else 0),
             key="map_col_estoque",
         )
-    return {"EAN": ean_col, "ESTOQUE": est_col}
+    options = [c for c in df.columns if c not in (ean_col, est_col)]
+    hierarchy = st.multiselect(
+        "Hierarquia de produto para agrupamento (na ordem)",
+        options,
+        default=[c for c in suggest_hierarchy_columns(df) if c in options],
+        key="map_col_hierarquia",
+        help="Usada na visualização agrupada (totais calculados no servidor).",
+    )
+    return {"EAN": ean_col, "ESTOQUE": est_col, "HIERARQUIA": hierarchy}
 
 def standardize_expected_df(df: pd.DataFrame, mapping: dict) -> pd.DataFrame:
     """
-    Renomeia as colunas selecionadas para 'EAN' e 'ESTOQUE' e normaliza tipos.
+    Renomeia as colunas selecionadas para 'EAN' e 'ESTOQUE' e normaliza tipos
+    (EAN canônico via `canonicalize_eans`, quantidades via `parse_quantities`).
     """
     if not mapping or "EAN" not in mapping or "ESTOQUE" not in mapping:
         raise ValueError("Mapeamento inválido. Selecione as colunas de EAN e ESTOQUE.")
@@ -835,12 +3778,13 @@ def standardize_expected_df(df: pd.DataFrame, mapping: dict) -> pd.DataFrame:
         raise ValueError("As colunas selecionadas não existem no arquivo.")
 
     out = df.rename(columns={src_ean: "EAN", src_est: "ESTOQUE"}).copy()
-    out["EAN"] = out["EAN"].astype(str).str.strip()
-    out["ESTOQUE"] = pd.to_numeric(out["ESTOQUE"], errors="coerce").fillna(0).astype(int)
+    set_canonical_eans(out, "EAN (estoque)", first_line=2)
+    out["ESTOQUE"], report = parse_quantities(out["ESTOQUE"], default=0, column="ESTOQUE", first_line=2)
+    out.attrs[QUANTITY_REPORT_ATTR] = [report]
     return out
 
 # --- cache para bytes do PDF (1 clique) ---
-@st.cache_data(show_spinner=False)
+@st.cache_data(show_spinner=False, max_entries=PDF_CACHE_ENTRIES, ttl=PDF_CACHE_TTL)
 def build_pdf_bytes_cached(
     df: pd.DataFrame,
     include_columns_tuple: tuple,
@@ -890,6 +3834,44 @@ def render_single_click_pdf_button(
 import base64
 import streamlit.components.v1 as components
 
+@st.cache_data(show_spinner=False, max_entries=PDF_CACHE_ENTRIES, ttl=PDF_CACHE_TTL)
+def build_pdf_preview_cached(
+    df: pd.DataFrame,
+    include_columns_tuple: tuple,
+    font_size: int,
+    orientation: str,
+    max_pages: int = PDF_PREVIEW_PAGES,
+) -> bytes:
+    return generate_pdf_in_memory(
+        df, font_size=font_size, orientation=orientation,
+        include_columns=list(include_columns_tuple) if include_columns_tuple else None,
+        max_pages=max_pages,
+    )
+
+def render_pdf_preview(pdf_bytes: bytes, height: int = 720):
+    """
+    Mostra o PDF embutido na página (Blob + URL.createObjectURL, como no download
+    em um clique), para conferir layout, fonte e colunas sem baixar o arquivo.
+    """
+    b64 = base64.b64encode(pdf_bytes).decode()
+    components.html(
+        f"""
+<iframe id="pdf_preview" style="width:100%;height:{height - 10}px;border:none;"></iframe>
+<script>
+(function() {{
+  const byteChars = atob("{b64}");
+  const byteArray = new Uint8Array(byteChars.length);
+  for (let i = 0; i < byteChars.length; i++) {{
+    byteArray[i] = byteChars.charCodeAt(i);
+  }}
+  const blob = new Blob([byteArray], {{ type: "application/pdf" }});
+  document.getElementById("pdf_preview").src = URL.createObjectURL(blob);
+}})();
+</script>
+        """,
+        height=height,
+    )
+
 def one_click_generate_and_download_pdf(
     df: pd.DataFrame,
     include_columns: list | None,